@@ -0,0 +1,10 @@
+# Benchmarks module
+import os
+
+
+def setup_django():
+    """Configure Django for benchmarks that touch the database"""
+    import django
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'market_tick_system.settings')
+    django.setup()
@@ -0,0 +1,104 @@
+"""
+Producer hot-path microbenchmark: frame decode + tick payload construction.
+
+Compares the original dict/datetime/isoformat path with the compact
+``Tick``/epoch-ms path, single-threaded, and reports frames/sec per core.
+
+Usage:
+    python -m benchmarks.decode_bench [--frames 200000] [--symbols 50]
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+
+from tick_producer.codec import get_decoder, orjson, parse_ticker_message
+
+
+def make_frames(count, symbols):
+    frames = []
+    for i in range(count):
+        symbol = f"SYM{i % symbols}USDT"
+        frames.append(json.dumps({
+            'stream': f"{symbol.lower()}@ticker",
+            'data': {
+                'e': '24hrTicker', 'E': 1700000000000 + i, 's': symbol,
+                'p': '12.34000000', 'P': '0.025', 'w': '49876.12345678',
+                'x': '49000.00000000', 'c': '50000.12345678', 'Q': '0.00100000',
+                'b': '50000.12000000', 'B': '1.23400000', 'a': '50000.13000000',
+                'A': '0.56700000', 'o': '49987.78345678', 'h': '50500.00000000',
+                'l': '49500.00000000', 'v': '12345.67800000', 'q': '617283900.12345678',
+                'O': 1699913600000, 'C': 1700000000000, 'F': 100, 'L': 200, 'n': 101,
+            },
+        }))
+    return frames
+
+
+def legacy_path(frames, symbol_map):
+    """The original _on_message + on_tick code path"""
+    out = []
+    for message in frames:
+        data = json.loads(message)
+        if 'stream' in data and 'data' in data:
+            data = data['data']
+        if 'e' in data and data['e'] == '24hrTicker':
+            tick_data = {
+                'symbol': data['s'],
+                'price': data['c'],
+                'volume': data['v'],
+                'timestamp': datetime.fromtimestamp(data['E'] / 1000, tz=timezone.utc)
+            }
+            script_id = symbol_map.get(tick_data['symbol'])
+            out.append({
+                'script_id': script_id,
+                'tick_value': str(tick_data['price']),
+                'volume': str(tick_data['volume']) if tick_data.get('volume') else None,
+                'received_at_producer': tick_data['timestamp'].isoformat()
+            })
+    return out
+
+
+def compact_path(frames, symbol_map, decoder):
+    """The current parse_ticker_message + compact row path"""
+    out = []
+    append = out.append
+    for message in frames:
+        tick = parse_ticker_message(message, decoder)
+        if tick is not None:
+            append((symbol_map.get(tick.symbol), tick.price, tick.volume or None, tick.event_time))
+    return out
+
+
+def measure(fn, frames, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.process_time()
+        fn(frames)
+        best = min(best, time.process_time() - started)
+    return len(frames) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=200000)
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.symbols)
+    symbol_map = {f"SYM{i}USDT": i + 1 for i in range(args.symbols)}
+
+    results = {'legacy (json + dict + isoformat)': measure(lambda f: legacy_path(f, symbol_map), frames, args.repeat)}
+    results['compact (json)'] = measure(
+        lambda f: compact_path(f, symbol_map, get_decoder('json')), frames, args.repeat)
+    if orjson is not None:
+        results['compact (orjson)'] = measure(
+            lambda f: compact_path(f, symbol_map, get_decoder('orjson')), frames, args.repeat)
+
+    baseline = next(iter(results.values()))
+    for name, rate in results.items():
+        print(f"{name:<36} {rate:>12,.0f} frames/s/core  ({rate / baseline:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
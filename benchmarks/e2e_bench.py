@@ -0,0 +1,248 @@
+"""
+End-to-end benchmark: exchange simulator -> run_tick_producer -> consumer -> database.
+
+Starts ``benchmarks.exchange_sim``, a ``run_tick_producer`` pointed at it,
+and consumers for the chosen transport (a Celery worker running
+``consume_tick``, or ``run_tick_consumer`` processes for Redis Streams),
+all as child processes against the configured database and Redis. After
+``--warmup`` seconds it measures for ``--duration`` seconds:
+
+- sustained ticks/sec committed to the ``ticks`` table
+- p50/p90/p99/max latency from the exchange event time (``E``, stamped by
+  the simulator on the same clock) to the row's ``created_at``
+- CPU per stage (simulator, producer, consumer), from /proc on Linux
+
+Results are printed as one JSON document (and written to ``--output``),
+so runs can be compared between releases. Other Celery workers on the
+same broker also take ``consume_tick`` tasks, so stop them first or pass
+``--consumers 0`` to use them (no consumer CPU is reported then). The
+temporary broker and its ticks are deleted afterwards; run it against a
+scratch database.
+
+Usage:
+    python -m benchmarks.e2e_bench [--rate 5000] [--symbols 100] [--duration 30]
+        [--transport celery|redis_streams] [--engine threaded|asyncio] [--output result.json]
+"""
+import argparse
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks import setup_django
+from benchmarks.exchange_sim import sim_symbols
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def tree_cpu_seconds(pid):
+    """
+    CPU seconds (user + system, including reaped children) of a process and
+    its live descendants, read from /proc. None where /proc is unavailable.
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    stats = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # Fields after the command name: state, ppid, ..., utime, stime, cutime, cstime
+        stats[int(entry)] = (int(fields[1]), sum(int(value) for value in fields[11:15]))
+
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        if current in stats:
+            total += stats[current][1]
+        pending.extend(child for child, (ppid, _) in stats.items() if ppid == current)
+    return total / os.sysconf('SC_CLK_TCK')
+
+
+def stage_cpu_seconds(processes):
+    """Summed tree_cpu_seconds of a stage's processes"""
+    seconds = [tree_cpu_seconds(process.pid) for process in processes]
+    return None if None in seconds else sum(seconds)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))]
+
+
+def stop_process(process, sig=signal.SIGINT, timeout=30):
+    if process.poll() is None:
+        process.send_signal(sig)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def wait_for_drain(queryset, timeout):
+    """Wait until the row count stops growing; returns the final count"""
+    deadline = time.monotonic() + timeout
+    count = queryset.count()
+    while time.monotonic() < deadline:
+        time.sleep(1)
+        current = queryset.count()
+        if current == count:
+            break
+        count = current
+    return count
+
+
+def consumer_commands(transport, broker_id, consumers):
+    manage = os.path.join(ROOT, 'manage.py')
+    if transport == 'celery':
+        return [[
+            sys.executable, '-m', 'celery', '-A', 'market_tick_system', 'worker', '--loglevel=warning',
+            f'--concurrency={consumers}', '--without-gossip', '--without-mingle', '-n', 'e2e-bench@%h',
+        ]]
+    return [
+        [sys.executable, manage, 'run_tick_consumer', f'--broker_id={broker_id}']
+        for _ in range(consumers)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=5000, help='Simulated frames/sec over all symbols')
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=10, help='Seconds before measuring')
+    parser.add_argument('--port', type=int, default=9876)
+    parser.add_argument('--engine', choices=('threaded', 'asyncio'), default='threaded')
+    parser.add_argument('--transport', choices=('celery', 'redis_streams'), default='celery')
+    parser.add_argument('--consumers', type=int, default=2,
+                        help='Celery worker concurrency or run_tick_consumer processes (0: use running ones)')
+    parser.add_argument('--batch_size', type=int, help='Producer api_config batch_size')
+    parser.add_argument('--drain_timeout', type=float, default=60)
+    parser.add_argument('--output', help='Also write the JSON result to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from tick_consumer.models import Broker, Script, Ticks
+
+    if settings.TICK_STORAGE != 'ticks':
+        sys.exit("e2e_bench measures latency from ticks.created_at; run it with TICK_STORAGE=ticks")
+
+    api_config = {'engine': args.engine, 'transport': args.transport}
+    if args.batch_size:
+        api_config['batch_size'] = args.batch_size
+    broker = Broker.objects.create(type='BINANCE', name='e2e-benchmark', api_config=api_config)
+    Script.objects.bulk_create(
+        Script(broker=broker, name=symbol, trading_symbol=symbol) for symbol in sim_symbols(args.symbols)
+    )
+    ticks = Ticks.objects.filter(script__broker=broker)
+
+    env = dict(
+        os.environ,
+        BINANCE_WS_URL=f'ws://127.0.0.1:{args.port}/ws',
+        TICK_SCRIPT_WATCH_INTERVAL='0',
+        TICK_CAPTURE_DIR='',
+    )
+    stages = {}
+    try:
+        exchange_process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.exchange_sim', f'--port={args.port}',
+             f'--rate={args.rate}', f'--symbols={args.symbols}'],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True
+        )
+        stages['exchange'] = [exchange_process]
+        if args.consumers:
+            stages['consumer'] = [
+                subprocess.Popen(command, cwd=ROOT, env=env)
+                for command in consumer_commands(args.transport, broker.id, args.consumers)
+            ]
+        producer_process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'manage.py'), 'run_tick_producer', f'--broker_id={broker.id}'],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL
+        )
+        stages['producer'] = [producer_process]
+
+        time.sleep(args.warmup)
+        started_at = datetime.now(timezone.utc)
+        cpu_start = {name: stage_cpu_seconds(processes) for name, processes in stages.items()}
+        time.sleep(args.duration)
+        ended_at = datetime.now(timezone.utc)
+        cpu_end = {name: stage_cpu_seconds(processes) for name, processes in stages.items()}
+        crashed = [
+            name for name, processes in stages.items() if any(process.poll() is not None for process in processes)
+        ]
+
+        # Producer first, so it flushes; then the exchange reports what it sent
+        stop_process(producer_process)
+        stop_process(exchange_process, signal.SIGTERM)
+        reported = exchange_process.stdout.read().splitlines()
+        exchange = json.loads(reported[-1]) if reported else {}
+        committed = wait_for_drain(ticks, args.drain_timeout)
+
+        window = ticks.filter(created_at__gte=started_at, created_at__lt=ended_at)
+        latencies = sorted(
+            (created_at - received_at).total_seconds() * 1000
+            for received_at, created_at in window.values_list('received_at_producer', 'created_at').iterator()
+        )
+    finally:
+        for processes in stages.values():
+            for process in processes:
+                stop_process(process, signal.SIGTERM)
+        broker.delete()
+
+    elapsed = (ended_at - started_at).total_seconds()
+    cpu = {}
+    for name in stages:
+        if cpu_start[name] is None or cpu_end[name] is None:
+            cpu[name] = None
+            continue
+        seconds = cpu_end[name] - cpu_start[name]
+        cpu[name] = {
+            'cpu_seconds': round(seconds, 3),
+            'cores': round(seconds / elapsed, 3),
+            'ms_per_1k_ticks': round(seconds * 1e6 / len(latencies), 3) if latencies else None,
+        }
+
+    result = {
+        'benchmark': 'e2e',
+        'timestamp': started_at.isoformat(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'config': {
+            **vars(args), 'database': settings.DATABASES['default']['ENGINE'],
+            'ingest_backend': settings.TICK_INGEST_BACKEND,
+        },
+        'frames_sent': exchange.get('frames_sent'),
+        'ticks_committed': committed,
+        'ticks_per_sec': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            name: round(value, 3) if value is not None else None
+            for name, value in (
+                ('p50', percentile(latencies, 0.50)),
+                ('p90', percentile(latencies, 0.90)),
+                ('p99', percentile(latencies, 0.99)),
+                ('max', latencies[-1] if latencies else None),
+            )
+        },
+        'cpu': cpu,
+        'crashed_stages': crashed,
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
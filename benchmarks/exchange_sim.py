@@ -0,0 +1,126 @@
+"""
+Local Binance exchange simulator: a WebSocket server pushing ``24hrTicker`` frames.
+
+Serves the same URLs the producer builds (``/ws/<stream>`` and
+``/stream?streams=a@ticker/b@ticker``) and honours live
+``SUBSCRIBE``/``UNSUBSCRIBE`` requests. Frames are combined-stream
+envelopes whose ``E`` is the send time, so the consumer side can measure
+exchange-to-commit latency on the same clock. ``--rate`` frames per second
+are spread evenly over ``--symbols`` symbols and paced every millisecond.
+On SIGTERM/SIGINT it prints one JSON line with the frames it sent.
+
+Usage:
+    python -m benchmarks.exchange_sim [--port 9876] [--rate 5000] [--symbols 100]
+"""
+import argparse
+import asyncio
+import json
+import random
+import signal
+import sys
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import websockets
+
+TICKER_SUFFIX = '@ticker'
+PACE_INTERVAL = 0.001
+
+
+def sim_symbols(count):
+    """The symbols a simulator of ``count`` symbols quotes: SIM0USDT, SIM1USDT, ..."""
+    return [f"SIM{i}USDT" for i in range(count)]
+
+
+def ticker_frame(symbol, event_time, price):
+    return (
+        '{"stream":"%s@ticker","data":{"e":"24hrTicker","E":%d,"s":"%s","p":"12.34000000",'
+        '"P":"0.025","w":"49876.12345678","x":"49000.00000000","c":"%.8f","Q":"0.00100000",'
+        '"b":"49999.99000000","B":"1.23400000","a":"50000.01000000","A":"0.56700000",'
+        '"o":"49987.78345678","h":"50500.00000000","l":"49500.00000000","v":"12345.67800000",'
+        '"q":"617283900.12345678","O":1699913600000,"C":1700000000000,"F":1,"L":2,"n":2}}'
+    ) % (symbol.lower(), event_time, symbol, price)
+
+
+def requested_streams(path):
+    """Ticker streams named in a ``/ws/<stream>`` or ``/stream?streams=...`` path"""
+    url = urlsplit(path)
+    if url.path.startswith('/stream'):
+        streams = parse_qs(url.query).get('streams', [''])[0].split('/')
+    else:
+        streams = [url.path.rsplit('/', 1)[-1]]
+    return [stream for stream in streams if stream.endswith(TICKER_SUFFIX)]
+
+
+class ExchangeSimulator:
+    """Pushes ticker frames for every subscribed symbol at a fixed total rate"""
+
+    def __init__(self, rate, symbol_count):
+        self.per_symbol_rate = rate / symbol_count
+        self.frames_sent = 0
+        self.connections = 0
+        self.rng = random.Random(1)
+
+    async def handler(self, websocket, path=None):
+        self.connections += 1
+        symbols = [stream[:-len(TICKER_SUFFIX)].upper() for stream in requested_streams(websocket.path)]
+        reader = asyncio.ensure_future(self._read_control(websocket, symbols))
+        try:
+            await self._push(websocket, symbols)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            reader.cancel()
+
+    async def _read_control(self, websocket, symbols):
+        async for message in websocket:
+            request = json.loads(message)
+            params = [stream[:-len(TICKER_SUFFIX)].upper() for stream in request.get('params', [])]
+            if request.get('method') == 'SUBSCRIBE':
+                symbols.extend(s for s in params if s not in symbols)
+            elif request.get('method') == 'UNSUBSCRIBE':
+                symbols[:] = [s for s in symbols if s not in params]
+            await websocket.send(json.dumps({'result': None, 'id': request.get('id')}))
+
+    async def _push(self, websocket, symbols):
+        started = time.monotonic()
+        sent = 0
+        position = 0
+        price = 50000.0
+        while True:
+            due = int((time.monotonic() - started) * self.per_symbol_rate * len(symbols)) - sent
+            if due > 0 and symbols:
+                event_time = int(time.time() * 1000)
+                for _ in range(due):
+                    position = (position + 1) % len(symbols)
+                    price += self.rng.uniform(-1, 1)
+                    await websocket.send(ticker_frame(symbols[position], event_time, price))
+                sent += due
+                self.frames_sent += due
+            await asyncio.sleep(PACE_INTERVAL)
+
+
+async def serve(host, port, rate, symbol_count):
+    simulator = ExchangeSimulator(rate, symbol_count)
+    stop = asyncio.get_running_loop().create_future()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set_result, None)
+
+    async with websockets.serve(simulator.handler, host, port, max_queue=None, compression=None):
+        print(f"exchange simulator on ws://{host}:{port}/ws", file=sys.stderr, flush=True)
+        await stop
+    print(json.dumps({'frames_sent': simulator.frames_sent, 'connections': simulator.connections}), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9876)
+    parser.add_argument('--rate', type=float, default=5000, help='Total frames/sec over all symbols')
+    parser.add_argument('--symbols', type=int, default=100, help='Symbol count the rate is spread over')
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.rate, args.symbols))
+
+
+if __name__ == '__main__':
+    main()
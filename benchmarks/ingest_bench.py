@@ -0,0 +1,60 @@
+"""
+Ingestion benchmark: rows/sec for each tick ingest backend on the same data.
+
+Writes to the configured database under a temporary broker/script, which
+is deleted afterwards. Run it against a scratch database.
+
+Usage:
+    python -m benchmarks.ingest_bench [--rows 100000] [--batch 1000] [--backends orm,sql,load_data]
+"""
+import argparse
+import time
+
+from benchmarks import setup_django
+
+
+def make_rows(script_id, count):
+    start_ms = 1700000000000
+    return [
+        [script_id, f"{50000 + (i % 1000) / 100:.8f}", f"{12345 + i / 1000:.8f}", start_ms + i]
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=1000, help='Ticks per consume_tick batch')
+    parser.add_argument('--backends', default='orm,sql,load_data')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from tick_consumer.ingest import write_ticks
+    from tick_consumer.models import Broker, Script, Ticks
+
+    broker = Broker.objects.create(type='BINANCE', name='ingest-benchmark')
+    script = Script.objects.create(broker=broker, name='Benchmark', trading_symbol='BENCHUSDT')
+    rows = make_rows(script.id, args.rows)
+
+    print(f"database vendor: {connection.vendor}, rows: {args.rows}, batch: {args.batch}")
+    try:
+        baseline = None
+        for backend in args.backends.split(','):
+            started = time.perf_counter()
+            for start in range(0, len(rows), args.batch):
+                write_ticks(rows[start:start + args.batch], backend=backend)
+            elapsed = time.perf_counter() - started
+
+            written = Ticks.objects.filter(script=script).count()
+            Ticks.objects.filter(script=script).delete()
+
+            rate = written / elapsed
+            baseline = baseline or rate
+            print(f"{backend:<10} {rate:>12,.0f} rows/s  ({rate / baseline:.2f}x)  [{written} rows]")
+    finally:
+        broker.delete()
+
+
+if __name__ == '__main__':
+    main()
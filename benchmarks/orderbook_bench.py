@@ -0,0 +1,95 @@
+"""
+Order book engine microbenchmark: depth frame decode + diff application.
+
+Replays synthetic ``depthUpdate`` frames against a live OrderBookEngine
+(about 1000 levels per side, most changes near the top of the book),
+single-threaded, and reports diffs/sec and levels/sec per core.
+
+Usage:
+    python -m benchmarks.orderbook_bench [--frames 100000] [--levels 20]
+"""
+import argparse
+import json
+import random
+import time
+
+from tick_producer.codec import get_decoder, orjson, parse_stream_message
+from tick_producer.orderbook import BookConfig, OrderBookEngine
+
+SYMBOL = 'BTCUSDT'
+MID = 50000.0
+TICK = 0.01
+
+
+def make_snapshot(depth):
+    bids = [[f"{MID - (i + 1) * TICK:.2f}", '1.00000000'] for i in range(depth)]
+    asks = [[f"{MID + (i + 1) * TICK:.2f}", '1.00000000'] for i in range(depth)]
+    return 1, bids, asks
+
+
+def make_frames(count, levels, depth, seed=1):
+    rng = random.Random(seed)
+    frames = []
+    for i in range(count):
+        sides = ([], [])
+        for _ in range(levels):
+            # Changes cluster near the touch, as in real books
+            distance = min(int(rng.expovariate(1 / 20)) + 1, depth)
+            side = rng.random() < 0.5
+            price = MID + distance * TICK if side else MID - distance * TICK
+            quantity = '0.00000000' if rng.random() < 0.2 else f"{rng.uniform(0.001, 5):.8f}"
+            sides[side].append([f"{price:.2f}", quantity])
+        frames.append(json.dumps({
+            'stream': f"{SYMBOL.lower()}@depth@100ms",
+            'data': {
+                'e': 'depthUpdate', 'E': 1700000000000 + i * 100, 's': SYMBOL,
+                'U': i + 2, 'u': i + 2, 'b': sides[0], 'a': sides[1],
+            },
+        }))
+    return frames
+
+
+def run(frames, depth, decoder):
+    snapshots = []
+    engine = OrderBookEngine(
+        {SYMBOL: BookConfig(levels=20, interval_ms=1000)}, {SYMBOL: 1}, snapshots.append,
+        fetch_snapshot=lambda symbol, limit: make_snapshot(depth)
+    )
+    # Load the book synchronously instead of through the sync thread
+    engine.books[SYMBOL].load_snapshot(*make_snapshot(depth))
+    engine._buffers[SYMBOL] = None
+
+    started = time.process_time()
+    on_depth = engine.on_depth
+    for message in frames:
+        on_depth(parse_stream_message(message, decoder))
+    elapsed = time.process_time() - started
+    return elapsed, engine, snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=100000)
+    parser.add_argument('--levels', type=int, default=20, help='Changed levels per diff')
+    parser.add_argument('--depth', type=int, default=1000, help='Snapshot levels per side')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames, args.levels, args.depth)
+    decoders = {'json': get_decoder('json')}
+    if orjson is not None:
+        decoders['orjson'] = get_decoder('orjson')
+
+    for name, decoder in decoders.items():
+        best = min(run(frames, args.depth, decoder)[0] for _ in range(args.repeat))
+        rate = args.frames / best
+        print(f"{name:<8} {rate:>10,.0f} diffs/s/core  {rate * args.levels:>12,.0f} levels/s/core")
+
+    _, engine, snapshots = run(frames, args.depth, decoders['json'])
+    book = engine.books[SYMBOL]
+    print(f"book: {len(book.bids)} bids / {len(book.asks)} asks, {len(snapshots)} snapshots, "
+          f"{engine.resyncs} resyncs")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'market_tick_system.settings')
 
@@ -20,3 +21,10 @@ app.conf.update(
     task_time_limit=30 * 60,  # 30 minutes
     task_soft_time_limit=25 * 60,  # 25 minutes
 )
+
+
+@worker_process_init.connect
+def enable_profiling(**kwargs):
+    """Let each pool process be profiled at runtime (profile_ticks or SIGUSR2 to its pid)"""
+    from market_tick_system import profiling
+    profiling.enable('worker')
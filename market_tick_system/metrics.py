@@ -0,0 +1,348 @@
+import json
+import logging
+import os
+import socket
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger('tick_consumer')
+
+METRICS_KEY_PREFIX = 'metrics:process:'
+
+
+def log_linear_buckets(lowest: float, highest: float, sub_buckets: int = 4) -> List[float]:
+    """
+    HDR-style bucket upper bounds: every power of two from ``lowest`` to
+    ``highest`` split into ``sub_buckets`` equal steps, so the relative
+    error of a recorded value stays below ``1 / sub_buckets`` at any scale.
+    """
+    bounds = []
+    base = lowest
+    while base < highest:
+        bounds.extend(base * (1 + step / sub_buckets) for step in range(sub_buckets))
+        base *= 2
+    bounds.append(highest)
+    return bounds
+
+
+# Seconds, about 61us to 128s
+LATENCY_BUCKETS = log_linear_buckets(2 ** -14, 2 ** 7)
+# Rows per batch, 1 to 64k
+SIZE_BUCKETS = [float(2 ** exponent) for exponent in range(17)]
+
+
+class Counter:
+    """Monotonic count, or the value of ``function`` when given (e.g. ``TickQueue.dropped``)"""
+    kind = 'counter'
+
+    def __init__(self, function: Optional[Callable[[], float]] = None):
+        self.function = function
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> Dict:
+        return {'value': self.function() if self.function else self.value}
+
+
+class Gauge(Counter):
+    """Current value, set directly or read from ``function`` at snapshot time (e.g. a queue depth)"""
+    kind = 'gauge'
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Histogram:
+    """
+    Counts of observations per bucket, plus their sum.
+
+    ``bounds`` are the bucket upper bounds; values above the last bound
+    land in an overflow bucket (``+Inf``). Recording is a binary search
+    and an increment.
+    """
+    kind = 'histogram'
+
+    def __init__(self, bounds: List[float] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def observe_many(self, values: Iterable[float]):
+        """Record several values under one lock acquisition"""
+        bounds, counts = self.bounds, self.counts
+        with self._lock:
+            for value in values:
+                counts[bisect_left(bounds, value)] += 1
+                self.sum += value
+                self.count += 1
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``fraction`` quantile (None when empty)"""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        rank = max(1, fraction * count)
+        seen = 0
+        for index, bucket in enumerate(counts):
+            seen += bucket
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+class Registry:
+    """
+    The metrics of one process, keyed by name and labels.
+
+    Metric accessors get-or-create, so instrumented code can look its
+    metrics up once and keep the object. Passing ``function`` again
+    rebinds a function-backed counter or gauge.
+    """
+
+    def __init__(self):
+        self._families: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, function: Optional[Callable[[], float]] = None,
+                **labels) -> Counter:
+        counter = self._get(name, help_text, labels, Counter)
+        if function:
+            counter.function = function
+        return counter
+
+    def gauge(self, name: str, help_text: str, function: Optional[Callable[[], float]] = None,
+              **labels) -> Gauge:
+        gauge = self._get(name, help_text, labels, Gauge)
+        if function:
+            gauge.function = function
+        return gauge
+
+    def histogram(self, name: str, help_text: str, buckets: List[float] = LATENCY_BUCKETS,
+                  **labels) -> Histogram:
+        return self._get(name, help_text, labels, lambda: Histogram(buckets))
+
+    def _get(self, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, {'help': help_text, 'series': {}})
+            metric = family['series'].get(key)
+            if metric is None:
+                metric = family['series'][key] = factory()
+            return metric
+
+    def clear(self):
+        with self._lock:
+            self._families.clear()
+
+    def snapshot(self) -> Dict:
+        """JSON-serializable state of every metric"""
+        with self._lock:
+            families = {name: (family['help'], list(family['series'].items()))
+                        for name, family in self._families.items()}
+        result = {}
+        for name, (help_text, series) in families.items():
+            first = series[0][1]
+            family = result[name] = {'type': first.kind, 'help': help_text, 'series': []}
+            if first.kind == 'histogram':
+                family['buckets'] = first.bounds
+            for key, metric in series:
+                family['series'].append({'labels': dict(key), **metric.snapshot()})
+        return result
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return format(value, '.9g')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render_prometheus(snapshots: Iterable[Tuple[Dict[str, str], Dict]]) -> str:
+    """
+    Prometheus text exposition (format 0.0.4) of several processes' snapshots.
+
+    Args:
+        snapshots: (process labels, ``Registry.snapshot()``) pairs; the
+            process labels are added to each of that process's series
+    """
+    families: Dict[str, Dict] = {}
+    for process_labels, snapshot in snapshots:
+        for name, family in snapshot.items():
+            merged = families.setdefault(name, {**family, 'series': []})
+            merged['series'].extend(
+                dict(series, labels={**process_labels, **series['labels']}) for series in family['series']
+            )
+
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for series in family['series']:
+            labels = series['labels']
+            if family['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(series['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(family['buckets'] + [float('inf')], series['counts']):
+                cumulative += count
+                bucket_labels = {**labels, 'le': _format_value(bound)}
+                lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(series['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {series['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsPusher:
+    """
+    Publishes a registry's snapshot to Redis every ``interval`` seconds.
+
+    Producers and Celery workers run in their own processes, so the web
+    app's ``/metrics`` view cannot read their registries directly; each
+    process writes its snapshot under ``metrics:process:<role>:<host>:<pid>``
+    with a TTL of three intervals, and the view renders every key still
+    present. A process that exits drops out after its TTL.
+    """
+
+    def __init__(self, registry: 'Registry', role: str, interval: float = 5.0,
+                 client: Optional[redis.Redis] = None, **labels):
+        self.registry = registry
+        self.interval = interval
+        self.client = client
+        self.labels = {'role': role, 'instance': f"{socket.gethostname()}:{os.getpid()}", **labels}
+        self.key = f"{METRICS_KEY_PREFIX}{role}:{socket.gethostname()}:{os.getpid()}"
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def push(self):
+        if self.client is None:
+            from market_tick_system.redis_client import get_redis
+            self.client = get_redis()
+        payload = json.dumps({'labels': self.labels, 'metrics': self.registry.snapshot()})
+        self.client.set(self.key, payload, ex=max(1, int(self.interval * 3)))
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-pusher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        try:
+            self.push()
+        except redis.RedisError as e:
+            logger.warning(f"Could not push metrics: {e}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.push()
+            except redis.RedisError as e:
+                logger.warning(f"Could not push metrics: {e}")
+            except Exception as e:
+                logger.error(f"Error pushing metrics: {e}", exc_info=True)
+
+
+def collect_snapshots(client: redis.Redis) -> List[Tuple[Dict[str, str], Dict]]:
+    """(process labels, snapshot) of every process that pushed recently"""
+    keys = list(client.scan_iter(match=f"{METRICS_KEY_PREFIX}*", count=1000))
+    snapshots = []
+    for raw in client.mget(keys) if keys else []:
+        if raw is None:
+            continue
+        try:
+            data = json.loads(raw)
+            snapshots.append((data['labels'], data['metrics']))
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Skipping malformed metrics snapshot: {e}")
+    return snapshots
+
+
+# The current process's metrics
+registry = Registry()
+_pusher: Optional[MetricsPusher] = None
+_pusher_pid = None
+_pusher_lock = threading.Lock()
+
+
+def metrics_enabled() -> bool:
+    return getattr(settings, 'TICK_METRICS_ENABLED', False)
+
+
+def start_pusher(role: str, **labels) -> Optional[MetricsPusher]:
+    """
+    Start publishing this process's registry, once per process (a forked
+    child, e.g. a Celery pool process, starts its own). No-op unless
+    ``TICK_METRICS_ENABLED``.
+    """
+    global _pusher, _pusher_pid
+    if not metrics_enabled():
+        return None
+    with _pusher_lock:
+        if _pusher is None or _pusher_pid != os.getpid():
+            _pusher = MetricsPusher(
+                registry, role, interval=getattr(settings, 'TICK_METRICS_PUSH_INTERVAL', 5), **labels
+            )
+            _pusher_pid = os.getpid()
+            _pusher.start()
+        return _pusher
+
+
+def stop_pusher():
+    """Stop this process's pusher after a final push"""
+    global _pusher
+    with _pusher_lock:
+        if _pusher is not None:
+            _pusher.stop()
+            _pusher = None
+
+
+def tick_latency(stage: str) -> Histogram:
+    """Per-tick seconds from the exchange event time (``E``) to ``stage``"""
+    return registry.histogram(
+        'tick_latency_seconds', 'Seconds from the exchange event time to a pipeline stage, per tick', stage=stage
+    )
+
+
+def stage_duration(stage: str) -> Histogram:
+    """Per-batch seconds spent in ``stage``"""
+    return registry.histogram('tick_stage_duration_seconds', 'Seconds a tick batch spent in a stage', stage=stage)
+
+
+def batch_size(stage: str) -> Histogram:
+    return registry.histogram('tick_batch_size', 'Ticks per batch', buckets=SIZE_BUCKETS, stage=stage)
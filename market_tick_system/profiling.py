@@ -0,0 +1,388 @@
+import functools
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional
+
+import redis
+from django.conf import settings
+
+from market_tick_system.metrics import log_linear_buckets
+
+logger = logging.getLogger('tick_consumer')
+
+PROFILE_REQUEST_KEY = 'profiling:request'
+ROLES = ('producer', 'worker', 'stream_consumer')
+
+# Seconds, about 1us to 16s
+TIMING_BUCKETS = log_linear_buckets(2 ** -20, 2 ** 4)
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler: every ``interval`` seconds it reads the
+    stack of every other thread (``sys._current_frames``) and counts it as
+    a collapsed stack, ``thread;outer (file:line);...;inner (file:line)``.
+
+    Frames are labelled by function and its first line, so samples anywhere
+    in a function add up to one frame. Labels are cached per code object,
+    which keeps a sample to a few microseconds per thread.
+    """
+
+    def __init__(self, interval: float = 0.01, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Dict[str, int] = {}
+        self.samples = 0
+        self.sample_seconds = 0.0
+        self._labels = {}
+        self._thread_names = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            for prefix in sys.path:
+                if prefix and path.startswith(prefix + os.sep):
+                    path = path[len(prefix) + 1:]
+                    break
+            label = self._labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(';', ':')
+        return label
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {thread.ident: thread.name.replace(';', ':') for thread in threading.enumerate()}
+            name = self._thread_names.get(ident, f'thread-{ident}')
+        return name
+
+    def sample(self):
+        """Record the current stack of every thread but this one"""
+        started = time.perf_counter()
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(self._thread_name(ident))
+            stack = ';'.join(reversed(labels))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+        self.sample_seconds += time.perf_counter() - started
+
+    def run(self, duration: float, stop_event: Optional[threading.Event] = None):
+        """Sample until ``duration`` seconds have passed or ``stop_event`` is set"""
+        stop_event = stop_event or threading.Event()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            self.sample()
+            if stop_event.wait(self.interval):
+                break
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl, speedscope and inferno"""
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class FunctionTimer:
+    """
+    Call count and duration histogram of one ``timed`` function.
+
+    Buckets are counted inline rather than through ``metrics.Histogram``,
+    which keeps a timed call to one lock and one bisect.
+    """
+
+    def __init__(self):
+        self.bounds = TIMING_BUCKETS
+        self.counts = [0] * (len(TIMING_BUCKETS) + 1)
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.calls += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the ``fraction`` quantile"""
+        rank = max(1, fraction * self.calls)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> Dict:
+        if not self.calls:
+            return {'calls': 0}
+        return {
+            'calls': self.calls,
+            'total_seconds': round(self.total, 6),
+            'mean_us': round(self.total / self.calls * 1e6, 2),
+            'p50_us': round(self.percentile(0.5) * 1e6, 2),
+            'p99_us': round(self.percentile(0.99) * 1e6, 2),
+            'max_us': round(self.max * 1e6, 2),
+        }
+
+
+class ProfileSession:
+    """
+    One profiling run of this process: stack samples plus ``timed``
+    function durations for ``duration`` seconds, written on completion to
+    ``<output_dir>/<role>-<host>-<pid>-<time>.collapsed`` and a
+    ``.timings.json`` file beside it.
+    """
+
+    def __init__(self, role: str, duration: float, interval: float, output_dir: str):
+        self.role = role
+        self.duration = duration
+        self.output_dir = output_dir
+        self.sampler = StackSampler(interval)
+        self.timers: Dict[str, FunctionTimer] = {}
+        self.path = None
+        self._timers_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def timer(self, name: str) -> FunctionTimer:
+        timer = self.timers.get(name)
+        if timer is None:
+            with self._timers_lock:
+                timer = self.timers.setdefault(name, FunctionTimer())
+        return timer
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """End the run early; its output is still written"""
+        self._stop_event.set()
+        self.join()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        global _session
+        started = time.monotonic()
+        try:
+            self.sampler.run(self.duration, self._stop_event)
+        finally:
+            with _session_lock:
+                if _session is self:
+                    _session = None
+        try:
+            self.write(time.monotonic() - started)
+        except OSError as e:
+            logger.error(f"Could not write profile to {self.output_dir}: {e}")
+
+    def write(self, elapsed: float):
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"{self.role}-{socket.gethostname()}-{os.getpid()}-{datetime.now():%Y%m%dT%H%M%S}"
+        base = os.path.join(self.output_dir, name)
+        sampler = self.sampler
+        with open(f'{base}.collapsed', 'w') as f:
+            f.write(sampler.collapsed())
+        with open(f'{base}.timings.json', 'w') as f:
+            json.dump({
+                'role': self.role,
+                'pid': os.getpid(),
+                'seconds': round(elapsed, 3),
+                'samples': sampler.samples,
+                'interval_ms': sampler.interval * 1000,
+                # Share of the run the sampler itself held the GIL
+                'sampler_overhead': round(sampler.sample_seconds / elapsed, 4) if elapsed else None,
+                'functions': {name: timer.summary() for name, timer in sorted(self.timers.items())},
+            }, f, indent=2)
+        self.path = f'{base}.collapsed'
+        logger.info(f"Wrote {sampler.samples} stack samples of {self.role} to {self.path}")
+
+
+# The running session of this process, if any
+_session: Optional[ProfileSession] = None
+_session_lock = threading.Lock()
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorator recording a function's call durations while a profiling
+    session runs. Outside one it costs a global lookup per call.
+    """
+    perf_counter = time.perf_counter
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            session = _session
+            if session is None:
+                return function(*args, **kwargs)
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - started
+                (session.timers.get(name) or session.timer(name)).observe(elapsed)
+        return wrapper
+    return decorator
+
+
+def start_session(role: str, duration: Optional[float] = None, interval_ms: Optional[float] = None,
+                  output_dir: Optional[str] = None) -> Optional[ProfileSession]:
+    """
+    Start profiling this process, unless a session is already running.
+
+    Args:
+        role: Process role, used in the output file names
+        duration: Seconds to sample (default ``TICK_PROFILE_DURATION``)
+        interval_ms: Milliseconds between samples (default ``TICK_PROFILE_INTERVAL_MS``)
+        output_dir: Where the files go (default ``TICK_PROFILE_DIR``)
+
+    Returns:
+        The new session, or None if one was already running
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            logger.warning(f"Profiling of {role} already running, ignoring request")
+            return None
+        _session = ProfileSession(
+            role,
+            duration if duration is not None else settings.TICK_PROFILE_DURATION,
+            (interval_ms if interval_ms is not None else settings.TICK_PROFILE_INTERVAL_MS) / 1000,
+            output_dir or settings.TICK_PROFILE_DIR,
+        )
+        session = _session
+    logger.info(f"Profiling {role} for {session.duration:g}s")
+    session.start()
+    return session
+
+
+def request_profile(client: redis.Redis, duration: float, roles: Iterable[str] = ROLES,
+                    interval_ms: Optional[float] = None) -> str:
+    """
+    Ask every process of ``roles`` to profile itself for ``duration`` seconds.
+
+    The request lives in Redis for the profile's length plus one watcher
+    poll interval, so every polling process sees it even when ``duration``
+    is shorter than the interval; each runs it once.
+
+    Returns:
+        The request id
+    """
+    request_id = uuid.uuid4().hex
+    request = {'id': request_id, 'duration': duration, 'roles': list(roles), 'interval_ms': interval_ms}
+    watch_interval = getattr(settings, 'TICK_PROFILE_WATCH_INTERVAL', 2)
+    client.set(PROFILE_REQUEST_KEY, json.dumps(request), ex=int(duration + watch_interval) + 1)
+    return request_id
+
+
+class ProfileWatcher:
+    """Polls the Redis profiling request and starts a session for each new one aimed at ``role``"""
+
+    def __init__(self, role: str, interval: float = 2.0, client: Optional[redis.Redis] = None):
+        self.role = role
+        self.interval = interval
+        self.client = client
+        self._seen = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def check(self) -> Optional[ProfileSession]:
+        """Poll once; returns the session started, if any"""
+        if self.client is None:
+            from market_tick_system.redis_client import get_redis
+            self.client = get_redis()
+        raw = self.client.get(PROFILE_REQUEST_KEY)
+        if raw is None:
+            return None
+        try:
+            request = json.loads(raw)
+            request_id = request['id']
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring malformed profiling request: {e}")
+            return None
+        if request_id == self._seen or self.role not in request.get('roles', ROLES):
+            return None
+        self._seen = request_id
+        return start_session(self.role, request.get('duration'), request.get('interval_ms'))
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='profile-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.check()
+            except redis.RedisError as e:
+                logger.warning(f"Could not check profiling requests: {e}")
+            except Exception as e:
+                logger.error(f"Error checking profiling requests: {e}", exc_info=True)
+
+
+_watcher: Optional[ProfileWatcher] = None
+_watcher_pid = None
+
+
+def enable(role: str):
+    """
+    Let this process be profiled at runtime: SIGUSR2 starts a
+    ``TICK_PROFILE_DURATION`` session (when called on the main thread),
+    and a watcher polls for ``profile_ticks`` requests every
+    ``TICK_PROFILE_WATCH_INTERVAL`` seconds (0 disables it). Once per
+    process; a forked child, e.g. a Celery pool process, enables its own.
+    """
+    global _watcher, _watcher_pid
+    if _watcher_pid == os.getpid():
+        return
+    _watcher_pid = os.getpid()
+
+    if threading.current_thread() is threading.main_thread() and hasattr(signal, 'SIGUSR2'):
+        def signal_handler(sig, frame):
+            # The handler interrupts the main thread, which may hold
+            # _session_lock; start the session from another thread
+            threading.Thread(target=start_session, args=(role,), daemon=True).start()
+        signal.signal(signal.SIGUSR2, signal_handler)
+
+    interval = getattr(settings, 'TICK_PROFILE_WATCH_INTERVAL', 2)
+    _watcher = ProfileWatcher(role, interval=interval) if interval > 0 else None
+    if _watcher:
+        _watcher.start()
+
+
+def disable():
+    """Stop watching for requests and finish a running session, writing its output"""
+    global _watcher, _watcher_pid
+    if _watcher:
+        _watcher.stop()
+        _watcher = None
+    _watcher_pid = None
+    session = _session
+    if session:
+        session.stop()
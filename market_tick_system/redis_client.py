@@ -0,0 +1,18 @@
+import redis
+from django.conf import settings
+
+_clients = {}
+
+
+def get_redis(url=None):
+    """
+    Return a shared Redis client for ``url`` (defaults to ``REDIS_URL``).
+
+    Clients are cached per URL; redis-py clients are thread-safe and pool
+    their connections.
+    """
+    url = url or settings.REDIS_URL
+    client = _clients.get(url)
+    if client is None:
+        client = _clients[url] = redis.Redis.from_url(url)
+    return client
@@ -74,6 +74,23 @@ DATABASES = {
     }
 }
 
+# Tick ingestion backend used by consume_tick: 'orm' (bulk_create),
+# 'sql' (raw executemany INSERT) or 'load_data' (LOAD DATA LOCAL INFILE
+# for batches of at least TICK_INGEST_LOAD_DATA_MIN_ROWS rows)
+TICK_INGEST_BACKEND = os.getenv('TICK_INGEST_BACKEND', 'orm')
+# Tick table: 'ticks' (Ticks model) or 'compact' (CompactTick: scaled BIGINT
+# price/volume, microsecond ts, clustered (script_id, ts) primary key)
+TICK_STORAGE = os.getenv('TICK_STORAGE', 'ticks')
+TICK_INGEST_LOAD_DATA_MIN_ROWS = int(os.getenv('TICK_INGEST_LOAD_DATA_MIN_ROWS', '5000'))
+TICK_INGEST_LOCAL_INFILE = os.getenv('TICK_INGEST_LOCAL_INFILE', 'False') == 'True'
+if TICK_INGEST_LOCAL_INFILE:
+    DATABASES['default']['OPTIONS']['local_infile'] = 1
+# Maintain OHLCV candles (Candle model) as each tick batch is written
+TICK_CANDLES_ENABLED = os.getenv('TICK_CANDLES_ENABLED', 'False') == 'True'
+TICK_CANDLE_RESOLUTIONS = os.getenv('TICK_CANDLE_RESOLUTIONS', '1s,1m,1h,1d').split(',')
+# Admin without full-table COUNT(*), per-row counts or table-scanning filters
+TICK_ADMIN_LARGE_TABLE = os.getenv('TICK_ADMIN_LARGE_TABLE', 'False') == 'True'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -103,6 +120,26 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Redis (tick streams, caches)
+REDIS_URL = os.getenv(
+    'REDIS_URL',
+    f"redis://{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', '6379')}/{os.getenv('REDIS_DB', '0')}"
+)
+
+# How the producer hands ticks to consumers: 'celery' (consume_tick tasks)
+# or 'redis_streams' (XADD to one stream per broker, read by run_tick_consumer)
+TICK_TRANSPORT = os.getenv('TICK_TRANSPORT', 'celery')
+TICK_STREAM_MAXLEN = int(os.getenv('TICK_STREAM_MAXLEN', '1000000'))
+TICK_STREAM_GROUP = os.getenv('TICK_STREAM_GROUP', 'tick-consumers')
+# Entries delivered this many times without being inserted go to <stream>:dead
+TICK_STREAM_MAX_DELIVERIES = int(os.getenv('TICK_STREAM_MAX_DELIVERIES', '5'))
+# Keep the latest tick of every script in Redis (one hash per broker),
+# served by tick_consumer.quotes.get_latest_quotes and /api/quotes/
+TICK_QUOTE_CACHE_ENABLED = os.getenv('TICK_QUOTE_CACHE_ENABLED', 'False') == 'True'
+# Publish committed ticks to Redis pub/sub for /api/live/ (server-sent events,
+# ASGI); only needed with the live service (docker compose --profile live)
+TICK_LIVE_PUBLISH_ENABLED = os.getenv('TICK_LIVE_PUBLISH_ENABLED', 'False') == 'True'
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://redis:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379/0')
@@ -111,6 +148,18 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Worker-side batching: consume_tick messages are buffered in the worker and
+# saved with one insert per TICK_CONSUMER_BATCH_SIZE messages or every
+# TICK_CONSUMER_BATCH_INTERVAL seconds, then acknowledged (late ack).
+TICK_CONSUMER_BATCHING = os.getenv('TICK_CONSUMER_BATCHING', 'False') == 'True'
+TICK_CONSUMER_BATCH_SIZE = int(os.getenv('TICK_CONSUMER_BATCH_SIZE', '1000'))
+TICK_CONSUMER_BATCH_INTERVAL = float(os.getenv('TICK_CONSUMER_BATCH_INTERVAL', '0.5'))
+# Messages that failed this many batches go to the ticks:dead:consume_tick stream
+TICK_CONSUMER_MAX_DELIVERIES = int(os.getenv('TICK_CONSUMER_MAX_DELIVERIES', '5'))
+if TICK_CONSUMER_BATCHING:
+    # The worker must be allowed to hold a full batch of unacknowledged messages
+    CELERY_WORKER_PREFETCH_MULTIPLIER = 0
+
 # Logging Configuration
 LOG_DIR = os.path.join(BASE_DIR, 'logs')
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -167,3 +216,42 @@ LOGGING = {
 
 # Binance WebSocket URL
 BINANCE_WS_URL = os.getenv('BINANCE_WS_URL', 'wss://stream.binance.com:9443/ws')
+# REST API, used for order book depth snapshots
+BINANCE_REST_URL = os.getenv('BINANCE_REST_URL', 'https://api.binance.com')
+
+# JSON decoder for WebSocket frames: 'auto' (orjson if installed), 'orjson',
+# 'json', or a dotted path to a loads-style callable
+TICK_JSON_DECODER = os.getenv('TICK_JSON_DECODER', 'auto')
+
+# Seconds between producer checks for Script changes (signalled through a
+# Redis version counter); added and removed scripts are subscribed and
+# unsubscribed on the open connections. 0 disables.
+TICK_SCRIPT_WATCH_INTERVAL = float(os.getenv('TICK_SCRIPT_WATCH_INTERVAL', '5'))
+
+# Raw frame capture for replay_ticks: producers append every frame to
+# segment files under TICK_CAPTURE_DIR/broker_<id>/ (empty disables),
+# rotated at TICK_CAPTURE_SEGMENT_MB; only the newest
+# TICK_CAPTURE_KEEP_SEGMENTS per producer are kept (0 keeps all).
+TICK_CAPTURE_DIR = os.getenv('TICK_CAPTURE_DIR', '')
+TICK_CAPTURE_SEGMENT_MB = int(os.getenv('TICK_CAPTURE_SEGMENT_MB', '256'))
+TICK_CAPTURE_KEEP_SEGMENTS = int(os.getenv('TICK_CAPTURE_KEEP_SEGMENTS', '0'))
+
+# Pipeline metrics: producers and workers record per-stage latency
+# histograms, batch sizes and queue depths and publish them to Redis every
+# TICK_METRICS_PUSH_INTERVAL seconds; /metrics renders them for Prometheus.
+TICK_METRICS_ENABLED = os.getenv('TICK_METRICS_ENABLED', 'False') == 'True'
+TICK_METRICS_PUSH_INTERVAL = float(os.getenv('TICK_METRICS_PUSH_INTERVAL', '5'))
+# With metrics on, Celery batches also carry their send time (traced-v1
+# envelopes) for the transport stage. Workers from before that envelope
+# cannot read it, so enable only once every worker is upgraded.
+TICK_TRACE_PAYLOADS = os.getenv('TICK_TRACE_PAYLOADS', 'False') == 'True'
+
+# Runtime profiling (profile_ticks, SIGUSR2 or the Redis profiling request):
+# producers and workers sample every thread's stack each
+# TICK_PROFILE_INTERVAL_MS for TICK_PROFILE_DURATION seconds and write
+# collapsed stacks (flamegraph.pl, speedscope) to TICK_PROFILE_DIR. They
+# poll for requests every TICK_PROFILE_WATCH_INTERVAL seconds (0 disables).
+TICK_PROFILE_DIR = os.getenv('TICK_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+TICK_PROFILE_DURATION = float(os.getenv('TICK_PROFILE_DURATION', '30'))
+TICK_PROFILE_INTERVAL_MS = float(os.getenv('TICK_PROFILE_INTERVAL_MS', '10'))
+TICK_PROFILE_WATCH_INTERVAL = float(os.getenv('TICK_PROFILE_WATCH_INTERVAL', '2'))
@@ -1,8 +1,12 @@
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from tick_consumer.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/', include('tick_consumer.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
 
 # Customize admin site headers
@@ -1,5 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib import admin
-from .models import Broker, Script, Ticks
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Broker, Candle, OrderBookSnapshot, Script, Ticks
+
+
+def large_table_mode() -> bool:
+    """Large-table mode: no per-row or full-table COUNT(*), index-friendly filters only"""
+    return getattr(settings, 'TICK_ADMIN_LARGE_TABLE', False)
+
+
+def estimated_row_count(model):
+    """Row count from table statistics (MySQL, PostgreSQL), or None where there are none"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs an unbounded COUNT(*).
+
+    An unfiltered changelist takes its count from table statistics; a
+    filtered one counts at most ``count_limit`` rows (``COUNT`` over a
+    ``LIMIT`` subquery), so later pages of a huge result are reached by
+    narrowing the filters rather than paging.
+    """
+
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate is not None:
+                return estimate
+        return self.object_list[:self.count_limit].count()
+
+
+class RecentTicksFilter(admin.SimpleListFilter):
+    """Relative time windows on received_at_producer, served by its index"""
+
+    title = 'received'
+    parameter_name = 'received_within'
+    windows = {
+        '5m': ('Last 5 minutes', timedelta(minutes=5)),
+        '1h': ('Last hour', timedelta(hours=1)),
+        '24h': ('Last 24 hours', timedelta(days=1)),
+        '7d': ('Last 7 days', timedelta(days=7)),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, (label, _) in self.windows.items()]
+
+    def queryset(self, request, queryset):
+        window = self.windows.get(self.value())
+        if window is None:
+            return queryset
+        return queryset.filter(received_at_producer__gte=timezone.now() - window[1])
 
 
 @admin.register(Broker)
@@ -23,9 +99,13 @@ class BrokerAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(script_total=Count('scripts'))
+
     def script_count(self, obj):
-        return obj.scripts.count()
+        return obj.script_total
     script_count.short_description = 'Scripts'
+    script_count.admin_order_field = 'script_total'
 
 
 @admin.register(Script)
@@ -49,18 +129,59 @@ class ScriptAdmin(admin.ModelAdmin):
         }),
     )
 
+    list_select_related = ['broker']
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not large_table_mode():
+            return queryset.annotate(tick_total=Count('ticks'))
+        # Materialized counts: daily candles hold each script's tick count
+        daily_counts = Candle.objects.filter(script=OuterRef('pk'), resolution='1d').values(
+            'script').annotate(total=Sum('tick_count')).values('total')
+        return queryset.annotate(tick_total=Subquery(daily_counts))
+
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if large_table_mode() and not getattr(settings, 'TICK_CANDLES_ENABLED', False):
+            # Without candles there is no cheap per-script count
+            return [field for field in list_display if field != 'tick_count']
+        return list_display
+
     def tick_count(self, obj):
-        return obj.ticks.count()
+        return obj.tick_total or 0
     tick_count.short_description = 'Ticks'
+    tick_count.admin_order_field = 'tick_total'
 
 
 @admin.register(Ticks)
 class TicksAdmin(admin.ModelAdmin):
     list_display = ['id', 'script', 'tick_value', 'volume', 'received_at_producer', 'created_at']
+    readonly_fields = ['created_at', 'updated_at']
+    list_select_related = ['script']
+
     list_filter = ['script', 'received_at_producer', 'created_at']
     search_fields = ['script__trading_symbol', 'script__name']
-    readonly_fields = ['created_at', 'updated_at']
-    date_hierarchy = 'received_at_producer'
+
+    # In large-table mode every filter is an equality on script and/or a range on
+    # received_at_producer, which the (script, received_at_producer) indexes serve;
+    # no date_hierarchy or search, which scan the table
+    def get_list_filter(self, request):
+        return ['script', RecentTicksFilter] if large_table_mode() else self.list_filter
+
+    def get_search_fields(self, request):
+        return [] if large_table_mode() else self.search_fields
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        paginator = EstimatedCountPaginator if large_table_mode() else self.paginator
+        return paginator(queryset, per_page, orphans, allow_empty_first_page)
+
+    @property
+    def date_hierarchy(self):
+        return None if large_table_mode() else 'received_at_producer'
+
+    @property
+    def show_full_result_count(self):
+        return not large_table_mode()
 
     fieldsets = (
         ('Tick Information', {
@@ -78,3 +199,20 @@ class TicksAdmin(admin.ModelAdmin):
 
     def has_change_permission(self, request, obj=None):
         return False
+
+
+@admin.register(OrderBookSnapshot)
+class OrderBookSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['id', 'script', 'best_bid', 'best_ask', 'last_update_id', 'captured_at']
+    list_filter = ['script']
+    list_select_related = ['script']
+    readonly_fields = ['script', 'captured_at', 'last_update_id', 'best_bid', 'best_ask', 'bids', 'asks', 'created_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # Written by the producer's order book engine only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
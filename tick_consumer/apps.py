@@ -5,3 +5,6 @@ class TickConsumerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tick_consumer'
     verbose_name = 'Tick Consumer'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,96 @@
+import json
+import logging
+from typing import Any, Collection
+
+import redis
+from celery_batches import Batches, SimpleRequest
+from celery_batches.trace import apply_batches_task
+from django.conf import settings
+
+from market_tick_system.redis_client import get_redis
+
+from .streams import dead_letter
+
+logger = logging.getLogger('tick_consumer')
+
+DELIVERIES_KEY_PREFIX = 'ticks:deliveries:'
+DEAD_LETTER_KEY = 'ticks:dead:consume_tick'
+# Failure counts outlive any sensible requeue loop, then expire on their own
+DELIVERIES_TTL = 24 * 3600
+
+
+class LateAckBatches(Batches):
+    """
+    Batches task that acknowledges its messages only after the flush succeeds.
+
+    ``celery_batches`` acknowledges late-ack requests when the batch returns,
+    whether it failed or not. Here a failed flush (the batch task raised, so
+    the trace returns None) requeues every message in the batch instead, so
+    no tick is acknowledged before its insert has committed. A task that
+    saved some messages can return their failures as ``{'failed': [ids]}``
+    and only those are requeued.
+
+    Failures are counted per message in Redis. A message that has failed
+    ``TICK_CONSUMER_MAX_DELIVERIES`` times is copied to the
+    ``ticks:dead:consume_tick`` stream and acknowledged, so a message that
+    can never be saved is not requeued forever.
+    """
+
+    abstract = True
+
+    def flush(self, requests: Collection[Any]) -> Any:
+        requests = list(requests)
+        serializable_requests = ([SimpleRequest.from_request(r) for r in requests],)
+
+        def on_return(result):
+            if result is None:
+                failed = requests
+            else:
+                failed_ids = set(result.get('failed', ())) if isinstance(result, dict) else set()
+                failed = [request for request in requests if request.id in failed_ids]
+            if failed:
+                logger.error(f"{len(failed)} of {len(requests)} batched messages failed")
+                self.handle_failures(failed)
+            for request in requests:
+                if request not in failed:
+                    request.acknowledge()
+
+        return self._pool.apply_async(
+            apply_batches_task,
+            (self, serializable_requests, 0, None),
+            callback=on_return,
+        )
+
+    def handle_failures(self, requests):
+        """Requeue failed messages, or dead-letter those that failed too often"""
+        max_deliveries = getattr(settings, 'TICK_CONSUMER_MAX_DELIVERIES', 5)
+        exhausted = []
+        try:
+            client = get_redis()
+            pipe = client.pipeline(transaction=False)
+            for request in requests:
+                key = f"{DELIVERIES_KEY_PREFIX}{request.id}"
+                pipe.incr(key)
+                pipe.expire(key, DELIVERIES_TTL)
+            failures = pipe.execute()[::2]
+
+            dead = [(request, count) for request, count in zip(requests, failures) if count >= max_deliveries]
+            if dead:
+                dead_letter(client, DEAD_LETTER_KEY, [
+                    (request.id, {'args': json.dumps(request._payload[0]), 'deliveries': count})
+                    for request, count in dead
+                ])
+                exhausted = [request for request, _ in dead]
+                logger.error(
+                    f"Moved {len(exhausted)} messages that failed {max_deliveries} times to {DEAD_LETTER_KEY}"
+                )
+                client.delete(*[f"{DELIVERIES_KEY_PREFIX}{request.id}" for request in exhausted])
+        except (redis.RedisError, TypeError, ValueError) as e:
+            # Without a count nothing is dropped; what was not dead-lettered is retried
+            logger.warning(f"Could not count failed deliveries, requeueing: {e}")
+
+        for request in requests:
+            if request in exhausted:
+                request.acknowledge()
+            else:
+                request.reject(requeue=True)
@@ -0,0 +1,150 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .ingest import TickRow
+from .models import Candle
+
+logger = logging.getLogger('tick_consumer')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# Resolution -> bucket width in microseconds
+RESOLUTIONS = {
+    '1s': 1_000_000,
+    '1m': 60_000_000,
+    '1h': 3_600_000_000,
+    '1d': 86_400_000_000,
+}
+
+COLUMNS = (
+    'script_id', 'resolution', 'bucket_start', 'open', 'high', 'low', 'close',
+    'volume', 'tick_count', 'first_tick_at', 'last_tick_at',
+)
+
+# Assignments run left to right on MySQL and later ones see the new values,
+# so open/close (and volume) must be updated before first/last_tick_at.
+MYSQL_UPDATE = """
+    open = IF(VALUES(first_tick_at) < first_tick_at, VALUES(open), open),
+    first_tick_at = LEAST(first_tick_at, VALUES(first_tick_at)),
+    close = IF(VALUES(last_tick_at) >= last_tick_at, VALUES(close), close),
+    volume = IF(VALUES(last_tick_at) >= last_tick_at, VALUES(volume), volume),
+    last_tick_at = GREATEST(last_tick_at, VALUES(last_tick_at)),
+    high = GREATEST(high, VALUES(high)),
+    low = LEAST(low, VALUES(low)),
+    tick_count = tick_count + VALUES(tick_count)
+"""
+
+# ON CONFLICT (PostgreSQL, SQLite) evaluates every expression against the old row
+CONFLICT_UPDATE = """
+    open = CASE WHEN excluded.first_tick_at < {t}.first_tick_at THEN excluded.open ELSE {t}.open END,
+    first_tick_at = CASE WHEN excluded.first_tick_at < {t}.first_tick_at
+        THEN excluded.first_tick_at ELSE {t}.first_tick_at END,
+    close = CASE WHEN excluded.last_tick_at >= {t}.last_tick_at THEN excluded.close ELSE {t}.close END,
+    volume = CASE WHEN excluded.last_tick_at >= {t}.last_tick_at THEN excluded.volume ELSE {t}.volume END,
+    last_tick_at = CASE WHEN excluded.last_tick_at >= {t}.last_tick_at
+        THEN excluded.last_tick_at ELSE {t}.last_tick_at END,
+    high = CASE WHEN excluded.high > {t}.high THEN excluded.high ELSE {t}.high END,
+    low = CASE WHEN excluded.low < {t}.low THEN excluded.low ELSE {t}.low END,
+    tick_count = {t}.tick_count + excluded.tick_count
+"""
+
+
+def get_resolutions() -> List[str]:
+    """Resolutions maintained at ingestion, from ``TICK_CANDLE_RESOLUTIONS``"""
+    resolutions = getattr(settings, 'TICK_CANDLE_RESOLUTIONS', list(RESOLUTIONS))
+    unknown = [r for r in resolutions if r not in RESOLUTIONS]
+    if unknown:
+        raise ValueError(f"Unknown candle resolutions: {', '.join(unknown)}")
+    return list(resolutions)
+
+
+def bucket_start(value: datetime, resolution: str) -> datetime:
+    """Start of the bucket of ``resolution`` that contains ``value``"""
+    width = RESOLUTIONS[resolution]
+    ts = (value - EPOCH) // MICROSECOND
+    return EPOCH + timedelta(microseconds=ts - ts % width)
+
+
+def aggregate(rows: Iterable[TickRow], resolutions: Optional[Sequence[str]] = None) -> Dict[Tuple, list]:
+    """
+    Fold ticks into partial candles.
+
+    Rows may arrive in any order; open/close follow the tick timestamps.
+
+    Returns:
+        dict: (script_id, resolution, bucket_start) ->
+              [open, high, low, close, volume, tick_count, first_tick_at, last_tick_at]
+    """
+    resolutions = resolutions or get_resolutions()
+    candles = {}
+    for row in rows:
+        price = row.tick_value
+        at = row.received_at
+        for resolution in resolutions:
+            key = (row.script_id, resolution, bucket_start(at, resolution))
+            candle = candles.get(key)
+            if candle is None:
+                candles[key] = [price, price, price, price, row.volume, 1, at, at]
+                continue
+            if at < candle[6]:
+                candle[0] = price
+                candle[6] = at
+            if at >= candle[7]:
+                candle[3] = price
+                candle[4] = row.volume
+                candle[7] = at
+            if price > candle[1]:
+                candle[1] = price
+            if price < candle[2]:
+                candle[2] = price
+            candle[5] += 1
+    return candles
+
+
+class CandleWriter:
+    """Merges partial candles into the ``candles`` table with one upsert row per bucket"""
+
+    def __init__(self):
+        qn = connection.ops.quote_name
+        table = qn(Candle._meta.db_table)
+        columns = ', '.join(qn(column) for column in COLUMNS)
+        insert = f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(COLUMNS))})"
+        if connection.vendor == 'mysql':
+            self.sql = f"{insert} ON DUPLICATE KEY UPDATE {MYSQL_UPDATE}"
+        else:
+            self.sql = (
+                f"{insert} ON CONFLICT (script_id, resolution, bucket_start) "
+                f"DO UPDATE SET {CONFLICT_UPDATE.format(t=table)}"
+            )
+
+    def write(self, candles: Dict[Tuple, list]) -> int:
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        # Sorted so concurrent workers lock rows in the same order
+        params = [
+            (script_id, resolution, adapt_datetime(start), open_, high, low, close, volume,
+             tick_count, adapt_datetime(first_at), adapt_datetime(last_at))
+            for (script_id, resolution, start), (open_, high, low, close, volume, tick_count, first_at, last_at)
+            in sorted(candles.items())
+        ]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(params), 1000):
+                cursor.executemany(self.sql, params[start:start + 1000])
+        return len(params)
+
+
+def update_candles(rows: List[TickRow], resolutions: Optional[Sequence[str]] = None) -> int:
+    """
+    Fold a batch of ticks into the stored candles.
+
+    Returns:
+        int: Number of candle rows upserted
+    """
+    if not rows:
+        return 0
+    return CandleWriter().write(aggregate(rows, resolutions))
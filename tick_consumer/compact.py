@@ -0,0 +1,175 @@
+import logging
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.db import connection, transaction
+
+from .ingest import TickRow
+from .models import CompactTick, Script
+from .wire import from_fixed
+
+logger = logging.getLogger('tick_consumer')
+
+DEFAULT_SCALE = 8
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# script_id -> (price_scale, volume_scale); scales never change once a script has rows
+_scale_cache: Dict[int, Tuple[int, int]] = {}
+
+
+def datetime_to_ts(value: datetime) -> int:
+    """Aware datetime -> epoch microseconds"""
+    return (value - EPOCH) // MICROSECOND
+
+
+def ts_to_datetime(ts: int) -> datetime:
+    """Epoch microseconds -> aware UTC datetime"""
+    return EPOCH + timedelta(microseconds=ts)
+
+
+def clear_scale_cache():
+    """Forget cached script scales (e.g. after editing a script with no rows yet)"""
+    _scale_cache.clear()
+
+
+def get_scales(script_ids) -> Dict[int, Tuple[int, int]]:
+    """Return (price_scale, volume_scale) for each script id, from Script.additional_data"""
+    missing = [script_id for script_id in set(script_ids) if script_id not in _scale_cache]
+    if missing:
+        for script_id, additional_data in Script.objects.filter(id__in=missing).values_list('id', 'additional_data'):
+            additional_data = additional_data or {}
+            _scale_cache[script_id] = (
+                int(additional_data.get('price_scale', DEFAULT_SCALE)),
+                int(additional_data.get('volume_scale', DEFAULT_SCALE)),
+            )
+    return {script_id: _scale_cache.get(script_id, (DEFAULT_SCALE, DEFAULT_SCALE)) for script_id in script_ids}
+
+
+def _scaled(value: Decimal, scale: int) -> int:
+    return int(value.scaleb(scale).to_integral_value())
+
+
+class CompactTickWriter:
+    """Writes TickRows to ``compact_ticks`` as scaled integers, upserting on (script_id, ts)"""
+
+    def __init__(self):
+        qn = connection.ops.quote_name
+        table = qn(CompactTick._meta.db_table)
+        insert = f"INSERT INTO {table} (script_id, ts, price, volume) VALUES (%s, %s, %s, %s)"
+        if connection.vendor == 'mysql':
+            self.sql = f"{insert} ON DUPLICATE KEY UPDATE price = VALUES(price), volume = VALUES(volume)"
+        else:
+            self.sql = f"{insert} ON CONFLICT (script_id, ts) DO UPDATE SET price = excluded.price, volume = excluded.volume"
+
+    def write(self, rows: List[TickRow]) -> int:
+        scales = get_scales({row.script_id for row in rows})
+        params = []
+        for row in rows:
+            price_scale, volume_scale = scales[row.script_id]
+            params.append((
+                row.script_id,
+                datetime_to_ts(row.received_at),
+                _scaled(row.tick_value, price_scale),
+                None if row.volume is None else _scaled(row.volume, volume_scale),
+            ))
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(params), 1000):
+                cursor.executemany(self.sql, params[start:start + 1000])
+        return len(params)
+
+
+def iter_compact_ticks(script_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       chunk_size: int = 10000) -> Iterator[TickRow]:
+    """
+    Read a script's compact ticks in time order as TickRows with Decimal values.
+
+    Pages through the clustered (script_id, ts) key, so memory stays bounded
+    for any range.
+    """
+    price_scale, volume_scale = get_scales([script_id])[script_id]
+    queryset = CompactTick.objects.filter(script_id=script_id)
+    if end is not None:
+        queryset = queryset.filter(ts__lt=datetime_to_ts(end))
+    last_ts = None if start is None else datetime_to_ts(start) - 1
+
+    while True:
+        page = queryset if last_ts is None else queryset.filter(ts__gt=last_ts)
+        chunk = list(page.order_by('ts').values_list('ts', 'price', 'volume')[:chunk_size])
+        for ts, price, volume in chunk:
+            yield TickRow(
+                script_id,
+                from_fixed(price, price_scale),
+                None if volume is None else from_fixed(volume, volume_scale),
+                ts_to_datetime(ts),
+            )
+        if len(chunk) < chunk_size:
+            return
+        last_ts = chunk[-1][0]
+
+
+def get_partitions() -> List[Tuple[str, Optional[int]]]:
+    """Return (partition name, exclusive upper ts bound or None for MAXVALUE) for compact_ticks on MySQL"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL "
+            "ORDER BY PARTITION_ORDINAL_POSITION",
+            [CompactTick._meta.db_table]
+        )
+        return [
+            (name, None if description == 'MAXVALUE' else int(description))
+            for name, description in cursor.fetchall()
+        ]
+
+
+def _day_partition(day: date) -> str:
+    upper = datetime_to_ts(datetime(day.year, day.month, day.day, tzinfo=timezone.utc) + timedelta(days=1))
+    return f"PARTITION p{day:%Y%m%d} VALUES LESS THAN ({upper})"
+
+
+def ensure_day_partitions(days_ahead: int = 7, today: Optional[date] = None) -> List[str]:
+    """
+    Partition compact_ticks by day (MySQL RANGE on ts) and keep future days created.
+
+    The first call converts the table, with one partition per day from today
+    to ``days_ahead`` plus a catch-all ``pmax``. Later calls split ``pmax``
+    to add the days that are missing. Returns the partitions added.
+
+    Raises:
+        ValueError: If the database is not MySQL
+    """
+    if connection.vendor != 'mysql':
+        raise ValueError("compact_ticks partitioning requires MySQL")
+
+    today = today or datetime.now(timezone.utc).date()
+    wanted = [today + timedelta(days=offset) for offset in range(days_ahead + 1)]
+    table = connection.ops.quote_name(CompactTick._meta.db_table)
+    existing = get_partitions()
+
+    with connection.cursor() as cursor:
+        if not existing:
+            # Older rows land in the first partition
+            definitions = [_day_partition(day) for day in wanted]
+            cursor.execute(
+                f"ALTER TABLE {table} PARTITION BY RANGE (ts) "
+                f"({', '.join(definitions)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            )
+            added = [f"p{day:%Y%m%d}" for day in wanted]
+        else:
+            highest = max((bound for _, bound in existing if bound is not None), default=0)
+            missing = [day for day in wanted if datetime_to_ts(
+                datetime(day.year, day.month, day.day, tzinfo=timezone.utc)) >= highest]
+            if not missing:
+                return []
+            definitions = [_day_partition(day) for day in missing]
+            cursor.execute(
+                f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                f"({', '.join(definitions)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            )
+            added = [f"p{day:%Y%m%d}" for day in missing]
+
+    logger.info(f"Added compact_ticks partitions: {', '.join(added)}")
+    return added
@@ -0,0 +1,172 @@
+import csv
+import gzip
+import logging
+import os
+from datetime import date
+from typing import Dict, List, Optional
+
+from .compact import datetime_to_ts
+from .queries import iter_tick_values
+
+logger = logging.getLogger('tick_consumer')
+
+EXPORT_FORMATS = ('csv', 'csv.gz', 'npz', 'parquet')
+CSV_HEADER = ('received_at', 'price', 'volume')
+
+
+class CsvExportWriter:
+    """Writes ticks to a CSV file (gzip-compressed for ``csv.gz``) as they arrive"""
+
+    def __init__(self, path: str, compress: bool = False):
+        self.file = gzip.open(path, 'wt', newline='') if compress else open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_HEADER)
+
+    def write(self, chunk: List[tuple]):
+        self.writer.writerows(
+            (received_at.isoformat(), tick_value, '' if volume is None else volume)
+            for _, tick_value, volume, received_at in chunk
+        )
+
+    def close(self):
+        self.file.close()
+
+
+class NpzExportWriter:
+    """
+    Writes ticks to a compressed NumPy ``.npz`` with ``ts`` (epoch
+    microseconds, int64), ``price`` and ``volume`` (float64, NaN for no
+    volume) arrays.
+
+    ``.npz`` cannot be appended to, so one file's columns are held in
+    memory until it is closed; split by day to keep that bounded.
+    """
+
+    def __init__(self, path: str):
+        import numpy
+        self.numpy = numpy
+        self.path = path
+        self.ts = []
+        self.price = []
+        self.volume = []
+
+    def write(self, chunk: List[tuple]):
+        self.ts.append(self.numpy.fromiter(
+            (datetime_to_ts(received_at) for _, _, _, received_at in chunk), dtype='int64', count=len(chunk)))
+        self.price.append(self.numpy.fromiter(
+            (float(tick_value) for _, tick_value, _, _ in chunk), dtype='float64', count=len(chunk)))
+        self.volume.append(self.numpy.fromiter(
+            (float('nan') if volume is None else float(volume) for _, _, volume, _ in chunk),
+            dtype='float64', count=len(chunk)))
+
+    def close(self):
+        concatenate = self.numpy.concatenate
+        with open(self.path, 'wb') as file:
+            self.numpy.savez_compressed(
+                file,
+                ts=concatenate(self.ts) if self.ts else self.numpy.empty(0, 'int64'),
+                price=concatenate(self.price) if self.price else self.numpy.empty(0, 'float64'),
+                volume=concatenate(self.volume) if self.volume else self.numpy.empty(0, 'float64'),
+            )
+
+
+class ParquetExportWriter:
+    """Writes ticks to a zstd-compressed Parquet file, one row group per chunk"""
+
+    def __init__(self, path: str):
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ('received_at', pyarrow.timestamp('us', tz='UTC')),
+            ('price', pyarrow.decimal128(20, 8)),
+            ('volume', pyarrow.decimal128(30, 8)),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, chunk: List[tuple]):
+        self.writer.write_table(self.pyarrow.Table.from_arrays([
+            self.pyarrow.array([row[3] for row in chunk], self.schema.field('received_at').type),
+            self.pyarrow.array([row[1] for row in chunk], self.schema.field('price').type),
+            self.pyarrow.array([row[2] for row in chunk], self.schema.field('volume').type),
+        ], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def check_format(export_format: str):
+    """
+    Raise ImportError early if the optional library a format needs is missing.
+    """
+    if export_format == 'npz':
+        import numpy  # noqa: F401
+    elif export_format == 'parquet':
+        import pyarrow.parquet  # noqa: F401
+
+
+def open_writer(path: str, export_format: str):
+    if export_format in ('csv', 'csv.gz'):
+        return CsvExportWriter(path, compress=export_format == 'csv.gz')
+    if export_format == 'npz':
+        return NpzExportWriter(path)
+    if export_format == 'parquet':
+        return ParquetExportWriter(path)
+    raise ValueError(f"Unknown export format: {export_format}")
+
+
+def export_script(script_id: int, symbol: str, output_dir: str, export_format: str = 'csv',
+                  start=None, end=None, split_days: bool = True, chunk_size: int = 10000,
+                  storage: Optional[str] = None) -> Dict[str, object]:
+    """
+    Export one script's ticks to ``output_dir/<symbol>/<YYYY-MM-DD>.<format>``
+    (or ``output_dir/<symbol>.<format>`` without ``split_days``).
+
+    Rows are read in keyset-paged chunks and written chunk by chunk, so
+    memory does not grow with the range (except for ``npz``, which holds
+    one file's columns).
+
+    Returns:
+        dict: script_id, rows written and the files created
+    """
+    if split_days:
+        os.makedirs(os.path.join(output_dir, symbol), exist_ok=True)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+
+    files = []
+    rows = 0
+    writer = None
+    day: Optional[date] = None
+    chunk = []
+
+    def flush():
+        if chunk:
+            writer.write(chunk)
+            chunk.clear()
+
+    try:
+        for row in iter_tick_values(script_id, start, end, chunk_size=chunk_size, storage=storage):
+            row_day = row[3].date() if split_days else None
+            if writer is None or row_day != day:
+                if writer is not None:
+                    flush()
+                    writer.close()
+                    writer = None
+                day = row_day
+                name = f"{day:%Y-%m-%d}.{export_format}" if split_days else f"{symbol}.{export_format}"
+                path = os.path.join(output_dir, symbol, name) if split_days else os.path.join(output_dir, name)
+                writer = open_writer(path, export_format)
+                files.append(path)
+            chunk.append(row)
+            rows += 1
+            if len(chunk) >= chunk_size:
+                flush()
+        if writer is not None:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.info(f"Exported {rows} ticks of {symbol} to {len(files)} files")
+    return {'script_id': script_id, 'rows': rows, 'files': files}
@@ -0,0 +1,256 @@
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from market_tick_system import metrics
+
+from .models import Ticks
+
+logger = logging.getLogger('tick_consumer')
+
+# Largest values that fit DECIMAL(20,8) and DECIMAL(30,8)
+MAX_TICK_VALUE = Decimal('1e12')
+MAX_VOLUME = Decimal('1e22')
+MIN_TICK_VALUE = Decimal('0.00000001')
+
+INSERT_CHUNK_SIZE = 1000
+
+
+class TickRow(NamedTuple):
+    """A validated tick ready to be written"""
+    script_id: int
+    tick_value: Decimal
+    volume: Optional[Decimal]
+    received_at: datetime
+
+
+def parse_received_at(received_at):
+    """
+    Convert a tick timestamp to an aware datetime.
+
+    Accepts a datetime, an ISO-8601 string or integer epoch milliseconds.
+    """
+    if isinstance(received_at, (int, float)):
+        return datetime.fromtimestamp(received_at / 1000, tz=dt_timezone.utc)
+    if isinstance(received_at, str):
+        return datetime.fromisoformat(received_at.replace('Z', '+00:00'))
+    return received_at
+
+
+def _to_decimal(value) -> Optional[Decimal]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value) if isinstance(value, float) else value)
+
+
+def normalize_ticks(tick_data: Iterable) -> List[TickRow]:
+    """
+    Validate incoming ticks and convert them to TickRows.
+
+    Accepts the dict and compact row formats documented on ``consume_tick``.
+    Rows that would be rejected by the ``ticks`` column definitions are
+    logged and skipped, so one bad tick cannot fail the whole batch.
+    """
+    rows = []
+    for tick in tick_data:
+        try:
+            if isinstance(tick, dict):
+                script_id = tick['script_id']
+                tick_value = tick['tick_value']
+                volume = tick.get('volume')
+                received_at = tick['received_at_producer']
+            else:
+                script_id, tick_value, volume, received_at = tick
+
+            tick_value = _to_decimal(tick_value)
+            volume = _to_decimal(volume)
+            if tick_value is None or not tick_value.is_finite() or not MIN_TICK_VALUE <= tick_value < MAX_TICK_VALUE:
+                raise ValueError(f"tick_value out of range: {tick_value}")
+            if volume is not None and (not volume.is_finite() or not 0 <= volume < MAX_VOLUME):
+                raise ValueError(f"volume out of range: {volume}")
+
+            rows.append(TickRow(int(script_id), tick_value, volume, parse_received_at(received_at)))
+
+        except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+            logger.warning(f"Skipping invalid tick {tick!r}: {e}")
+
+    return rows
+
+
+class OrmTickWriter:
+    """Writes ticks through ``Ticks.objects.bulk_create``"""
+
+    def write(self, rows: List[TickRow]) -> int:
+        tick_objects = [
+            Ticks(
+                script_id=row.script_id,
+                tick_value=row.tick_value,
+                volume=row.volume,
+                received_at_producer=row.received_at
+            )
+            for row in rows
+        ]
+        Ticks.objects.bulk_create(tick_objects, batch_size=INSERT_CHUNK_SIZE)
+        return len(tick_objects)
+
+
+class SqlTickWriter:
+    """
+    Writes ticks with a parameterized ``INSERT`` and ``executemany``.
+
+    Skips model instantiation entirely. mysqlclient rewrites ``executemany``
+    on an ``INSERT ... VALUES`` statement into multi-row inserts.
+    """
+
+    COLUMNS = ('script_id', 'tick_value', 'volume', 'received_at_producer', 'created_at', 'updated_at')
+
+    def __init__(self):
+        qn = connection.ops.quote_name
+        self.sql = (
+            f"INSERT INTO {qn(Ticks._meta.db_table)} "
+            f"({', '.join(qn(column) for column in self.COLUMNS)}) "
+            f"VALUES ({', '.join(['%s'] * len(self.COLUMNS))})"
+        )
+
+    def _params(self, rows: List[TickRow]):
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        now = adapt_datetime(timezone.now())
+        return [
+            (row.script_id, row.tick_value, row.volume, adapt_datetime(row.received_at), now, now)
+            for row in rows
+        ]
+
+    def write(self, rows: List[TickRow]) -> int:
+        params = self._params(rows)
+        with transaction.atomic(), connection.cursor() as cursor:
+            for start in range(0, len(params), INSERT_CHUNK_SIZE):
+                cursor.executemany(self.sql, params[start:start + INSERT_CHUNK_SIZE])
+        return len(params)
+
+
+class LoadDataTickWriter(SqlTickWriter):
+    """
+    Writes large batches with MySQL ``LOAD DATA LOCAL INFILE``.
+
+    Rows are serialized to a tab-separated buffer on tmpfs (``/dev/shm``
+    where available; mysqlclient only loads from a path) and loaded in one
+    statement. Batches smaller than ``TICK_INGEST_LOAD_DATA_MIN_ROWS``, and
+    non-MySQL databases, use the ``executemany`` path. Requires
+    ``local_infile`` on both the client (``TICK_INGEST_LOCAL_INFILE``) and
+    the server.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.min_rows = getattr(settings, 'TICK_INGEST_LOAD_DATA_MIN_ROWS', 5000)
+        self.tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+    def write(self, rows: List[TickRow]) -> int:
+        if connection.vendor != 'mysql' or len(rows) < self.min_rows:
+            return super().write(rows)
+
+        qn = connection.ops.quote_name
+        lines = ['\t'.join(_tsv_field(value) for value in params) for params in self._params(rows)]
+
+        with tempfile.NamedTemporaryFile('w', suffix='.tsv', dir=self.tmp_dir) as buffer:
+            buffer.write('\n'.join(lines))
+            buffer.flush()
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"LOAD DATA LOCAL INFILE %s INTO TABLE {qn(Ticks._meta.db_table)} "
+                    f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' "
+                    f"({', '.join(qn(column) for column in self.COLUMNS)})",
+                    [buffer.name]
+                )
+        return len(rows)
+
+
+def _tsv_field(value) -> str:
+    if value is None:
+        return r'\N'
+    if isinstance(value, Decimal):
+        return format(value, 'f')
+    return str(value)
+
+
+TICK_WRITERS = {
+    'orm': OrmTickWriter,
+    'sql': SqlTickWriter,
+    'load_data': LoadDataTickWriter,
+}
+
+
+def get_tick_writer(name: Optional[str] = None):
+    """
+    Return the tick writer selected by ``TICK_INGEST_BACKEND`` (or ``name``).
+
+    With ``TICK_STORAGE='compact'`` ticks go to the ``compact_ticks`` table
+    and the backend setting does not apply.
+    """
+    if getattr(settings, 'TICK_STORAGE', 'ticks') == 'compact':
+        from .compact import CompactTickWriter
+        return CompactTickWriter()
+
+    name = name or getattr(settings, 'TICK_INGEST_BACKEND', 'orm')
+    try:
+        return TICK_WRITERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown tick ingest backend: {name}")
+
+
+def write_ticks(tick_data: Iterable, backend: Optional[str] = None) -> int:
+    """
+    Validate and store a batch of ticks with the configured backend.
+
+    With ``TICK_CANDLES_ENABLED`` the batch is also folded into the
+    ``candles`` table in the same transaction. With
+    ``TICK_QUOTE_CACHE_ENABLED`` the latest quote cache in Redis is
+    refreshed once the batch has committed, and with
+    ``TICK_LIVE_PUBLISH_ENABLED`` it is published to live subscribers.
+    With ``TICK_METRICS_ENABLED`` the insert duration, batch size and
+    per-tick exchange-to-commit latency are recorded.
+
+    Returns:
+        int: Number of rows written
+    """
+    rows = normalize_ticks(tick_data)
+    if not rows:
+        return 0
+
+    started = time.time()
+    if getattr(settings, 'TICK_CANDLES_ENABLED', False):
+        from .candles import update_candles
+        # Ticks and their candle updates commit together
+        with transaction.atomic():
+            count = get_tick_writer(backend).write(rows)
+            update_candles(rows)
+    else:
+        count = get_tick_writer(backend).write(rows)
+
+    if metrics.metrics_enabled():
+        metrics.stage_duration('insert').observe(time.time() - started)
+        metrics.batch_size('insert').observe(count)
+        transaction.on_commit(lambda: _record_commit(rows))
+    if getattr(settings, 'TICK_QUOTE_CACHE_ENABLED', False):
+        from .quotes import update_quotes
+        transaction.on_commit(lambda: update_quotes(rows))
+    if getattr(settings, 'TICK_LIVE_PUBLISH_ENABLED', False):
+        from .live import publish_ticks
+        transaction.on_commit(lambda: publish_ticks(rows))
+    return count
+
+
+def _record_commit(rows: List[TickRow]):
+    committed = time.time()
+    metrics.tick_latency('commit').observe_many(committed - row.received_at.timestamp() for row in rows)
+    metrics.registry.counter('ticks_saved_total', 'Ticks committed to the database').inc(len(rows))
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import weakref
+from typing import Dict, Iterable, List, Optional, Set
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+from market_tick_system.redis_client import get_redis
+
+from .compact import datetime_to_ts, ts_to_datetime
+from .ingest import TickRow
+
+logger = logging.getLogger('tick_consumer')
+
+LIVE_CHANNEL_PREFIX = 'ticks:live:broker:'
+
+# Seconds between SSE comments that keep idle connections open through proxies
+KEEPALIVE_INTERVAL = 15
+
+
+def live_channel(broker_id: int) -> str:
+    """Pub/sub channel carrying one broker's ticks"""
+    return f"{LIVE_CHANNEL_PREFIX}{broker_id}"
+
+
+def publish_ticks(rows: Iterable[TickRow], client: Optional[redis.Redis] = None):
+    """
+    Publish the newest tick per script of a written batch, one message per broker.
+
+    Subscribers only ever want the latest value, so the rest of the batch
+    is not sent. Best effort: Redis errors are logged, never raised into
+    ingestion.
+    """
+    from .quotes import get_broker_ids, latest_per_script
+
+    latest = latest_per_script(rows)
+    if not latest:
+        return
+    by_broker: Dict[int, List[list]] = {}
+    for script_id, broker_id in get_broker_ids(latest).items():
+        quote = latest[script_id]
+        by_broker.setdefault(broker_id, []).append([
+            script_id,
+            str(quote.price),
+            None if quote.volume is None else str(quote.volume),
+            datetime_to_ts(quote.event_time),
+        ])
+
+    try:
+        pipe = (client or get_redis()).pipeline(transaction=False)
+        for broker_id, ticks in by_broker.items():
+            pipe.publish(live_channel(broker_id), json.dumps(ticks))
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not publish live ticks: {e}")
+
+
+class Subscriber:
+    """
+    One client's view of the live feed.
+
+    Holds at most one pending update per script: a client that reads slower
+    than ticks arrive skips straight to the latest value instead of
+    accumulating a backlog.
+    """
+
+    def __init__(self, script_ids: Iterable[int] = (), broker_ids: Iterable[int] = ()):
+        self.script_ids: Set[int] = set(script_ids)
+        self.broker_ids: Set[int] = set(broker_ids)
+        self.pending: Dict[int, str] = {}
+        self.event = asyncio.Event()
+        self.conflated = 0
+
+    def offer(self, script_id: int, message: str):
+        if script_id in self.pending:
+            self.conflated += 1
+        self.pending[script_id] = message
+        self.event.set()
+
+    async def next_batch(self, timeout: float) -> List[str]:
+        """Wait up to ``timeout`` seconds for updates and take them all"""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self.event.clear()
+        batch, self.pending = list(self.pending.values()), {}
+        return batch
+
+
+class LiveHub:
+    """
+    Per-process fan-out of the Redis live channels to Subscribers.
+
+    One pattern subscription is shared by every client of the process.
+    Each tick is serialized once and handed to the interested subscribers
+    through broker and script indexes, so the cost per message does not grow
+    with the number of clients that filter on other scripts.
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url or settings.REDIS_URL
+        self.everything: Set[Subscriber] = set()
+        self.by_broker: Dict[int, Set[Subscriber]] = {}
+        self.by_script: Dict[int, Set[Subscriber]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        subscribers = set(self.everything)
+        for group in (self.by_broker, self.by_script):
+            for members in group.values():
+                subscribers |= members
+        return len(subscribers)
+
+    def subscribe(self, subscriber: Subscriber):
+        if not subscriber.script_ids and not subscriber.broker_ids:
+            self.everything.add(subscriber)
+        for broker_id in subscriber.broker_ids:
+            self.by_broker.setdefault(broker_id, set()).add(subscriber)
+        for script_id in subscriber.script_ids:
+            self.by_script.setdefault(script_id, set()).add(subscriber)
+        self.start()
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.everything.discard(subscriber)
+        for group, keys in ((self.by_broker, subscriber.broker_ids), (self.by_script, subscriber.script_ids)):
+            for key in keys:
+                members = group.get(key)
+                if members is not None:
+                    members.discard(subscriber)
+                    if not members:
+                        del group[key]
+
+    def dispatch(self, broker_id: int, data):
+        """Hand one published message to the subscribers that want it"""
+        broker_subscribers = self.everything | self.by_broker.get(broker_id, set())
+        for script_id, price, volume, ts in json.loads(data):
+            targets = broker_subscribers | self.by_script.get(script_id, set())
+            if not targets:
+                continue
+            message = json.dumps({
+                'script_id': script_id,
+                'broker_id': broker_id,
+                'price': price,
+                'volume': volume,
+                'event_time': ts_to_datetime(ts).isoformat(),
+            })
+            for subscriber in targets:
+                subscriber.offer(script_id, message)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        backoff = 1
+        while True:
+            client = aioredis.Redis.from_url(self.url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(f"{LIVE_CHANNEL_PREFIX}*")
+                logger.info(f"Live hub subscribed to {LIVE_CHANNEL_PREFIX}*")
+                backoff = 1
+                async for message in pubsub.listen():
+                    if message['type'] != 'pmessage':
+                        continue
+                    channel = message['channel'].decode()
+                    try:
+                        self.dispatch(int(channel[len(LIVE_CHANNEL_PREFIX):]), message['data'])
+                    except (ValueError, TypeError) as e:
+                        logger.warning(f"Dropping malformed live message on {channel}: {e}")
+                    except Exception as e:
+                        # One bad message must not end the hub and stall every client
+                        logger.error(f"Error dispatching live message on {channel}: {e}", exc_info=True)
+            except asyncio.CancelledError:
+                raise
+            except redis.RedisError as e:
+                logger.error(f"Live hub lost Redis ({e}), reconnecting in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            except Exception as e:
+                logger.error(f"Live hub failed ({e}), restarting in {backoff}s", exc_info=True)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+
+# event loop -> LiveHub
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub() -> LiveHub:
+    """The hub of the running event loop (one per ASGI worker process)"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = LiveHub()
+    return hub
+
+
+async def sse_events(hub: LiveHub, subscriber: Subscriber, keepalive: float = KEEPALIVE_INTERVAL):
+    """Server-sent event stream of a subscriber's updates; unsubscribes when the client goes away"""
+    hub.subscribe(subscriber)
+    try:
+        yield ': connected\n\n'
+        while True:
+            batch = await subscriber.next_batch(keepalive)
+            if batch:
+                yield ''.join(f"data: {message}\n\n" for message in batch)
+            else:
+                yield ': keepalive\n\n'
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,101 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from tick_consumer.candles import RESOLUTIONS, aggregate, bucket_start, get_resolutions, CandleWriter
+from tick_consumer.models import Candle, Script
+from tick_consumer.queries import iter_ticks, parse_time
+from datetime import timedelta
+import time
+
+
+def parse_moment(value):
+    try:
+        return parse_time(value)
+    except ValueError as e:
+        raise CommandError(str(e))
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild candles from stored ticks, reading them in keyset-paged chunks. '
+        'Existing candles in the range are replaced; ticks ingested into the range '
+        'while it runs with TICK_CANDLES_ENABLED would be counted twice.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--script_id', type=int, action='append', help='Only these scripts (repeatable, default all)')
+        parser.add_argument('--start', help='Start date/datetime (default: first tick), rounded down to a whole bucket')
+        parser.add_argument('--end', help='End date/datetime, exclusive (default: no limit), rounded up to a whole bucket')
+        parser.add_argument(
+            '--resolution',
+            action='append',
+            choices=list(RESOLUTIONS),
+            help='Resolutions to rebuild (repeatable, default TICK_CANDLE_RESOLUTIONS)'
+        )
+        parser.add_argument(
+            '--storage',
+            choices=['ticks', 'compact'],
+            default=getattr(settings, 'TICK_STORAGE', 'ticks'),
+            help='Tick table to read (default: TICK_STORAGE)'
+        )
+        parser.add_argument('--chunk_size', type=int, default=10000, help='Ticks aggregated per upsert')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between chunks')
+
+    def handle(self, *args, **options):
+        resolutions = options['resolution'] or get_resolutions()
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk_size must be at least 1")
+
+        # Align to the widest resolution so no rebuilt bucket is partial
+        widest = max(resolutions, key=RESOLUTIONS.get)
+        start = end = None
+        if options['start']:
+            start = bucket_start(parse_moment(options['start']), widest)
+        if options['end']:
+            end = parse_moment(options['end'])
+            aligned = bucket_start(end, widest)
+            end = aligned if aligned == end else aligned + timedelta(microseconds=RESOLUTIONS[widest])
+        if start and end and start >= end:
+            raise CommandError("--start must be before --end")
+
+        scripts = Script.objects.order_by('id')
+        if options['script_id']:
+            scripts = scripts.filter(id__in=options['script_id'])
+
+        writer = CandleWriter()
+        total_ticks = 0
+        total_candles = 0
+        for script in scripts:
+            started = time.monotonic()
+            ticks = 0
+            candles = 0
+            chunk = []
+
+            stale = Candle.objects.filter(script=script, resolution__in=resolutions)
+            if start:
+                stale = stale.filter(bucket_start__gte=start)
+            if end:
+                stale = stale.filter(bucket_start__lt=end)
+            stale.delete()
+
+            for row in iter_ticks(script.id, start, end, options['chunk_size'], options['storage']):
+                chunk.append(row)
+                if len(chunk) >= options['chunk_size']:
+                    candles += writer.write(aggregate(chunk, resolutions))
+                    ticks += len(chunk)
+                    chunk = []
+                    time.sleep(options['sleep'])
+            if chunk:
+                candles += writer.write(aggregate(chunk, resolutions))
+                ticks += len(chunk)
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"  {script.name}: {ticks} ticks -> {candles} candle upserts "
+                f"({ticks / max(elapsed, 1e-6):,.0f} ticks/s)"
+            )
+            total_ticks += ticks
+            total_candles += candles
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {', '.join(resolutions)} candles from {total_ticks} ticks ({total_candles} upserts)"
+        ))
@@ -0,0 +1,101 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connections
+from tick_consumer.export import EXPORT_FORMATS, check_format, export_script
+from tick_consumer.models import Script
+from tick_consumer.queries import parse_time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import time
+
+
+def _init_worker():
+    """Give each worker process its own database connections"""
+    import django
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Export ticks to CSV, gzip CSV, NumPy .npz or Parquet files per script and day, '
+        'streaming keyset-paged chunks so memory stays flat, one process per script'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--script_id', type=int, action='append', help='Only these scripts (repeatable, default all)')
+        parser.add_argument('--start', help='Start (epoch ms, date or ISO datetime), inclusive')
+        parser.add_argument('--end', help='End (epoch ms, date or ISO datetime), exclusive')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='Output format (default csv)')
+        parser.add_argument('--output_dir', default='exports', help='Directory to write to (default ./exports)')
+        parser.add_argument('--no_split', action='store_true',
+                            help='One file per script instead of one per script and day (not with npz)')
+        parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                            help='Scripts exported in parallel (separate processes)')
+        parser.add_argument('--chunk_size', type=int, default=10000, help='Rows per query and per write')
+        parser.add_argument(
+            '--storage',
+            choices=['ticks', 'compact'],
+            default=getattr(settings, 'TICK_STORAGE', 'ticks'),
+            help='Tick table to read (default: TICK_STORAGE)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            check_format(options['format'])
+            start = parse_time(options['start']) if options['start'] else None
+            end = parse_time(options['end']) if options['end'] else None
+        except ImportError as e:
+            raise CommandError(f"--format={options['format']} needs an optional package: {e}")
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError("--chunk_size and --workers must be at least 1")
+        if options['no_split'] and options['format'] == 'npz':
+            # An npz file is built in memory, so a whole range in one file is unbounded
+            raise CommandError("--format=npz writes one file per day; --no_split is not supported")
+
+        scripts = Script.objects.order_by('id')
+        if options['script_id']:
+            scripts = scripts.filter(id__in=options['script_id'])
+        jobs = [
+            dict(
+                script_id=script_id,
+                symbol=symbol,
+                output_dir=options['output_dir'],
+                export_format=options['format'],
+                start=start,
+                end=end,
+                split_days=not options['no_split'],
+                chunk_size=options['chunk_size'],
+                storage=options['storage'],
+            )
+            for script_id, symbol in scripts.values_list('id', 'trading_symbol')
+        ]
+        if not jobs:
+            raise CommandError("No scripts to export")
+
+        started = time.monotonic()
+        total = 0
+        for result in self.run_jobs(jobs, options['workers']):
+            total += result['rows']
+            self.stdout.write(f"  script {result['script_id']}: {result['rows']} rows, {len(result['files'])} files")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {total} ticks to {options['output_dir']} in {elapsed:.1f}s "
+            f"({total / max(elapsed, 1e-6):,.0f} rows/s)"
+        ))
+
+    def run_jobs(self, jobs, workers):
+        if workers == 1 or len(jobs) == 1:
+            for job in jobs:
+                yield export_script(**job)
+            return
+
+        # Forked workers must not share this process's open connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_worker) as pool:
+            futures = [pool.submit(export_script, **job) for job in jobs]
+            for future in as_completed(futures):
+                yield future.result()
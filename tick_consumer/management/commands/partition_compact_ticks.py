@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from tick_consumer.compact import ensure_day_partitions
+
+
+class Command(BaseCommand):
+    help = 'Partition compact_ticks by day (MySQL) and create partitions for upcoming days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days_ahead',
+            type=int,
+            default=7,
+            help='Number of future days to keep partitions for (run daily, e.g. from cron)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            added = ensure_day_partitions(days_ahead=options['days_ahead'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if added:
+            self.stdout.write(self.style.SUCCESS(f"Added partitions: {', '.join(added)}"))
+        else:
+            self.stdout.write("Partitions already up to date")
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from market_tick_system.profiling import ROLES, request_profile
+from market_tick_system.redis_client import get_redis
+import logging
+import os
+import redis
+import signal
+
+logger = logging.getLogger('tick_consumer')
+
+
+class Command(BaseCommand):
+    help = (
+        'Profile running tick producers and workers: sample their stacks for a while '
+        'and write collapsed-stack (flamegraph) files to TICK_PROFILE_DIR'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=getattr(settings, 'TICK_PROFILE_DURATION', 30),
+            help='Seconds to sample (default: TICK_PROFILE_DURATION)'
+        )
+        parser.add_argument(
+            '--role',
+            choices=ROLES,
+            action='append',
+            help='Only profile processes of this role (repeatable, default: all)'
+        )
+        parser.add_argument(
+            '--interval_ms',
+            type=float,
+            help='Milliseconds between stack samples (default: TICK_PROFILE_INTERVAL_MS)'
+        )
+        parser.add_argument(
+            '--pid',
+            type=int,
+            action='append',
+            help='Signal these local processes (SIGUSR2, default length and interval) instead of using Redis'
+        )
+
+    def handle(self, *args, **options):
+        duration = options['duration']
+        if duration <= 0:
+            raise CommandError("--duration must be positive")
+
+        if options['pid']:
+            for pid in options['pid']:
+                try:
+                    os.kill(pid, signal.SIGUSR2)
+                except OSError as e:
+                    raise CommandError(f"Could not signal process {pid}: {e}")
+            self.stdout.write(self.style.SUCCESS(
+                f"Signalled {len(options['pid'])} processes; each profiles itself for "
+                f"{settings.TICK_PROFILE_DURATION:g}s"
+            ))
+            return
+
+        roles = options['role'] or ROLES
+        try:
+            request_id = request_profile(get_redis(), duration, roles, options['interval_ms'])
+        except redis.RedisError as e:
+            raise CommandError(f"Could not publish profiling request: {e}")
+
+        watch_interval = getattr(settings, 'TICK_PROFILE_WATCH_INTERVAL', 2)
+        logger.info(f"Requested profile {request_id} of {', '.join(roles)} for {duration:g}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"Requested a {duration:g}s profile of {', '.join(roles)} (request {request_id})"
+        ))
+        self.stdout.write(
+            f"Processes start within {watch_interval:g}s and write <role>-<host>-<pid>-<time>.collapsed "
+            f"and .timings.json to {settings.TICK_PROFILE_DIR} on their hosts"
+        )
@@ -0,0 +1,172 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection
+from tick_consumer.compact import datetime_to_ts, get_partitions
+from tick_consumer.models import CompactTick, Script, Ticks
+from datetime import timedelta
+from django.utils import timezone
+import logging
+import time
+
+logger = logging.getLogger('tick_consumer')
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete ticks older than their retention period in small, throttled, '
+        'primary-key-bounded chunks (drops whole compact_ticks partitions when possible)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=float,
+            help="Global retention in days; Script.additional_data['retention_days'] overrides it per script"
+        )
+        parser.add_argument('--script_id', type=int, action='append', help='Only prune these scripts (repeatable)')
+        parser.add_argument(
+            '--storage',
+            choices=['ticks', 'compact'],
+            default=getattr(settings, 'TICK_STORAGE', 'ticks'),
+            help='Which tick table to prune (default: TICK_STORAGE)'
+        )
+        parser.add_argument('--chunk_size', type=int, default=5000, help='Rows deleted per statement')
+        parser.add_argument('--sleep', type=float, default=0.1, help='Seconds to pause between chunks')
+        parser.add_argument('--dry_run', action='store_true', help='Report what would be pruned without deleting')
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        self.pause = options['sleep']
+        self.dry_run = options['dry_run']
+        if self.chunk_size < 1:
+            raise CommandError("--chunk_size must be at least 1")
+
+        now = timezone.now()
+        scripts = Script.objects.all()
+        if options['script_id']:
+            scripts = scripts.filter(id__in=options['script_id'])
+
+        # script_id -> cutoff datetime
+        policies = {}
+        for script_id, additional_data in scripts.values_list('id', 'additional_data'):
+            days = (additional_data or {}).get('retention_days', options['days'])
+            if days is not None:
+                policies[script_id] = now - timedelta(days=float(days))
+
+        if not policies:
+            raise CommandError("No retention policy: pass --days or set retention_days on scripts")
+
+        self.stdout.write(f"Pruning {options['storage']} for {len(policies)} scripts"
+                          f"{' (dry run)' if self.dry_run else ''}")
+
+        total = 0
+        # ts below which whole partitions are dropped (or would be, in a dry run)
+        self.dropped_before_ts = None
+        if options['storage'] == 'compact':
+            total += self.drop_expired_partitions(policies, all_scripts=not options['script_id'])
+            for script_id, cutoff in policies.items():
+                total += self.prune_compact(script_id, cutoff)
+        else:
+            for script_id, cutoff in policies.items():
+                total += self.prune_ticks(script_id, cutoff)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would delete' if self.dry_run else 'Deleted'} {total} ticks"
+        ))
+
+    def _report(self, script_id, deleted, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"  script {script_id}: {deleted} rows ({deleted / max(elapsed, 1e-6):,.0f} rows/s)")
+
+    def prune_ticks(self, script_id, cutoff):
+        """Delete one script's expired Ticks in chunks located via the (script, received_at_producer) index"""
+        expired = Ticks.objects.filter(script_id=script_id, received_at_producer__lt=cutoff)
+        if self.dry_run:
+            count = expired.count()
+            self.stdout.write(f"  script {script_id}: {count} rows before {cutoff.isoformat()}")
+            return count
+
+        deleted = 0
+        chunks = 0
+        started = time.monotonic()
+        while True:
+            ids = list(expired.order_by('received_at_producer').values_list('id', flat=True)[:self.chunk_size])
+            if not ids:
+                break
+            # Each chunk is its own short autocommit transaction
+            deleted += Ticks.objects.filter(id__in=ids).delete()[0]
+            chunks += 1
+            if chunks % 20 == 0:
+                self._report(script_id, deleted, started)
+            time.sleep(self.pause)
+
+        self._report(script_id, deleted, started)
+        return deleted
+
+    def prune_compact(self, script_id, cutoff):
+        """Delete one script's expired compact ticks in (script_id, ts) primary-key ranges"""
+        cutoff_ts = datetime_to_ts(cutoff)
+        expired = CompactTick.objects.filter(script_id=script_id, ts__lt=cutoff_ts)
+        if self.dry_run:
+            # Rows in the partitions reported as dropped are already counted
+            if self.dropped_before_ts is not None:
+                expired = expired.filter(ts__gte=self.dropped_before_ts)
+            count = expired.count()
+            self.stdout.write(f"  script {script_id}: {count} rows before {cutoff.isoformat()}")
+            return count
+
+        deleted = 0
+        chunks = 0
+        started = time.monotonic()
+        while True:
+            bounds = list(expired.order_by('ts').values_list('ts', flat=True)[self.chunk_size - 1:self.chunk_size])
+            if not bounds:
+                # Fewer than chunk_size rows left
+                deleted += expired.delete()[0]
+                break
+            deleted += expired.filter(ts__lte=bounds[0]).delete()[0]
+            chunks += 1
+            if chunks % 20 == 0:
+                self._report(script_id, deleted, started)
+            time.sleep(self.pause)
+
+        self._report(script_id, deleted, started)
+        return deleted
+
+    def drop_expired_partitions(self, policies, all_scripts):
+        """
+        Drop whole day partitions of compact_ticks that every script has expired.
+
+        Only done when pruning all scripts, since a partition holds every
+        script's rows for its day. Returns the number of rows dropped.
+        """
+        if connection.vendor != 'mysql' or not all_scripts:
+            return 0
+
+        # Scripts with no policy keep their rows forever
+        if Script.objects.exclude(id__in=policies.keys()).exists():
+            return 0
+
+        safe_before = datetime_to_ts(min(policies.values()))
+        expired = [(name, upper) for name, upper in get_partitions() if upper is not None and upper <= safe_before]
+        if not expired:
+            return 0
+        partitions = [name for name, _ in expired]
+
+        table = connection.ops.quote_name(CompactTick._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COALESCE(SUM(TABLE_ROWS), 0) FROM information_schema.PARTITIONS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                f"AND PARTITION_NAME IN ({', '.join(['%s'] * len(partitions))})",
+                [CompactTick._meta.db_table, *partitions]
+            )
+            estimated_rows = int(cursor.fetchone()[0])
+
+            self.stdout.write(f"  dropping partitions {', '.join(partitions)} (~{estimated_rows} rows)")
+            self.dropped_before_ts = max(upper for _, upper in expired)
+            if not self.dry_run:
+                cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(partitions)}")
+                logger.info(f"Dropped compact_ticks partitions: {', '.join(partitions)}")
+
+        return estimated_rows
@@ -0,0 +1,187 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import close_old_connections
+from market_tick_system import metrics, profiling
+from market_tick_system.redis_client import get_redis
+from tick_consumer.models import Broker
+from tick_consumer.streams import dead_letter, dead_letter_key, decode_entries, ensure_group, stream_key
+from tick_consumer.tasks import save_ticks
+import logging
+import os
+import signal
+import socket
+import time
+
+logger = logging.getLogger('tick_consumer')
+
+
+class Command(BaseCommand):
+    help = 'Consume ticks from Redis Streams (TICK_TRANSPORT=redis_streams) and bulk insert them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--broker_id',
+            type=int,
+            action='append',
+            help='Broker ID whose stream to consume (repeatable, default: all brokers)'
+        )
+        parser.add_argument(
+            '--consumer',
+            default=f"{socket.gethostname()}-{os.getpid()}",
+            help='Consumer name within the group (default: hostname-pid)'
+        )
+        parser.add_argument('--count', type=int, default=5000, help='Max entries per read')
+        parser.add_argument('--block', type=int, default=1000, help='Max ms to block waiting for entries')
+        parser.add_argument(
+            '--claim_idle',
+            type=int,
+            default=60000,
+            help='Reclaim entries pending longer than this many ms (from crashed consumers)'
+        )
+        parser.add_argument(
+            '--max_deliveries',
+            type=int,
+            default=getattr(settings, 'TICK_STREAM_MAX_DELIVERIES', 5),
+            help='Move entries delivered this many times without success to <stream>:dead '
+                 '(default: TICK_STREAM_MAX_DELIVERIES)'
+        )
+        parser.add_argument(
+            '--claim_interval',
+            type=float,
+            default=30,
+            help='Seconds between pending-entry reclaim passes'
+        )
+
+    def handle(self, *args, **options):
+        broker_ids = options['broker_id'] or list(Broker.objects.values_list('id', flat=True))
+        if not broker_ids:
+            raise CommandError("No brokers configured")
+
+        self.client = get_redis()
+        self.group = settings.TICK_STREAM_GROUP
+        self.consumer = options['consumer']
+        self.count = options['count']
+        self.max_deliveries = options['max_deliveries']
+        if self.max_deliveries < 1:
+            raise CommandError("--max_deliveries must be at least 1")
+        self.running = True
+
+        keys = [stream_key(broker_id) for broker_id in broker_ids]
+        for key in keys:
+            ensure_group(self.client, key, self.group)
+
+        def signal_handler(sig, frame):
+            self.stdout.write("\nShutting down tick consumer...")
+            self.running = False
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Consuming {len(keys)} streams as {self.group}/{self.consumer}"
+        ))
+        self.transport_duration = None
+        if metrics.start_pusher('stream_consumer', consumer=self.consumer):
+            self.transport_duration = metrics.stage_duration('transport')
+        profiling.enable('stream_consumer')
+
+        last_claim = 0.0
+        while self.running:
+            try:
+                if time.monotonic() - last_claim >= options['claim_interval']:
+                    for key in keys:
+                        self.reclaim_pending(key, options['claim_idle'])
+                    last_claim = time.monotonic()
+
+                response = self.client.xreadgroup(
+                    self.group,
+                    self.consumer,
+                    {key: '>' for key in keys},
+                    count=self.count,
+                    block=options['block']
+                )
+                for key, entries in response or []:
+                    self.process(key, entries)
+
+            except Exception as e:
+                # Unacknowledged entries stay pending and are retried via reclaim
+                logger.error(f"Error consuming tick streams: {e}", exc_info=True)
+                time.sleep(1)
+
+        metrics.stop_pusher()
+        profiling.disable()
+
+    def process(self, key, entries):
+        """Insert one block of entries and acknowledge it once committed"""
+        if not entries:
+            return
+        ids, rows = decode_entries(entries)
+        if self.transport_duration:
+            # Entry ids start with the epoch ms at which Redis appended them
+            now = time.time()
+            self.transport_duration.observe_many(
+                now - int(entry_id.split(b'-', 1)[0]) / 1000 for entry_id in ids
+            )
+        close_old_connections()
+        if rows:
+            save_ticks(rows)
+        self.client.xack(key, self.group, *ids)
+        logger.debug(f"Consumed {len(rows)} ticks from {key}")
+
+    def reclaim_pending(self, key, min_idle_ms):
+        """
+        Take over entries left pending by consumers that stopped
+        acknowledging, or by inserts that failed.
+
+        Entries already delivered ``max_deliveries`` times are moved to the
+        dead-letter stream instead of being retried. If a reclaimed block
+        fails again, its entries are retried one by one, so a single bad
+        entry does not hold back the rest.
+        """
+        start_id = '0-0'
+        while self.running:
+            next_id, entries, *_ = self.client.xautoclaim(
+                key, self.group, self.consumer, min_idle_ms, start_id=start_id, count=self.count
+            )
+            if entries:
+                logger.warning(f"Reclaimed {len(entries)} pending entries on {key}")
+                entries = self.dead_letter_exhausted(key, entries)
+                try:
+                    self.process(key, entries)
+                except Exception as e:
+                    logger.error(f"Reclaimed entries on {key} failed again ({e}), retrying one by one")
+                    for entry in entries:
+                        try:
+                            self.process(key, [entry])
+                        except Exception as e:
+                            logger.error(f"Stream entry {entry[0]!r} on {key} failed: {e}")
+            if next_id in (b'0-0', '0-0'):
+                break
+            start_id = next_id
+
+    def dead_letter_exhausted(self, key, entries):
+        """Move entries delivered more than max_deliveries times to the dead-letter stream; returns the rest"""
+        # XAUTOCLAIM has just counted this delivery; XPENDING reports the total
+        pipe = self.client.pipeline(transaction=False)
+        for entry_id, _ in entries:
+            pipe.xpending_range(key, self.group, min=entry_id, max=entry_id, count=1)
+        deliveries = {}
+        for pending in pipe.execute():
+            for info in pending:
+                deliveries[info['message_id']] = info['times_delivered']
+
+        exhausted = [(entry_id, fields) for entry_id, fields in entries
+                     if deliveries.get(entry_id, 0) > self.max_deliveries]
+        if not exhausted:
+            return entries
+        # Trimmed entries have no fields left to keep
+        dead_letter(self.client, dead_letter_key(key), [
+            (entry_id, {**fields, 'deliveries': deliveries[entry_id]}) for entry_id, fields in exhausted if fields
+        ])
+        self.client.xack(key, self.group, *[entry_id for entry_id, _ in exhausted])
+        logger.error(
+            f"Moved {len(exhausted)} entries delivered more than {self.max_deliveries} times "
+            f"from {key} to {dead_letter_key(key)}"
+        )
+        dead = {entry_id for entry_id, _ in exhausted}
+        return [entry for entry in entries if entry[0] not in dead]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tick_consumer', '0002_alter_ticks_volume'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompactTick',
+            fields=[
+                ('ts', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('price', models.BigIntegerField()),
+                ('volume', models.BigIntegerField(blank=True, null=True)),
+                ('script', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='compact_ticks', to='tick_consumer.script')),
+            ],
+            options={
+                'db_table': 'compact_ticks',
+                'managed': False,
+            },
+        ),
+        # The model is unmanaged so the table can have the clustered
+        # (script_id, ts) primary key Django cannot express.
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE compact_ticks (
+                    script_id BIGINT NOT NULL,
+                    ts BIGINT NOT NULL,
+                    price BIGINT NOT NULL,
+                    volume BIGINT NULL,
+                    PRIMARY KEY (script_id, ts)
+                )
+            """,
+            reverse_sql="DROP TABLE compact_ticks",
+        ),
+    ]
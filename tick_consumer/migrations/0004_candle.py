@@ -0,0 +1,34 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tick_consumer', '0003_compacttick'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Candle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1s', '1 second'), ('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('volume', models.DecimalField(blank=True, decimal_places=8, max_digits=30, null=True)),
+                ('tick_count', models.PositiveIntegerField(default=0)),
+                ('first_tick_at', models.DateTimeField()),
+                ('last_tick_at', models.DateTimeField()),
+                ('script', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='tick_consumer.script')),
+            ],
+            options={
+                'db_table': 'candles',
+                'ordering': ['script', 'resolution', '-bucket_start'],
+                'unique_together': {('script', 'resolution', 'bucket_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 02:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tick_consumer', '0004_candle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderBookSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('captured_at', models.DateTimeField()),
+                ('last_update_id', models.BigIntegerField()),
+                ('best_bid', models.DecimalField(blank=True, decimal_places=8, max_digits=20, null=True)),
+                ('best_ask', models.DecimalField(blank=True, decimal_places=8, max_digits=20, null=True)),
+                ('bids', models.JSONField(default=list)),
+                ('asks', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('script', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_book_snapshots', to='tick_consumer.script')),
+            ],
+            options={
+                'db_table': 'order_book_snapshots',
+                'ordering': ['-captured_at'],
+                'indexes': [models.Index(fields=['script', '-captured_at'], name='order_book__script__910544_idx')],
+            },
+        ),
+    ]
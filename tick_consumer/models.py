@@ -79,3 +79,94 @@ class Ticks(models.Model):
 
     def __str__(self):
         return f"{self.script.trading_symbol} @ {self.tick_value}"
+
+
+class CompactTick(models.Model):
+    """
+    Compact, write-once tick storage (opt-in with TICK_STORAGE='compact').
+
+    Price and volume are scaled integers; the scale is per script
+    (``Script.additional_data['price_scale']``/``['volume_scale']``,
+    default 8) and must not change once a script has rows. The table's
+    real primary key is the clustered (script_id, ts) created by migration
+    0003; Django 5.0 has no composite keys, so ``ts`` is declared as the
+    primary key only to satisfy the ORM. Read and write through
+    ``tick_consumer.compact``/``values_list()``, not ``get()``/``save()``.
+    """
+    script = models.ForeignKey(
+        Script,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,  # partitioned InnoDB tables cannot have foreign keys
+        related_name='compact_ticks'
+    )
+    ts = models.BigIntegerField(primary_key=True)  # event time, epoch microseconds
+    price = models.BigIntegerField()
+    volume = models.BigIntegerField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'compact_ticks'
+        managed = False
+
+    def __str__(self):
+        return f"{self.script_id} @ {self.ts}"
+
+
+class Candle(models.Model):
+    """OHLCV bar per script and resolution, maintained incrementally at ingestion"""
+    RESOLUTIONS = [
+        ('1s', '1 second'),
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    script = models.ForeignKey(
+        Script,
+        on_delete=models.CASCADE,
+        related_name='candles'
+    )
+    resolution = models.CharField(max_length=2, choices=RESOLUTIONS)
+    bucket_start = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    # Binance ticker volume is a rolling 24h total, so this is the last value seen in the bucket
+    volume = models.DecimalField(max_digits=30, decimal_places=8, null=True, blank=True)
+    tick_count = models.PositiveIntegerField(default=0)
+    first_tick_at = models.DateTimeField()
+    last_tick_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'candles'
+        ordering = ['script', 'resolution', '-bucket_start']
+        unique_together = [['script', 'resolution', 'bucket_start']]
+
+    def __str__(self):
+        return f"{self.script_id} {self.resolution} @ {self.bucket_start}"
+
+
+class OrderBookSnapshot(models.Model):
+    """Top levels of a script's order book, sampled by the producer's order book engine"""
+    script = models.ForeignKey(
+        Script,
+        on_delete=models.CASCADE,
+        related_name='order_book_snapshots'
+    )
+    captured_at = models.DateTimeField()  # exchange event time of the last applied diff
+    last_update_id = models.BigIntegerField()
+    best_bid = models.DecimalField(max_digits=20, decimal_places=8, null=True, blank=True)
+    best_ask = models.DecimalField(max_digits=20, decimal_places=8, null=True, blank=True)
+    bids = models.JSONField(default=list)  # [[price, quantity], ...], best first
+    asks = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'order_book_snapshots'
+        ordering = ['-captured_at']
+        indexes = [
+            models.Index(fields=['script', '-captured_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.script_id} book @ {self.captured_at}"
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .ingest import TickRow
+from .models import Ticks
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# Rows fetched from the driver per round-trip while streaming a page
+FETCH_SIZE = 2000
+
+
+def parse_time(value: str) -> datetime:
+    """
+    Parse epoch milliseconds, a YYYY-MM-DD date or an ISO datetime (UTC if naive).
+
+    Raises:
+        ValueError: If the value is none of those
+    """
+    if value.isdigit():
+        return EPOCH + timedelta(milliseconds=int(value))
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        moment = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def encode_cursor(received_at: datetime, key: int) -> str:
+    """Opaque keyset cursor for the row after (received_at, key)"""
+    return f"{(received_at - EPOCH) // MICROSECOND}-{key}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Inverse of encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    ts, _, key = cursor.partition('-')
+    return EPOCH + timedelta(microseconds=int(ts)), int(key)
+
+
+def iter_tick_values(script_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     after: Optional[Tuple[datetime, int]] = None, chunk_size: int = 10000,
+                     storage: Optional[str] = None) -> Iterator[Tuple[int, Decimal, Optional[Decimal], datetime]]:
+    """
+    Read a script's ticks in time order, ``start`` inclusive and ``end`` exclusive.
+
+    Pages with a keyset on (received_at_producer, id) over the
+    (script, received_at_producer) index instead of OFFSET, so each chunk
+    costs the same however deep into the range it is. Each chunk is streamed
+    from the driver with ``values_list().iterator()``, so no model instances
+    are built and memory stays bounded for any range. Reads ``compact_ticks``
+    when ``storage`` (default ``TICK_STORAGE``) is 'compact'.
+
+    Args:
+        after: Resume after this (received_at, key), as returned in a cursor
+
+    Yields:
+        tuple: (key, tick_value, volume, received_at); the key is the row id,
+        or the microsecond timestamp for compact storage
+    """
+    storage = storage or getattr(settings, 'TICK_STORAGE', 'ticks')
+    if storage == 'compact':
+        from .compact import datetime_to_ts, iter_compact_ticks
+        if after is not None:
+            resume = after[0] + MICROSECOND
+            start = resume if start is None else max(start, resume)
+        for row in iter_compact_ticks(script_id, start, end, chunk_size):
+            yield datetime_to_ts(row.received_at), row.tick_value, row.volume, row.received_at
+        return
+
+    queryset = Ticks.objects.filter(script_id=script_id)
+    if start is not None:
+        queryset = queryset.filter(received_at_producer__gte=start)
+    if end is not None:
+        queryset = queryset.filter(received_at_producer__lt=end)
+    queryset = queryset.order_by('received_at_producer', 'id')
+
+    last = after
+    while True:
+        page = queryset
+        if last is not None:
+            last_at, last_id = last
+            page = queryset.filter(
+                Q(received_at_producer__gt=last_at) | Q(received_at_producer=last_at, id__gt=last_id)
+            )
+        count = 0
+        values = page.values_list('id', 'tick_value', 'volume', 'received_at_producer')[:chunk_size]
+        for tick_id, tick_value, volume, received_at in values.iterator(chunk_size=FETCH_SIZE):
+            count += 1
+            last = (received_at, tick_id)
+            yield tick_id, tick_value, volume, received_at
+        if count < chunk_size:
+            return
+
+
+def iter_ticks(script_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+               chunk_size: int = 10000, storage: Optional[str] = None) -> Iterator[TickRow]:
+    """Like iter_tick_values, yielding TickRows"""
+    for _, tick_value, volume, received_at in iter_tick_values(
+            script_id, start, end, chunk_size=chunk_size, storage=storage):
+        yield TickRow(script_id, tick_value, volume, received_at)
@@ -0,0 +1,190 @@
+import logging
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import redis
+from django.conf import settings
+
+from market_tick_system.redis_client import get_redis
+
+from .compact import datetime_to_ts, ts_to_datetime
+from .ingest import TickRow
+from .models import CompactTick, Script, Ticks
+
+logger = logging.getLogger('tick_consumer')
+
+QUOTE_KEY_PREFIX = 'ticks:quotes:broker:'
+
+# Sets each script's field only if its event timestamp is newer than the
+# cached one, so out-of-order batches from parallel workers never roll a
+# quote back. ARGV holds (script_id, ts, value) triples.
+UPDATE_SCRIPT = """
+local updated = 0
+for i = 1, #ARGV, 3 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    local ts = tonumber(ARGV[i + 1])
+    if not current or tonumber(string.match(current, '^(%d+)')) < ts then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        updated = updated + 1
+    end
+end
+return updated
+"""
+
+# script_id -> broker_id; a script never moves between brokers
+_broker_cache: Dict[int, int] = {}
+
+
+class Quote(NamedTuple):
+    """Latest tick of a script"""
+    script_id: int
+    price: Decimal
+    volume: Optional[Decimal]
+    event_time: datetime
+
+
+def quote_key(broker_id: int) -> str:
+    """Redis hash holding the latest quote of each script of one broker"""
+    return f"{QUOTE_KEY_PREFIX}{broker_id}"
+
+
+def encode_quote(quote: Quote) -> str:
+    """Pack a quote as 'ts_us|price|volume' (ts first so Lua can compare it)"""
+    volume = '' if quote.volume is None else str(quote.volume)
+    return f"{datetime_to_ts(quote.event_time)}|{quote.price}|{volume}"
+
+
+def decode_quote(script_id: int, value: bytes) -> Quote:
+    ts, price, volume = value.decode().split('|')
+    return Quote(script_id, Decimal(price), Decimal(volume) if volume else None, ts_to_datetime(int(ts)))
+
+
+def get_broker_ids(script_ids: Iterable[int]) -> Dict[int, int]:
+    """Return the broker id of each known script id"""
+    script_ids = set(script_ids)
+    missing = [script_id for script_id in script_ids if script_id not in _broker_cache]
+    if missing:
+        _broker_cache.update(Script.objects.filter(id__in=missing).values_list('id', 'broker_id'))
+    return {script_id: _broker_cache[script_id] for script_id in script_ids if script_id in _broker_cache}
+
+
+def clear_broker_cache():
+    _broker_cache.clear()
+
+
+def latest_per_script(rows: Iterable[TickRow]) -> Dict[int, Quote]:
+    """Reduce a batch of ticks to the newest one per script"""
+    latest = {}
+    for row in rows:
+        current = latest.get(row.script_id)
+        if current is None or row.received_at >= current.event_time:
+            latest[row.script_id] = Quote(row.script_id, row.tick_value, row.volume, row.received_at)
+    return latest
+
+
+def store_quotes(quotes: Dict[int, Quote], client: Optional[redis.Redis] = None) -> int:
+    """
+    Write quotes to the cache with one pipelined round-trip (one script call per broker).
+
+    Returns:
+        int: Number of quotes that replaced an older one
+    """
+    if not quotes:
+        return 0
+    client = client or get_redis()
+    by_broker: Dict[int, List[str]] = {}
+    for script_id, broker_id in get_broker_ids(quotes).items():
+        quote = quotes[script_id]
+        by_broker.setdefault(broker_id, []).extend(
+            (str(script_id), str(datetime_to_ts(quote.event_time)), encode_quote(quote))
+        )
+
+    pipe = client.pipeline(transaction=False)
+    for broker_id, args in by_broker.items():
+        pipe.eval(UPDATE_SCRIPT, 1, quote_key(broker_id), *args)
+    return sum(pipe.execute())
+
+
+def update_quotes(rows: Iterable[TickRow], client: Optional[redis.Redis] = None):
+    """
+    Refresh the cache from a written batch of ticks.
+
+    The cache is best effort: Redis errors are logged, never raised into
+    ingestion.
+    """
+    try:
+        store_quotes(latest_per_script(rows), client)
+    except redis.RedisError as e:
+        logger.warning(f"Could not update quote cache: {e}")
+
+
+def _latest_from_db(script_id: int) -> Optional[Quote]:
+    if getattr(settings, 'TICK_STORAGE', 'ticks') == 'compact':
+        from .compact import get_scales
+        from .wire import from_fixed
+        row = CompactTick.objects.filter(script_id=script_id).order_by('-ts').values_list(
+            'ts', 'price', 'volume').first()
+        if row is None:
+            return None
+        price_scale, volume_scale = get_scales([script_id])[script_id]
+        ts, price, volume = row
+        return Quote(
+            script_id,
+            from_fixed(price, price_scale),
+            None if volume is None else from_fixed(volume, volume_scale),
+            ts_to_datetime(ts),
+        )
+
+    row = Ticks.objects.filter(script_id=script_id).order_by('-received_at_producer').values_list(
+        'tick_value', 'volume', 'received_at_producer').first()
+    return None if row is None else Quote(script_id, *row)
+
+
+def get_latest_quotes(script_ids: Iterable[int], client: Optional[redis.Redis] = None) -> Dict[int, Quote]:
+    """
+    Return the latest quote of each script.
+
+    Cached quotes are read with one pipelined ``HMGET`` per broker in a
+    single round-trip. Scripts missing from the cache (cold cache, or Redis
+    unavailable) are read from the tick table with an index-backed
+    ``LIMIT 1`` and written back to the cache. Without
+    ``TICK_QUOTE_CACHE_ENABLED`` nothing refreshes the cache, so every
+    quote is read from the tick table. Scripts with no ticks (or unknown
+    ids) are left out.
+    """
+    broker_ids = get_broker_ids(script_ids)
+    by_broker: Dict[int, List[int]] = {}
+    for script_id, broker_id in broker_ids.items():
+        by_broker.setdefault(broker_id, []).append(script_id)
+
+    quotes = {}
+    cache_ok = getattr(settings, 'TICK_QUOTE_CACHE_ENABLED', False)
+    if cache_ok:
+        client = client or get_redis()
+        try:
+            pipe = client.pipeline(transaction=False)
+            for broker_id, ids in by_broker.items():
+                pipe.hmget(quote_key(broker_id), ids)
+            for ids, values in zip(by_broker.values(), pipe.execute()):
+                for script_id, value in zip(ids, values):
+                    if value is not None:
+                        quotes[script_id] = decode_quote(script_id, value)
+        except redis.RedisError as e:
+            logger.warning(f"Quote cache unavailable, reading from the database: {e}")
+            cache_ok = False
+
+    misses = {}
+    for script_id in broker_ids:
+        if script_id not in quotes:
+            quote = _latest_from_db(script_id)
+            if quote is not None:
+                misses[script_id] = quote
+    quotes.update(misses)
+
+    if misses and cache_ok:
+        try:
+            store_quotes(misses, client)
+        except redis.RedisError as e:
+            logger.warning(f"Could not warm quote cache: {e}")
+    return quotes
@@ -0,0 +1,34 @@
+import logging
+from typing import Optional
+
+import redis
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from market_tick_system.redis_client import get_redis
+
+from .models import Script
+
+logger = logging.getLogger('tick_consumer')
+
+# Incremented on every Script change; producers poll it to refresh their subscriptions
+SCRIPTS_VERSION_KEY = 'ticks:scripts:version'
+
+
+def get_scripts_version(client: Optional[redis.Redis] = None) -> Optional[bytes]:
+    return (client or get_redis()).get(SCRIPTS_VERSION_KEY)
+
+
+def bump_scripts_version(client: Optional[redis.Redis] = None):
+    """Best effort: producers pick the change up on the next bump or restart"""
+    try:
+        (client or get_redis()).incr(SCRIPTS_VERSION_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Could not bump script version: {e}")
+
+
+@receiver(post_save, sender=Script)
+@receiver(post_delete, sender=Script)
+def script_changed(sender, instance, **kwargs):
+    transaction.on_commit(bump_scripts_version)
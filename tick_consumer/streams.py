@@ -0,0 +1,118 @@
+import logging
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import redis
+from django.conf import settings
+
+from .wire import decode_batch, encode_batch
+
+logger = logging.getLogger('tick_consumer')
+
+STREAM_KEY_PREFIX = 'ticks:stream:broker:'
+
+
+def stream_key(broker_id: int) -> str:
+    """Redis Stream holding the ticks of one broker"""
+    return f"{STREAM_KEY_PREFIX}{broker_id}"
+
+
+def dead_letter_key(key) -> str:
+    """Stream that entries of ``key`` go to once they have failed too often"""
+    return f"{key.decode() if isinstance(key, bytes) else key}:dead"
+
+
+def dead_letter(client: redis.Redis, key: str, entries: List[Tuple[object, Dict]]):
+    """
+    Append failed messages to the dead-letter stream ``key``, trimmed like
+    the tick streams. Each entry is ``(origin, fields)``: ``origin`` (the
+    stream entry id or task id) is stored next to the original fields.
+    """
+    pipe = client.pipeline(transaction=False)
+    for origin, fields in entries:
+        pipe.xadd(key, {**fields, 'origin': origin}, maxlen=settings.TICK_STREAM_MAXLEN, approximate=True)
+    pipe.execute()
+
+
+def encode_entry(tick: Sequence) -> Dict[str, object]:
+    """
+    Convert a compact tick row to stream entry fields.
+
+    Args:
+        tick: [script_id, tick_value, volume, received_at_producer (epoch ms)]
+    """
+    script_id, tick_value, volume, received_at = tick
+    return {'s': script_id, 'p': tick_value, 'v': volume or '', 't': received_at}
+
+
+def decode_entry(fields: Dict[bytes, bytes]) -> List:
+    """Convert stream entry fields back to a compact tick row"""
+    volume = fields.get(b'v')
+    return [
+        int(fields[b's']),
+        fields[b'p'].decode(),
+        volume.decode() if volume else None,
+        int(fields[b't']),
+    ]
+
+
+class RedisStreamSink:
+    """
+    Producer-side flush callback that appends ticks to a broker's stream.
+
+    Each batch is written with one pipelined round-trip of ``XADD`` calls,
+    trimmed with approximate ``MAXLEN`` so the stream stays bounded if
+    consumers fall behind. With ``wire_format='columnar'`` the whole batch
+    is one entry holding a packed columnar batch (see ``wire``) instead.
+    """
+
+    def __init__(self, client: redis.Redis, broker_id: int, maxlen: Optional[int] = None,
+                 wire_format: str = 'json'):
+        self.client = client
+        self.key = stream_key(broker_id)
+        self.maxlen = maxlen or settings.TICK_STREAM_MAXLEN
+        self.wire_format = wire_format
+
+    def __call__(self, batch: List[Sequence]):
+        if self.wire_format == 'columnar':
+            self.client.xadd(self.key, {'b': encode_batch(batch)}, maxlen=self.maxlen, approximate=True)
+            return
+
+        pipe = self.client.pipeline(transaction=False)
+        for tick in batch:
+            pipe.xadd(self.key, encode_entry(tick), maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+
+def ensure_group(client: redis.Redis, key: str, group: str):
+    """Create the consumer group (and the stream) if they do not exist yet"""
+    try:
+        client.xgroup_create(key, group, id='0', mkstream=True)
+        logger.info(f"Created consumer group {group} on {key}")
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def decode_entries(entries) -> Tuple[List[bytes], List[List]]:
+    """
+    Split stream entries into ids and tick rows.
+
+    Entries trimmed from the stream while pending come back with no fields;
+    their ids are returned so they can be acknowledged, but no row is made.
+    Malformed entries are logged, acknowledged and dropped.
+    """
+    ids = []
+    rows = []
+    for entry_id, fields in entries:
+        ids.append(entry_id)
+        if not fields:
+            continue
+        try:
+            if b'b' in fields:
+                rows.extend(decode_batch(fields[b'b']))
+            else:
+                rows.append(decode_entry(fields))
+        except (KeyError, ValueError, UnicodeDecodeError, struct.error) as e:
+            logger.warning(f"Dropping malformed stream entry {entry_id!r}: {e}")
+    return ids, rows
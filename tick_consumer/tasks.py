@@ -1,8 +1,13 @@
 from celery import shared_task
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from .models import Broker, Script, Ticks
+from django.db import IntegrityError
+from market_tick_system import metrics, profiling
+from .models import Broker, OrderBookSnapshot, Script, Ticks
+from .ingest import parse_received_at, write_ticks
+from .wire import split_trace, unpack_ticks
 import logging
-from datetime import datetime
+import time
 
 logger = logging.getLogger('tick_consumer')
 
@@ -51,53 +56,182 @@ def get_broker(broker_id):
         raise
 
 
-@shared_task
-def consume_tick(tick_data):
+def _script_id(tick):
+    return int(tick['script_id'] if isinstance(tick, dict) else tick[0])
+
+
+def record_transport(payload):
+    """
+    Record how long a traced consume_tick payload took from the producer's
+    send to this worker, and make sure this process publishes its metrics.
+    """
+    if not metrics.metrics_enabled():
+        return
+    metrics.start_pusher('worker')
+    _, sent_at = split_trace(payload)
+    if sent_at is not None:
+        metrics.stage_duration('transport').observe(time.time() - sent_at)
+
+
+@profiling.timed('save_ticks')
+def save_ticks(tick_data):
     """
     Bulk save tick data to MySQL database.
 
     Args:
-        tick_data (list[dict]): List of tick dictionaries with format:
+        tick_data (list): List of ticks, each either a dictionary with format:
             {
                 'script_id': int,
                 'tick_value': str/float/Decimal,
                 'volume': str/float/Decimal or None,
-                'received_at_producer': datetime or ISO string
+                'received_at_producer': datetime, ISO string or epoch ms
             }
+            or a compact row in the same field order:
+            [script_id, tick_value, volume, received_at_producer]
+            A columnar batch envelope from ``wire.encode_payload``, or a
+            traced envelope from ``wire.trace_payload``, is also accepted in
+            place of the list.
 
     Returns:
         dict: Status with count of saved ticks
     """
+    if not tick_data:
+        logger.warning("Empty tick_data received")
+        return {'status': 'success', 'count': 0}
+
+    record_transport(tick_data)
+    # Ensure tick_data is a list (decodes columnar and traced batches)
+    tick_data = unpack_ticks(tick_data)
+
+    # Validate and write with the backend selected by TICK_INGEST_BACKEND
     try:
-        if not tick_data:
-            logger.warning("Empty tick_data received")
-            return {'status': 'success', 'count': 0}
-
-        # Ensure tick_data is a list
-        if isinstance(tick_data, dict):
-            tick_data = [tick_data]
-
-        tick_objects = []
-        for tick in tick_data:
-            # Parse datetime if it's a string
-            received_at = tick['received_at_producer']
-            if isinstance(received_at, str):
-                received_at = datetime.fromisoformat(received_at.replace('Z', '+00:00'))
-
-            tick_obj = Ticks(
-                script_id=tick['script_id'],
-                tick_value=tick['tick_value'],
-                volume=tick.get('volume'),
-                received_at_producer=received_at
-            )
-            tick_objects.append(tick_obj)
-
-        # Bulk create for performance
-        Ticks.objects.bulk_create(tick_objects, batch_size=1000)
-
-        logger.info(f"Successfully saved {len(tick_objects)} ticks")
-        return {'status': 'success', 'count': len(tick_objects)}
+        count = write_ticks(tick_data)
+    except IntegrityError:
+        # Ticks of a script deleted while they were in flight fail the whole
+        # batch on the foreign key; drop those and save the rest
+        known = set(Script.objects.filter(
+            id__in={_script_id(tick) for tick in tick_data}
+        ).values_list('id', flat=True))
+        kept = [tick for tick in tick_data if _script_id(tick) in known]
+        if len(kept) == len(tick_data):
+            raise
+        logger.warning(f"Dropped {len(tick_data) - len(kept)} ticks of deleted scripts")
+        count = write_ticks(kept) if kept else 0
+
+    logger.info(f"Successfully saved {count} ticks")
+    return {'status': 'success', 'count': count}
+
+
+if getattr(settings, 'TICK_CONSUMER_BATCHING', False):
+    from .batching import LateAckBatches
+
+    @shared_task(
+        name='tick_consumer.tasks.consume_tick',
+        base=LateAckBatches,
+        flush_every=settings.TICK_CONSUMER_BATCH_SIZE,
+        flush_interval=settings.TICK_CONSUMER_BATCH_INTERVAL,
+        acks_late=True,
+    )
+    @profiling.timed('consume_tick')
+    def consume_tick(requests):
+        """
+        Buffered variant of consume_tick used when TICK_CONSUMER_BATCHING is on.
+
+        The worker collects up to TICK_CONSUMER_BATCH_SIZE consume_tick
+        messages (or whatever arrived within TICK_CONSUMER_BATCH_INTERVAL
+        seconds) and saves all their ticks with one bulk insert. Messages are
+        acknowledged only after that insert commits. If it fails, each
+        message is saved on its own and only the ones that still fail are
+        returned under ``failed`` to be retried (see ``LateAckBatches``).
+
+        Args:
+            requests (list[SimpleRequest]): Buffered consume_tick calls
+
+        Returns:
+            dict: Status with count of saved ticks and messages
+        """
+        per_request = []
+        for request in requests:
+            batch = request.args[0] if request.args else request.kwargs.get('tick_data')
+            if batch:
+                record_transport(batch)
+                try:
+                    per_request.append((request.id, unpack_ticks(batch)))
+                except ValueError as e:
+                    # One unreadable message must not fail the others' insert
+                    logger.error(f"Discarding consume_tick message {request.id}: {e}")
+
+        try:
+            result = save_ticks([tick for _, ticks in per_request for tick in ticks])
+        except Exception as e:
+            if len(per_request) < 2:
+                logger.error(f"Error consuming {len(requests)} buffered messages: {str(e)}", exc_info=True)
+                raise
+            logger.error(f"Error consuming {len(requests)} buffered messages, saving them one by one: {e}")
+            count, failed = 0, []
+            for request_id, ticks in per_request:
+                try:
+                    count += save_ticks(ticks)['count']
+                except Exception as error:
+                    logger.error(f"Error consuming message {request_id}: {error}")
+                    failed.append(request_id)
+            if len(failed) == len(per_request):
+                raise
+            result = {'status': 'success', 'count': count, 'failed': failed}
+
+        result['messages'] = len(requests)
+        return result
 
-    except Exception as e:
-        logger.error(f"Error consuming ticks: {str(e)}", exc_info=True)
-        raise
+else:
+    @shared_task
+    @profiling.timed('consume_tick')
+    def consume_tick(tick_data):
+        """
+        Bulk save tick data to MySQL database.
+
+        See ``save_ticks`` for the accepted tick formats.
+
+        Returns:
+            dict: Status with count of saved ticks
+        """
+        try:
+            return save_ticks(tick_data)
+
+        except Exception as e:
+            logger.error(f"Error consuming ticks: {str(e)}", exc_info=True)
+            raise
+
+
+@shared_task
+def save_order_book_snapshots(snapshots):
+    """
+    Bulk save order book snapshots sent by the producer's order book engine.
+
+    Args:
+        snapshots (list): Dicts with script_id, last_update_id, event_time
+            (epoch ms), bids and asks ([[price, quantity], ...], best first)
+
+    Returns:
+        dict: Status with count of saved snapshots
+    """
+    # Skip scripts deleted while their snapshots were in flight
+    known = set(Script.objects.filter(
+        id__in={snapshot['script_id'] for snapshot in snapshots}
+    ).values_list('id', flat=True))
+
+    rows = [
+        OrderBookSnapshot(
+            script_id=snapshot['script_id'],
+            captured_at=parse_received_at(snapshot['event_time']),
+            last_update_id=snapshot['last_update_id'],
+            best_bid=snapshot['bids'][0][0] if snapshot['bids'] else None,
+            best_ask=snapshot['asks'][0][0] if snapshot['asks'] else None,
+            bids=snapshot['bids'],
+            asks=snapshot['asks'],
+        )
+        for snapshot in snapshots if snapshot['script_id'] in known
+    ]
+    OrderBookSnapshot.objects.bulk_create(rows)
+
+    logger.info(f"Saved {len(rows)} order book snapshots")
+    return {'status': 'success', 'count': len(rows)}
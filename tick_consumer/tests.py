@@ -1,7 +1,38 @@
-from django.test import TestCase
-from .models import Broker, Script, Ticks
-from .tasks import get_broker, consume_tick
-from datetime import datetime
+from django.test import TestCase, TransactionTestCase
+from .models import Broker, Script, Ticks, CompactTick, Candle, OrderBookSnapshot
+from .tasks import get_broker, consume_tick, save_order_book_snapshots, save_ticks
+from .signals import SCRIPTS_VERSION_KEY
+from .ingest import normalize_ticks, write_ticks
+from .batching import LateAckBatches
+from .streams import RedisStreamSink, decode_entries, decode_entry, encode_entry
+from .wire import decode_batch, encode_batch, encode_payload, trace_payload
+from .compact import clear_scale_cache, datetime_to_ts, iter_compact_ticks
+from .candles import aggregate, bucket_start
+from .queries import iter_tick_values
+from .live import LiveHub, Subscriber, live_channel, publish_ticks, sse_events
+from .admin import EstimatedCountPaginator
+from market_tick_system import metrics, profiling
+from django.contrib.auth.models import User
+from .quotes import clear_broker_cache, encode_quote, get_latest_quotes, latest_per_script, quote_key, store_quotes, Quote
+from django.test import override_settings
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from io import StringIO
+import asyncio
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import json
+import time
+from celery import Celery
+from unittest.mock import AsyncMock, Mock, patch
+import redis
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
 
@@ -56,3 +87,793 @@ class TicksModelTest(TestCase):
         )
         self.assertEqual(tick.script, self.script)
         self.assertEqual(tick.tick_value, Decimal('50000.12345678'))
+
+
+class ConsumeTickTest(TestCase):
+    def setUp(self):
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.script = Script.objects.create(
+            broker=self.broker,
+            name='Bitcoin',
+            trading_symbol='BTCUSDT'
+        )
+
+    def test_consume_dict_and_compact_rows(self):
+        result = consume_tick([
+            {
+                'script_id': self.script.id,
+                'tick_value': '50000.1',
+                'volume': '1.5',
+                'received_at_producer': '2024-01-01T00:00:00+00:00'
+            },
+            [self.script.id, '50001.2', None, 1704067201000],
+        ])
+        self.assertEqual(result['count'], 2)
+
+        latest = Ticks.objects.first()
+        self.assertEqual(latest.tick_value, Decimal('50001.2'))
+        self.assertEqual(latest.received_at_producer, datetime(2024, 1, 1, 0, 0, 1, tzinfo=timezone.utc))
+
+
+@override_settings(TICK_QUOTE_CACHE_ENABLED=False, TICK_LIVE_PUBLISH_ENABLED=False)
+class ScriptChangeTest(TransactionTestCase):
+    def setUp(self):
+        self.client_mock = Mock()
+        patcher = patch('tick_consumer.signals.get_redis', return_value=self.client_mock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+
+    def test_save_and_delete_bump_version(self):
+        script = Script.objects.create(broker=self.broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        script.delete()
+        self.assertEqual(self.client_mock.incr.call_args_list, [((SCRIPTS_VERSION_KEY,),)] * 2)
+
+    def test_ticks_of_deleted_script_do_not_fail_batch(self):
+        script = Script.objects.create(broker=self.broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        result = save_ticks([
+            [script.id, '50000', None, 1704067200000],
+            [script.id + 1000, '1', None, 1704067200000],
+        ])
+        self.assertEqual(result['count'], 1)
+        self.assertEqual(Ticks.objects.count(), 1)
+
+
+class OrderBookSnapshotTest(TestCase):
+    def test_save_snapshots(self):
+        broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        script = Script.objects.create(broker=broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        result = save_order_book_snapshots([
+            {'script_id': script.id, 'last_update_id': 42, 'event_time': 1704067200000,
+             'bids': [['100.5', '2'], ['100.0', '1']], 'asks': [['101.0', '3']]},
+            {'script_id': script.id + 1000, 'last_update_id': 1, 'event_time': 1704067200000,
+             'bids': [], 'asks': []},
+        ])
+        self.assertEqual(result['count'], 1)
+
+        snapshot = OrderBookSnapshot.objects.get()
+        self.assertEqual(snapshot.best_bid, Decimal('100.5'))
+        self.assertEqual(snapshot.best_ask, Decimal('101.0'))
+        self.assertEqual(snapshot.bids, [['100.5', '2'], ['100.0', '1']])
+        self.assertEqual(snapshot.captured_at, datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+
+class IngestBackendTest(TestCase):
+    def setUp(self):
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.script = Script.objects.create(
+            broker=self.broker,
+            name='Bitcoin',
+            trading_symbol='BTCUSDT'
+        )
+
+    def test_sql_backend_writes_rows(self):
+        count = write_ticks([
+            [self.script.id, '50000.12345678', '1.5', 1704067200000],
+            [self.script.id, '50001', None, 1704067201000],
+        ], backend='sql')
+        self.assertEqual(count, 2)
+
+        ticks = list(Ticks.objects.order_by('received_at_producer'))
+        self.assertEqual(ticks[0].tick_value, Decimal('50000.12345678'))
+        self.assertEqual(ticks[0].received_at_producer, datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.assertIsNone(ticks[1].volume)
+        self.assertIsNotNone(ticks[1].created_at)
+
+    def test_invalid_rows_are_skipped(self):
+        rows = normalize_ticks([
+            [self.script.id, '0', None, 1704067200000],
+            [self.script.id, 'abc', None, 1704067200000],
+            {'script_id': self.script.id, 'tick_value': '1.5'},
+            [self.script.id, '1.5', '-1', 1704067200000],
+            [self.script.id, 2.5, None, 1704067200000],
+        ])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].tick_value, Decimal('2.5'))
+
+
+class LateAckBatchesTest(TestCase):
+    class ImmediatePool:
+        def apply_async(self, target, args, callback=None, **options):
+            callback(target(*args))
+
+    def _make_task(self, run):
+        app = Celery(set_as_current=False)
+        task = app.task(base=LateAckBatches, flush_every=10, flush_interval=1)(run)
+        task._pool = self.ImmediatePool()
+        return task
+
+    def _make_request(self, ticks, request_id='1'):
+        return Mock(id=request_id, _payload=((ticks,), {}, {}), delivery_info={}, request_dict={})
+
+    def test_acknowledges_after_successful_flush(self):
+        received = []
+
+        def run(requests):
+            received.extend(request.args[0] for request in requests)
+            return {'count': len(requests)}
+
+        task = self._make_task(run)
+        requests = [self._make_request([1]), self._make_request([2])]
+        task.flush(requests)
+
+        self.assertEqual(received, [[1], [2]])
+        for request in requests:
+            request.acknowledge.assert_called_once()
+            request.reject.assert_not_called()
+
+    def test_requeues_when_flush_fails(self):
+        def run(requests):
+            raise RuntimeError("database unavailable")
+
+        task = self._make_task(run)
+        requests = [self._make_request([1])]
+        client = Mock()
+        client.pipeline.return_value.execute.return_value = [1, True]
+        with patch('tick_consumer.batching.get_redis', return_value=client):
+            task.flush(requests)
+
+        requests[0].acknowledge.assert_not_called()
+        requests[0].reject.assert_called_once_with(requeue=True)
+
+    @override_settings(TICK_CONSUMER_MAX_DELIVERIES=3)
+    def test_dead_letters_messages_that_keep_failing(self):
+        def run(requests):
+            return {'count': 1, 'failed': ['2']}
+
+        task = self._make_task(run)
+        requests = [self._make_request([1], '1'), self._make_request([2], '2')]
+        client = Mock()
+        pipe = client.pipeline.return_value
+        pipe.execute.side_effect = [[3, True], [b'1-0']]
+        with patch('tick_consumer.batching.get_redis', return_value=client):
+            task.flush(requests)
+
+        # Only the failed message is counted, and on its third failure it is dead-lettered
+        requests[0].acknowledge.assert_called_once()
+        pipe.incr.assert_called_once_with('ticks:deliveries:2')
+        self.assertEqual(pipe.xadd.call_args.args, ('ticks:dead:consume_tick', {'args': '[[2]]', 'deliveries': 3, 'origin': '2'}))
+        requests[1].acknowledge.assert_called_once()
+        requests[1].reject.assert_not_called()
+
+
+class RedisStreamsTest(TestCase):
+    def test_entry_round_trip(self):
+        fields = encode_entry([7, '50000.1', None, 1704067200000])
+        raw = {key.encode(): str(value).encode() for key, value in fields.items()}
+        self.assertEqual(decode_entry(raw), [7, '50000.1', None, 1704067200000])
+
+    def test_sink_pipelines_xadd(self):
+        client = Mock()
+        sink = RedisStreamSink(client, broker_id=3, maxlen=100)
+        sink([[7, '1.5', '2', 1], [8, '2.5', None, 2]])
+
+        pipe = client.pipeline.return_value
+        self.assertEqual(pipe.xadd.call_count, 2)
+        self.assertEqual(pipe.xadd.call_args.args[0], 'ticks:stream:broker:3')
+        self.assertEqual(pipe.xadd.call_args.kwargs['maxlen'], 100)
+        pipe.execute.assert_called_once()
+
+    def test_decode_entries_keeps_ids_of_trimmed_entries(self):
+        ids, rows = decode_entries([
+            (b'1-0', {b's': b'7', b'p': b'1.5', b'v': b'', b't': b'1'}),
+            (b'2-0', None),
+            (b'3-0', {b's': b'x'}),
+        ])
+        self.assertEqual(ids, [b'1-0', b'2-0', b'3-0'])
+        self.assertEqual(rows, [[7, '1.5', None, 1]])
+
+    def test_reclaim_dead_letters_exhausted_entries(self):
+        from tick_consumer.management.commands.run_tick_consumer import Command
+        command = Command()
+        command.client = client = Mock()
+        command.group, command.consumer, command.count = 'g', 'c', 10
+        command.max_deliveries, command.running, command.transport_duration = 3, True, None
+
+        def entry(script_id):
+            return {b's': str(script_id).encode(), b'p': b'1.5', b'v': b'', b't': b'1'}
+
+        client.xautoclaim.return_value = (b'0-0', [(b'1-0', entry(1)), (b'2-0', entry(2)), (b'3-0', entry(3))], [])
+        pipe = client.pipeline.return_value
+        pipe.execute.side_effect = [
+            [[{'message_id': b'1-0', 'times_delivered': 4}], [{'message_id': b'2-0', 'times_delivered': 2}],
+             [{'message_id': b'3-0', 'times_delivered': 2}]],
+            [b'9-0'],
+        ]
+
+        def save(rows):
+            # Entry 2 fails every time, so the block fails and is retried entry by entry
+            if any(row[0] == 2 for row in rows):
+                raise ValueError('bad tick')
+            return {'count': len(rows)}
+
+        key = 'ticks:stream:broker:1'
+        with patch('tick_consumer.management.commands.run_tick_consumer.save_ticks', side_effect=save) as save_ticks:
+            command.reclaim_pending(key, 1000)
+
+        pipe.xadd.assert_called_once_with(
+            f'{key}:dead', {**entry(1), 'deliveries': 4, 'origin': b'1-0'}, maxlen=settings.TICK_STREAM_MAXLEN,
+            approximate=True
+        )
+        self.assertEqual([c.args[2:] for c in client.xack.call_args_list], [(b'1-0',), (b'3-0',)])
+        self.assertEqual(save_ticks.call_args.args[0], [[3, '1.5', None, 1]])
+
+
+class ColumnarWireFormatTest(TestCase):
+    ROWS = [
+        [7, '50000.12345678', '12.5', 1704067200123],
+        [8, '0.00000123', None, 1704067200124],
+    ]
+
+    def test_batch_round_trip(self):
+        data = encode_batch(self.ROWS)
+        self.assertEqual(len(data), 12 + 2 * 32)
+
+        rows = decode_batch(data)
+        self.assertEqual(rows[0][:3], [7, Decimal('50000.12345678'), Decimal('12.5')])
+        self.assertEqual(rows[0][3], datetime(2024, 1, 1, 0, 0, 0, 123000, tzinfo=timezone.utc))
+        self.assertEqual(rows[1][1], Decimal('0.00000123'))
+        self.assertIsNone(rows[1][2])
+
+    def test_large_volumes_lower_the_scale(self):
+        rows = decode_batch(encode_batch([[1, '1', '123456789012345.12345678', 0]]))
+        self.assertEqual(rows[0][2], Decimal('123456789012345.1234'))
+
+    def test_consume_tick_accepts_columnar_payload(self):
+        broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        script = Script.objects.create(broker=broker, name='Bitcoin', trading_symbol='BTCUSDT')
+
+        payload = json.loads(json.dumps(encode_payload([[script.id, '50000.1', '3', 1704067200000]])))
+        self.assertEqual(consume_tick(payload)['count'], 1)
+        self.assertEqual(Ticks.objects.get().tick_value, Decimal('50000.1'))
+
+    def test_unknown_envelope_is_rejected(self):
+        # Not mistaken for a single (invalid) tick and dropped silently
+        with self.assertRaisesMessage(ValueError, 'Unknown tick payload format: columnar-v2'):
+            consume_tick({'format': 'columnar-v2', 'data': ''})
+
+
+@override_settings(TICK_STORAGE='compact')
+class CompactTickTest(TestCase):
+    def setUp(self):
+        clear_scale_cache()
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.script = Script.objects.create(
+            broker=self.broker,
+            name='Pepe',
+            trading_symbol='PEPEUSDT',
+            additional_data={'price_scale': 10, 'volume_scale': 2}
+        )
+
+    def test_write_and_read_back(self):
+        consume_tick([
+            [self.script.id, '0.0000012345', '123456789.5', 1704067200000],
+            [self.script.id, '0.0000012346', None, 1704067201000],
+        ])
+        self.assertEqual(Ticks.objects.count(), 0)
+        self.assertEqual(
+            list(CompactTick.objects.values_list('ts', 'price', 'volume').order_by('ts')),
+            [(1704067200000000, 12345, 12345678950), (1704067201000000, 12346, None)]
+        )
+
+        rows = list(iter_compact_ticks(self.script.id, chunk_size=1))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0].tick_value, Decimal('0.0000012345'))
+        self.assertEqual(rows[0].volume, Decimal('123456789.5'))
+        self.assertEqual(rows[1].received_at, datetime(2024, 1, 1, 0, 0, 1, tzinfo=timezone.utc))
+
+    def test_duplicate_event_time_is_upserted(self):
+        consume_tick([[self.script.id, '0.000001', None, 1704067200000]])
+        consume_tick([[self.script.id, '0.000002', None, 1704067200000]])
+        self.assertEqual(list(CompactTick.objects.values_list('price', flat=True)), [20000])
+
+    def test_partitioning_requires_mysql(self):
+        if connection.vendor == 'mysql':
+            self.skipTest('partitions a MySQL table')
+        with self.assertRaisesMessage(CommandError, 'requires MySQL'):
+            call_command('partition_compact_ticks', stdout=StringIO())
+
+
+class PruneTicksCommandTest(TestCase):
+    def setUp(self):
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.keep_longer = Script.objects.create(
+            broker=self.broker,
+            name='Bitcoin',
+            trading_symbol='BTCUSDT',
+            additional_data={'retention_days': 30}
+        )
+        self.default = Script.objects.create(broker=self.broker, name='Ethereum', trading_symbol='ETHUSDT')
+        now = datetime.now(timezone.utc)
+        for script in (self.keep_longer, self.default):
+            for days_ago in (1, 10, 40):
+                Ticks.objects.create(
+                    script=script,
+                    tick_value=Decimal('1'),
+                    received_at_producer=now - timedelta(days=days_ago)
+                )
+
+    def test_prunes_with_global_and_per_script_retention(self):
+        call_command('prune_ticks', days=7, chunk_size=1, sleep=0, storage='ticks', stdout=StringIO())
+        self.assertEqual(Ticks.objects.filter(script=self.keep_longer).count(), 2)
+        self.assertEqual(Ticks.objects.filter(script=self.default).count(), 1)
+
+    def test_prunes_compact_storage(self):
+        clear_scale_cache()
+        with override_settings(TICK_STORAGE='compact'):
+            consume_tick([
+                [self.default.id, '1', None, int((datetime.now(timezone.utc) - timedelta(days=days)).timestamp() * 1000)]
+                for days in (1, 10, 11, 40)
+            ])
+        call_command('prune_ticks', days=7, chunk_size=2, sleep=0, storage='compact', stdout=StringIO())
+        self.assertEqual(CompactTick.objects.filter(script=self.default).count(), 1)
+
+    def test_dry_run_deletes_nothing(self):
+        out = StringIO()
+        call_command('prune_ticks', days=7, dry_run=True, storage='ticks', stdout=out)
+        self.assertEqual(Ticks.objects.count(), 6)
+        self.assertIn('Would delete 3 ticks', out.getvalue())
+
+    def test_dry_run_counts_dropped_partitions_once(self):
+        clear_scale_cache()
+        now = datetime.now(timezone.utc)
+        with override_settings(TICK_STORAGE='compact'):
+            consume_tick([
+                [self.default.id, '1', None, int((now - timedelta(days=days)).timestamp() * 1000)]
+                for days in (1, 10, 11, 40)
+            ])
+
+        def drop_expired_partitions(command, policies, all_scripts):
+            # A partition ending 20 days ago holds the 40-day-old row
+            command.dropped_before_ts = datetime_to_ts(now - timedelta(days=20))
+            return 1
+
+        out = StringIO()
+        with patch('tick_consumer.management.commands.prune_ticks.Command.drop_expired_partitions',
+                   drop_expired_partitions):
+            call_command('prune_ticks', days=7, dry_run=True, storage='compact', stdout=out)
+        self.assertEqual(CompactTick.objects.count(), 4)
+        self.assertIn('Would delete 3 ticks', out.getvalue())
+
+
+class CandleTest(TestCase):
+    def setUp(self):
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.script = Script.objects.create(broker=self.broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        self.minute = datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc)
+
+    def tick(self, seconds, price, volume='10'):
+        return [self.script.id, price, volume, int((self.minute + timedelta(seconds=seconds)).timestamp() * 1000)]
+
+    def test_bucket_start(self):
+        at = datetime(2024, 1, 1, 12, 30, 45, 123456, tzinfo=timezone.utc)
+        self.assertEqual(bucket_start(at, '1s'), at.replace(microsecond=0))
+        self.assertEqual(bucket_start(at, '1m'), self.minute)
+        self.assertEqual(bucket_start(at, '1d'), datetime(2024, 1, 1, tzinfo=timezone.utc))
+
+    def test_aggregate_out_of_order_batch(self):
+        rows = normalize_ticks([self.tick(20, '101'), self.tick(5, '100'), self.tick(50, '99', '12'), self.tick(30, '105')])
+        candle = aggregate(rows, ['1m'])[(self.script.id, '1m', self.minute)]
+        self.assertEqual(candle[:6], [Decimal('100'), Decimal('105'), Decimal('99'), Decimal('99'), Decimal('12'), 4])
+
+    @override_settings(TICK_CANDLES_ENABLED=True, TICK_CANDLE_RESOLUTIONS=['1m', '1h'])
+    def test_ingestion_merges_batches(self):
+        consume_tick([self.tick(20, '101'), self.tick(30, '105')])
+        # A late batch with an earlier open and a new low
+        consume_tick([self.tick(5, '100'), self.tick(50, '99', '12')])
+
+        candle = Candle.objects.get(script=self.script, resolution='1m')
+        self.assertEqual(candle.bucket_start, self.minute)
+        self.assertEqual(
+            (candle.open, candle.high, candle.low, candle.close, candle.volume, candle.tick_count),
+            (Decimal('100'), Decimal('105'), Decimal('99'), Decimal('99'), Decimal('12'), 4)
+        )
+        self.assertEqual(candle.first_tick_at, self.minute + timedelta(seconds=5))
+        self.assertEqual(Candle.objects.filter(resolution='1h').get().tick_count, 4)
+        self.assertFalse(Candle.objects.filter(resolution='1s').exists())
+
+    def test_backfill_rebuilds_from_ticks(self):
+        write_ticks([self.tick(seconds, str(100 + seconds)) for seconds in range(0, 120, 10)])
+        Candle.objects.create(
+            script=self.script, resolution='1m', bucket_start=self.minute, open=1, high=1, low=1, close=1,
+            tick_count=99, first_tick_at=self.minute, last_tick_at=self.minute
+        )
+        call_command('backfill_candles', resolution=['1m'], chunk_size=5, start='2024-01-01', stdout=StringIO())
+
+        candles = list(Candle.objects.filter(script=self.script).order_by('bucket_start'))
+        self.assertEqual([c.tick_count for c in candles], [6, 6])
+        self.assertEqual((candles[0].open, candles[0].close), (Decimal('100'), Decimal('150')))
+        self.assertEqual((candles[1].low, candles[1].high), (Decimal('160'), Decimal('210')))
+
+
+@override_settings(TICK_QUOTE_CACHE_ENABLED=True)
+class QuoteCacheTest(TestCase):
+    def setUp(self):
+        clear_broker_cache()
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.btc = Script.objects.create(broker=self.broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        self.eth = Script.objects.create(broker=self.broker, name='Ethereum', trading_symbol='ETHUSDT')
+        self.at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def test_latest_per_script(self):
+        rows = normalize_ticks([[self.btc.id, '2', '1', 2000], [self.btc.id, '1', '1', 1000], [self.eth.id, '3', None, 1000]])
+        latest = latest_per_script(rows)
+        self.assertEqual(latest[self.btc.id].price, Decimal('2'))
+        self.assertIsNone(latest[self.eth.id].volume)
+
+    def test_store_quotes_one_script_call_per_broker(self):
+        client = Mock()
+        client.pipeline.return_value.execute.return_value = [2]
+        quotes = {
+            self.btc.id: Quote(self.btc.id, Decimal('1.5'), None, self.at),
+            self.eth.id: Quote(self.eth.id, Decimal('2.5'), Decimal('3'), self.at),
+        }
+        self.assertEqual(store_quotes(quotes, client), 2)
+
+        call = client.pipeline.return_value.eval.call_args
+        self.assertEqual(call.args[1:3], (1, quote_key(self.broker.id)))
+        self.assertEqual(len(call.args[3:]), 6)
+
+    def test_cache_hit_and_cold_fallback_to_db(self):
+        Ticks.objects.create(script=self.eth, tick_value=Decimal('7'), received_at_producer=self.at)
+        client = Mock()
+        pipe = client.pipeline.return_value
+        cached = encode_quote(Quote(self.btc.id, Decimal('1.5'), None, self.at)).encode()
+        pipe.execute.side_effect = [[[cached, None]], [1]]
+
+        quotes = get_latest_quotes([self.btc.id, self.eth.id, 999], client)
+        self.assertEqual(quotes[self.btc.id].price, Decimal('1.5'))
+        self.assertEqual(quotes[self.eth.id].price, Decimal('7'))
+        self.assertNotIn(999, quotes)
+        # The DB result warms the cache
+        self.assertEqual(pipe.eval.call_args.args[3], str(self.eth.id))
+
+    def test_redis_down_reads_db(self):
+        Ticks.objects.create(script=self.btc, tick_value=Decimal('9'), received_at_producer=self.at)
+        client = Mock()
+        client.pipeline.return_value.execute.side_effect = redis.ConnectionError('down')
+        self.assertEqual(get_latest_quotes([self.btc.id], client)[self.btc.id].price, Decimal('9'))
+
+    @override_settings(TICK_QUOTE_CACHE_ENABLED=False)
+    def test_disabled_cache_is_not_read(self):
+        # Nothing refreshes it, so whatever it holds may be stale
+        Ticks.objects.create(script=self.btc, tick_value=Decimal('9'), received_at_producer=self.at)
+        client = Mock()
+        self.assertEqual(get_latest_quotes([self.btc.id], client)[self.btc.id].price, Decimal('9'))
+        client.pipeline.assert_not_called()
+
+    def test_quotes_endpoint(self):
+        quotes = {self.btc.id: Quote(self.btc.id, Decimal('1.5'), None, self.at)}
+        with patch('tick_consumer.views.get_latest_quotes', return_value=quotes):
+            response = self.client.get('/api/quotes/', {'script_ids': f'{self.btc.id},{self.eth.id}'})
+            self.assertEqual(response.json()['quotes'][0]['price'], '1.5')
+            self.assertEqual(self.client.get(f'/api/quotes/{self.eth.id}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/quotes/', {'script_id': 'x'}).status_code, 400)
+
+
+class TickRangeApiTest(TestCase):
+    def setUp(self):
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.script = Script.objects.create(broker=self.broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        # Pairs of ticks share a timestamp, so pages must break ties on id
+        write_ticks([[self.script.id, str(i + 1), None, 1000 * (i // 2)] for i in range(7)])
+
+    def get(self, **params):
+        response = self.client.get(f'/api/ticks/{self.script.id}/', params)
+        return b''.join(response.streaming_content).decode()
+
+    def test_keyset_chunks_cover_range_once(self):
+        prices = [int(row[1]) for row in iter_tick_values(self.script.id, chunk_size=2)]
+        self.assertEqual(prices, [1, 2, 3, 4, 5, 6, 7])
+
+    def test_json_pages_follow_cursor(self):
+        prices = []
+        cursor = None
+        for _ in range(3):
+            page = json.loads(self.get(limit=3, **({'cursor': cursor} if cursor else {})))
+            prices.extend(int(Decimal(tick['price'])) for tick in page['ticks'])
+            cursor = page['next_cursor']
+        self.assertEqual(prices, [1, 2, 3, 4, 5, 6, 7])
+        self.assertIsNone(cursor)
+
+    def test_ndjson_streams_time_range(self):
+        lines = self.get(format='ndjson', start='1000', end='3000').splitlines()
+        self.assertEqual([json.loads(line)['price'] for line in lines], ['3.00000000', '4.00000000', '5.00000000', '6.00000000'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get('/api/ticks/999/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/ticks/{self.script.id}/', {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/ticks/{self.script.id}/', {'limit': 0}).status_code, 400)
+
+
+class ExportTicksCommandTest(TestCase):
+    def setUp(self):
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.script = Script.objects.create(broker=self.broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        start = int(datetime(2024, 1, 1, 23, 0, tzinfo=timezone.utc).timestamp() * 1000)
+        # 20 ticks, 6 minutes apart, crossing midnight
+        write_ticks([[self.script.id, str(100 + i), None if i % 2 else '5', start + i * 360000] for i in range(20)])
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def test_exports_csv_per_day(self):
+        call_command('export_ticks', format='csv.gz', output_dir=self.output_dir, workers=1, chunk_size=3,
+                     storage='ticks', stdout=StringIO())
+        day_dir = os.path.join(self.output_dir, 'BTCUSDT')
+        self.assertEqual(sorted(os.listdir(day_dir)), ['2024-01-01.csv.gz', '2024-01-02.csv.gz'])
+
+        with gzip.open(os.path.join(day_dir, '2024-01-01.csv.gz'), 'rt') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], ['received_at', 'price', 'volume'])
+        self.assertEqual(len(rows), 11)
+        self.assertEqual(rows[1], ['2024-01-01T23:00:00+00:00', '100.00000000', '5.00000000'])
+        self.assertEqual(rows[2][2], '')
+
+    def test_time_range_single_file(self):
+        out = StringIO()
+        call_command('export_ticks', start='2024-01-02', output_dir=self.output_dir, workers=1, no_split=True,
+                     storage='ticks', stdout=out)
+        with open(os.path.join(self.output_dir, 'BTCUSDT.csv')) as file:
+            self.assertEqual(len(file.readlines()), 11)
+        self.assertIn('Exported 10 ticks', out.getvalue())
+
+    def test_npz_needs_day_files(self):
+        with patch('tick_consumer.management.commands.export_ticks.check_format'):
+            with self.assertRaises(CommandError):
+                call_command('export_ticks', format='npz', no_split=True, output_dir=self.output_dir, stdout=StringIO())
+
+
+@override_settings(TICK_ADMIN_LARGE_TABLE=True)
+class LargeTableAdminTest(TestCase):
+    def setUp(self):
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.script = Script.objects.create(broker=self.broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        now = datetime.now(timezone.utc)
+        for minutes in (1, 30, 600):
+            Ticks.objects.create(script=self.script, tick_value=Decimal('1'), received_at_producer=now - timedelta(minutes=minutes))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+
+    def test_paginator_bounds_filtered_count(self):
+        paginator = EstimatedCountPaginator(Ticks.objects.filter(script=self.script), 1)
+        paginator.count_limit = 2
+        self.assertEqual(paginator.count, 2)
+
+    def test_changelists_load(self):
+        for url in ('/admin/tick_consumer/broker/', '/admin/tick_consumer/script/', '/admin/tick_consumer/ticks/'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(TICK_CANDLES_ENABLED=True)
+    def test_script_tick_counts_from_daily_candles(self):
+        write_ticks([[self.script.id, '2', None, 1704067200000], [self.script.id, '3', None, 1704067201000]])
+        response = self.client.get('/admin/tick_consumer/script/')
+        self.assertEqual(response.context['cl'].result_list[0].tick_total, 2)
+
+    def test_recent_filter(self):
+        response = self.client.get('/admin/tick_consumer/ticks/', {'received_within': '1h'})
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+    @override_settings(TICK_ADMIN_LARGE_TABLE=False)
+    def test_stock_admin_by_default(self):
+        response = self.client.get('/admin/tick_consumer/ticks/')
+        self.assertEqual(response.context['cl'].date_hierarchy, 'received_at_producer')
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+class LiveFeedTest(TestCase):
+    def setUp(self):
+        clear_broker_cache()
+        self.broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        self.btc = Script.objects.create(broker=self.broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        self.eth = Script.objects.create(broker=self.broker, name='Ethereum', trading_symbol='ETHUSDT')
+
+    def test_publish_latest_tick_per_script(self):
+        client = Mock()
+        publish_ticks(normalize_ticks([[self.btc.id, '1', None, 1000], [self.btc.id, '2', None, 2000]]), client)
+        channel, data = client.pipeline.return_value.publish.call_args.args
+        self.assertEqual(channel, live_channel(self.broker.id))
+        self.assertEqual(json.loads(data), [[self.btc.id, '2', None, 2000000]])
+
+    def test_dispatch_routes_and_conflates(self):
+        hub = LiveHub(url='redis://unused')
+        hub.start = Mock()
+        btc_only = Subscriber(script_ids=[self.btc.id])
+        whole_broker = Subscriber(broker_ids=[self.broker.id])
+        other_broker = Subscriber(broker_ids=[999])
+        for subscriber in (btc_only, whole_broker, other_broker):
+            hub.subscribe(subscriber)
+
+        hub.dispatch(self.broker.id, json.dumps([[self.btc.id, '1', None, 1000], [self.eth.id, '5', None, 1000]]))
+        hub.dispatch(self.broker.id, json.dumps([[self.btc.id, '2', None, 2000]]))
+
+        self.assertEqual([json.loads(m)['price'] for m in btc_only.pending.values()], ['2'])
+        self.assertEqual(btc_only.conflated, 1)
+        self.assertEqual(len(whole_broker.pending), 2)
+        self.assertFalse(other_broker.pending)
+
+        hub.unsubscribe(btc_only)
+        self.assertNotIn(self.btc.id, hub.by_script)
+        self.assertEqual(hub.subscriber_count, 2)
+
+    async def test_sse_stream(self):
+        hub = LiveHub(url='redis://unused')
+        hub.start = Mock()
+        subscriber = Subscriber()
+        events = sse_events(hub, subscriber, keepalive=0.01)
+
+        self.assertEqual(await events.__anext__(), ': connected\n\n')
+        self.assertEqual(await events.__anext__(), ': keepalive\n\n')
+        hub.dispatch(1, json.dumps([[7, '3.5', '1', 1000]]))
+        self.assertIn('"price": "3.5"', await events.__anext__())
+
+        await events.aclose()
+        self.assertEqual(hub.subscriber_count, 0)
+
+    async def test_hub_survives_dispatch_errors(self):
+        async def listen():
+            for data in (b'first', b'second'):
+                yield {'type': 'pmessage', 'channel': live_channel(self.broker.id).encode(), 'data': data}
+            raise asyncio.CancelledError
+
+        pubsub = Mock(listen=listen, psubscribe=AsyncMock(), aclose=AsyncMock())
+        client = Mock(pubsub=Mock(return_value=pubsub), aclose=AsyncMock())
+        hub = LiveHub(url='redis://unused')
+        hub.dispatch = Mock(side_effect=[KeyError('price'), None])
+
+        with patch('tick_consumer.live.aioredis.Redis.from_url', return_value=client):
+            with self.assertRaises(asyncio.CancelledError):
+                await hub._run()
+        self.assertEqual([c.args[1] for c in hub.dispatch.call_args_list], [b'first', b'second'])
+
+
+@override_settings(TICK_QUOTE_CACHE_ENABLED=False, TICK_LIVE_PUBLISH_ENABLED=False, TICK_METRICS_ENABLED=True)
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+
+    def test_histogram_renders_as_prometheus_text(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram('tick_latency_seconds', 'Latency', stage='commit')
+        histogram.observe_many([0.001, 0.0011, 0.002, 500])
+        registry.gauge('tick_queue_depth', 'Depth', function=lambda: 7)
+
+        # Log-linear buckets keep the quantile within a quarter of the value
+        self.assertAlmostEqual(histogram.percentile(0.5), 0.0011, delta=0.0011 / 4)
+        self.assertEqual(histogram.percentile(1.0), float('inf'))
+
+        text = metrics.render_prometheus([({'role': 'worker', 'instance': 'h:1'}, registry.snapshot())])
+        self.assertIn('# TYPE tick_latency_seconds histogram', text)
+        self.assertIn('tick_latency_seconds_bucket{role="worker",instance="h:1",stage="commit",le="+Inf"} 4', text)
+        self.assertIn('tick_latency_seconds_count{role="worker",instance="h:1",stage="commit"} 4', text)
+        self.assertIn('tick_queue_depth{role="worker",instance="h:1"} 7', text)
+
+    def test_traced_batch_records_stages(self):
+        broker = Broker.objects.create(type='BINANCE', name='Binance Test')
+        script = Script.objects.create(broker=broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        now_ms = int(time.time() * 1000)
+        payload = trace_payload(
+            encode_payload([[script.id, '1.5', None, now_ms - 2000], [script.id, '1.6', None, now_ms - 1000]]),
+            time.time() - 0.5
+        )
+
+        with patch('market_tick_system.metrics.start_pusher') as start_pusher, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(consume_tick(payload)['count'], 2)
+
+        start_pusher.assert_called_once_with('worker')
+        transport = metrics.stage_duration('transport')
+        self.assertEqual(transport.count, 1)
+        self.assertGreaterEqual(transport.sum, 0.5)
+        self.assertEqual(metrics.stage_duration('insert').count, 1)
+        commit = metrics.tick_latency('commit')
+        self.assertEqual(commit.count, 2)
+        self.assertGreaterEqual(commit.percentile(1.0), 2)
+
+    def test_metrics_view(self):
+        client = Mock()
+        client.scan_iter.return_value = [b'metrics:process:producer:h:1']
+        client.mget.return_value = [json.dumps({
+            'labels': {'role': 'producer'},
+            'metrics': {'tick_queue_depth': {'type': 'gauge', 'help': 'Depth',
+                                             'series': [{'labels': {}, 'value': 3}]}},
+        })]
+        with patch('tick_consumer.views.get_redis', return_value=client):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'tick_queue_depth{role="producer"} 3', response.content)
+
+        with self.settings(TICK_METRICS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+
+    def test_session_samples_stacks_and_times_functions(self):
+        @profiling.timed('busy')
+        def busy(seconds):
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                sum(range(1000))
+
+        # Outside a session nothing is recorded
+        busy(0)
+
+        session = profiling.start_session('worker', duration=0.5, interval_ms=1, output_dir=self.output_dir)
+        self.assertIsNone(profiling.start_session('worker', duration=1, output_dir=self.output_dir))
+        thread = threading.Thread(target=lambda: [busy(0.1) for _ in range(2)], name='busy-thread')
+        thread.start()
+        thread.join()
+        session.join()
+
+        with open(session.path) as f:
+            lines = f.read().splitlines()
+        busy_stacks = [line for line in lines if line.startswith('busy-thread;') and 'busy (' in line]
+        self.assertTrue(busy_stacks)
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+
+        with open(session.path.replace('.collapsed', '.timings.json')) as f:
+            timings = json.load(f)
+        self.assertEqual(timings['role'], 'worker')
+        self.assertGreater(timings['samples'], 10)
+        self.assertEqual(timings['functions']['busy']['calls'], 2)
+        self.assertIsNone(profiling._session)
+
+    @override_settings(TICK_PROFILE_WATCH_INTERVAL=2)
+    def test_watcher_runs_each_request_once(self):
+        client = Mock()
+        client.get.return_value = None
+        watcher = profiling.ProfileWatcher('producer', client=client)
+        with patch('market_tick_system.profiling.start_session') as start_session:
+            self.assertIsNone(watcher.check())
+
+            profiling.request_profile(client, 20, roles=['producer'], interval_ms=5)
+            key, value = client.set.call_args.args
+            self.assertEqual(key, profiling.PROFILE_REQUEST_KEY)
+            self.assertEqual(client.set.call_args.kwargs, {'ex': 23})
+            client.get.return_value = value
+            watcher.check()
+            watcher.check()
+            start_session.assert_called_once_with('producer', 20, 5)
+
+            # Requests for other roles are ignored
+            profiling.ProfileWatcher('worker', client=client).check()
+            start_session.assert_called_once()
+
+        # A profile shorter than the poll interval still outlives one poll
+        profiling.request_profile(client, 0.5)
+        self.assertEqual(client.set.call_args.kwargs, {'ex': 3})
+
+    def test_profile_ticks_command(self):
+        client = Mock()
+        with patch('tick_consumer.management.commands.profile_ticks.get_redis', return_value=client):
+            call_command('profile_ticks', duration=15, role=['worker'], stdout=StringIO())
+        request = json.loads(client.set.call_args.args[1])
+        self.assertEqual((request['duration'], request['roles']), (15, ['worker']))
+
+        with patch('os.kill') as kill:
+            call_command('profile_ticks', pid=[1234], stdout=StringIO())
+        kill.assert_called_once_with(1234, profiling.signal.SIGUSR2)
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('quotes/', views.latest_quotes, name='latest_quotes'),
+    path('quotes/<int:script_id>/', views.latest_quote, name='latest_quote'),
+    path('ticks/<int:script_id>/', views.tick_range, name='tick_range'),
+    path('live/', views.live_ticks, name='live_ticks'),
+]
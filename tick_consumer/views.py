@@ -0,0 +1,174 @@
+import json
+from itertools import islice
+
+import redis
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from market_tick_system.metrics import collect_snapshots, metrics_enabled, render_prometheus
+from market_tick_system.redis_client import get_redis
+
+from .live import Subscriber, get_hub, sse_events
+from .models import Script
+from .queries import decode_cursor, encode_cursor, iter_tick_values, parse_time
+from .quotes import get_latest_quotes
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 50000
+# Keyset chunk size when an NDJSON response streams a whole range
+RANGE_CHUNK_SIZE = 10000
+
+
+def _quote_json(quote):
+    return {
+        'script_id': quote.script_id,
+        'price': str(quote.price),
+        'volume': None if quote.volume is None else str(quote.volume),
+        'event_time': quote.event_time.isoformat(),
+    }
+
+
+@require_GET
+def latest_quotes(request):
+    """
+    Latest quote of several scripts: ``/api/quotes/?script_id=1&script_id=2``
+    (or ``?script_ids=1,2``). Scripts without ticks are omitted.
+    """
+    raw_ids = request.GET.getlist('script_id')
+    for value in request.GET.getlist('script_ids'):
+        raw_ids.extend(value.split(','))
+    try:
+        script_ids = {int(value) for value in raw_ids if value}
+    except ValueError:
+        return JsonResponse({'error': 'script_id must be an integer'}, status=400)
+    if not script_ids:
+        return JsonResponse({'error': 'script_id is required'}, status=400)
+
+    quotes = get_latest_quotes(script_ids)
+    return JsonResponse({'quotes': [_quote_json(quotes[script_id]) for script_id in sorted(quotes)]})
+
+
+@require_GET
+def latest_quote(request, script_id):
+    """Latest quote of one script: ``/api/quotes/<script_id>/``"""
+    quote = get_latest_quotes([script_id]).get(script_id)
+    if quote is None:
+        return JsonResponse({'error': f'No ticks for script {script_id}'}, status=404)
+    return JsonResponse(_quote_json(quote))
+
+
+def _tick_json(tick_value, volume, received_at) -> str:
+    return json.dumps({
+        'price': str(tick_value),
+        'volume': None if volume is None else str(volume),
+        'event_time': received_at.isoformat(),
+    })
+
+
+def _stream_page(rows, limit, ndjson):
+    """Yield the response body; ``rows`` holds up to limit + 1 rows, the extra one only signals a next page"""
+    cursor = None
+    previous = None
+    for count, (key, tick_value, volume, received_at) in enumerate(rows):
+        if count == limit:
+            cursor = encode_cursor(*previous)
+            break
+        row = _tick_json(tick_value, volume, received_at)
+        if ndjson:
+            yield row + '\n'
+        else:
+            yield ('' if count == 0 else ',') + row
+        previous = (received_at, key)
+
+    if ndjson:
+        if cursor:
+            yield json.dumps({'next_cursor': cursor}) + '\n'
+    else:
+        yield f'], "next_cursor": {json.dumps(cursor)}}}'
+
+
+@require_GET
+def tick_range(request, script_id):
+    """
+    Ticks of one script in time order: ``/api/ticks/<script_id>/``.
+
+    Query parameters:
+        start, end: Epoch ms, date or ISO datetime (start inclusive, end exclusive)
+        limit: Page size (default 1000, at most 50000)
+        cursor: ``next_cursor`` from the previous page
+        format: 'json' (default) or 'ndjson'. NDJSON without ``limit``
+            streams the whole range; with ``limit`` the page ends with a
+            ``{"next_cursor": ...}`` line when more ticks follow
+
+    Pages use a keyset cursor rather than OFFSET and never COUNT(*), and the
+    body is streamed as rows are read.
+    """
+    params = request.GET
+    ndjson = params.get('format', 'json') == 'ndjson'
+    try:
+        start = parse_time(params['start']) if params.get('start') else None
+        end = parse_time(params['end']) if params.get('end') else None
+        after = decode_cursor(params['cursor']) if params.get('cursor') else None
+        if ndjson and 'limit' not in params:
+            limit = None
+        else:
+            limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        return JsonResponse({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}, status=400)
+    if not Script.objects.filter(id=script_id).exists():
+        return JsonResponse({'error': f'Unknown script {script_id}'}, status=404)
+
+    if limit is None:
+        rows = iter_tick_values(script_id, start, end, after=after, chunk_size=RANGE_CHUNK_SIZE)
+    else:
+        rows = islice(iter_tick_values(script_id, start, end, after=after, chunk_size=limit + 1), limit + 1)
+    body = _stream_page(rows, limit, ndjson)
+    if ndjson:
+        return StreamingHttpResponse(body, content_type='application/x-ndjson')
+
+    def json_body():
+        yield f'{{"script_id": {script_id}, "ticks": ['
+        yield from body
+
+    return StreamingHttpResponse(json_body(), content_type='application/json')
+
+
+async def live_ticks(request):
+    """
+    Server-sent events with the latest tick of each matching script:
+    ``/api/live/?script_id=1&broker_id=2`` (both repeatable; no filter means
+    every script). Needs the ASGI app. A client that falls behind receives
+    only the newest value per script.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET only'}, status=405)
+    try:
+        script_ids = [int(value) for value in request.GET.getlist('script_id')]
+        broker_ids = [int(value) for value in request.GET.getlist('broker_id')]
+    except ValueError:
+        return JsonResponse({'error': 'script_id and broker_id must be integers'}, status=400)
+
+    response = StreamingHttpResponse(
+        sse_events(get_hub(), Subscriber(script_ids, broker_ids)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+def metrics(request):
+    """
+    Prometheus text exposition of every producer and worker that published
+    metrics recently (``TICK_METRICS_ENABLED``), labelled by role and instance.
+    """
+    if not metrics_enabled():
+        return JsonResponse({'error': 'Metrics are disabled (TICK_METRICS_ENABLED)'}, status=404)
+    try:
+        snapshots = collect_snapshots(get_redis())
+    except redis.RedisError as e:
+        return JsonResponse({'error': f'Could not read metrics: {e}'}, status=503)
+    return HttpResponse(render_prometheus(snapshots), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,160 @@
+import base64
+import struct
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List, Optional, Sequence, Tuple
+
+# Columnar batch layout (little-endian):
+#   header: magic b'TKB1', row count (uint32), price scale (uint8), volume scale (uint8), 2 pad bytes
+#   then four int64 columns of `count` values each:
+#   script ids, fixed-point prices, fixed-point volumes (NULL_VOLUME for None),
+#   event timestamps in epoch microseconds
+MAGIC = b'TKB1'
+HEADER = struct.Struct('<4sIBBxx')
+NULL_VOLUME = -(2 ** 63)
+INT64_MAX = 2 ** 63 - 1
+PRICE_SCALE = 8
+VOLUME_SCALE = 8
+
+COLUMNAR_FORMAT = 'columnar-v1'
+# Any consume_tick payload plus the producer's send time, for latency metrics
+TRACED_FORMAT = 'traced-v1'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_fixed(value, scale: int) -> int:
+    """Convert a decimal string/number to an integer scaled by 10**scale, without floats"""
+    if isinstance(value, str) and 'e' not in value and 'E' not in value:
+        whole, _, fraction = value.partition('.')
+        return int(whole + fraction[:scale].ljust(scale, '0'))
+    return int(Decimal(str(value)).scaleb(scale))
+
+
+def from_fixed(value: int, scale: int) -> Decimal:
+    """Inverse of to_fixed"""
+    return Decimal(value).scaleb(-scale)
+
+
+def _column(values) -> bytes:
+    column = array('q', values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _read_column(data: bytes, offset: int, count: int) -> array:
+    column = array('q')
+    column.frombytes(data[offset:offset + count * 8])
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column
+
+
+def encode_batch(ticks: Sequence[Sequence]) -> bytes:
+    """
+    Pack compact tick rows into the columnar binary layout.
+
+    Args:
+        ticks: [script_id, tick_value, volume, received_at_producer (epoch ms)] rows
+
+    Volumes are scaled by 10**8 unless the largest one would not fit in an
+    int64; the volume scale is then lowered for the whole batch.
+    """
+    script_ids = []
+    prices = []
+    volumes = []
+    timestamps = []
+    for script_id, tick_value, volume, received_at in ticks:
+        script_ids.append(script_id)
+        prices.append(to_fixed(tick_value, PRICE_SCALE))
+        volumes.append(None if volume in (None, '') else to_fixed(volume, VOLUME_SCALE))
+        timestamps.append(int(received_at) * 1000)
+
+    volume_scale = VOLUME_SCALE
+    largest = max((v for v in volumes if v is not None), default=0)
+    while largest > INT64_MAX and volume_scale > 0:
+        volumes = [None if v is None else v // 10 for v in volumes]
+        largest //= 10
+        volume_scale -= 1
+
+    return b''.join((
+        HEADER.pack(MAGIC, len(script_ids), PRICE_SCALE, volume_scale),
+        _column(script_ids),
+        _column(prices),
+        _column(NULL_VOLUME if v is None else v for v in volumes),
+        _column(timestamps),
+    ))
+
+
+def decode_batch(data: bytes) -> List[list]:
+    """
+    Unpack a columnar batch into tick rows.
+
+    Returns:
+        list: [script_id, Decimal tick_value, Decimal volume or None, aware datetime] rows
+    """
+    magic, count, price_scale, volume_scale = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"Not a columnar tick batch (magic {magic!r})")
+    expected = HEADER.size + count * 32
+    if len(data) != expected:
+        raise ValueError(f"Columnar tick batch is {len(data)} bytes, expected {expected}")
+
+    offset = HEADER.size
+    script_ids = _read_column(data, offset, count)
+    prices = _read_column(data, offset + count * 8, count)
+    volumes = _read_column(data, offset + count * 16, count)
+    timestamps = _read_column(data, offset + count * 24, count)
+
+    return [
+        [
+            script_ids[i],
+            from_fixed(prices[i], price_scale),
+            None if volumes[i] == NULL_VOLUME else from_fixed(volumes[i], volume_scale),
+            EPOCH + timedelta(microseconds=timestamps[i]),
+        ]
+        for i in range(count)
+    ]
+
+
+def encode_payload(ticks: Sequence[Sequence]) -> dict:
+    """Wrap a columnar batch for a JSON-serialized Celery message"""
+    return {'format': COLUMNAR_FORMAT, 'data': base64.b64encode(encode_batch(ticks)).decode('ascii')}
+
+
+def trace_payload(payload, sent_at: float) -> dict:
+    """Wrap a consume_tick payload with the time (epoch seconds) the producer sent it"""
+    return {'format': TRACED_FORMAT, 'sent_at': sent_at, 'ticks': payload}
+
+
+def split_trace(tick_data) -> Tuple[object, Optional[float]]:
+    """(payload, sent_at) of a traced envelope; other payloads come back with None"""
+    if isinstance(tick_data, dict) and tick_data.get('format') == TRACED_FORMAT:
+        return tick_data['ticks'], tick_data['sent_at']
+    return tick_data, None
+
+
+def unpack_ticks(tick_data):
+    """
+    Normalize a consume_tick payload to a list of ticks.
+
+    Accepts a columnar envelope from ``encode_payload``, a traced envelope
+    from ``trace_payload`` around any payload, a single tick dict, or a
+    list of ticks (returned unchanged).
+
+    Raises:
+        ValueError: If the payload is an envelope of an unknown format, e.g.
+            from a newer producer
+    """
+    if isinstance(tick_data, dict):
+        if tick_data.get('format') == COLUMNAR_FORMAT:
+            return decode_batch(base64.b64decode(tick_data['data']))
+        if tick_data.get('format') == TRACED_FORMAT:
+            return unpack_ticks(tick_data['ticks'])
+        if 'format' in tick_data:
+            raise ValueError(f"Unknown tick payload format: {tick_data['format']}")
+        return [tick_data]
+    return tick_data
@@ -0,0 +1,286 @@
+import asyncio
+import itertools
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+import websockets
+
+from market_tick_system import profiling
+from tick_producer.codec import DepthUpdate, decode_json, parse_stream_message
+from tick_producer.websocket_client import (
+    DEPTH_STREAM_SUFFIX, build_streams_url, control_message, depth_stream, ticker_stream,
+)
+
+logger = logging.getLogger('tick_producer')
+
+# Binance allows up to 1024 streams per connection; stay well below it so
+# URLs stay short and one busy connection carries a bounded share of traffic.
+DEFAULT_STREAMS_PER_CONNECTION = 200
+
+
+class AsyncBinanceWebSocketClient:
+    """
+    asyncio Binance WebSocket client that shards symbols across connections.
+
+    Symbols are split into chunks of ``streams_per_connection`` and each chunk
+    gets its own combined-stream connection with independent reconnect and
+    backoff. All connections feed the same tick callback. Exposes the same
+    ``connect``/``disconnect``/``subscribe``/``unsubscribe`` interface as
+    ``BinanceWebSocketClient``; new symbols go to a connection with room or
+    to a new connection.
+
+    Diff depth streams of ``depth_symbols`` get connections of their own,
+    so their much higher message rate does not delay ticker frames.
+
+    ``on_frame_callback`` receives every raw ticker or depth frame before
+    it is handled, e.g. a capture ``FrameWriter``.
+    """
+
+    def __init__(self, symbols: List[str], on_tick_callback: Callable, ws_url: str,
+                 streams_per_connection: int = DEFAULT_STREAMS_PER_CONNECTION,
+                 decoder: Optional[Callable] = None, depth_symbols: Optional[List[str]] = None,
+                 on_depth_callback: Optional[Callable] = None, on_frame_callback: Optional[Callable] = None):
+        """
+        Initialize WebSocket client.
+
+        Args:
+            symbols: List of trading symbols (e.g., ['btcusdt', 'ethusdt'])
+            on_tick_callback: Callback function receiving a ``Tick`` per update
+            ws_url: Binance WebSocket URL
+            streams_per_connection: Max symbols subscribed on one connection
+            decoder: JSON ``loads`` callable (defaults to orjson when installed)
+            depth_symbols: Symbols whose diff depth stream is also subscribed
+            on_depth_callback: Callback function receiving a ``DepthUpdate`` per diff
+            on_frame_callback: Callback function receiving each raw frame before it is handled
+        """
+        if streams_per_connection < 1:
+            raise ValueError("streams_per_connection must be at least 1")
+
+        self.symbols = [s.lower() for s in symbols]
+        self.on_tick_callback = on_tick_callback
+        self.depth_symbols = [s.lower() for s in depth_symbols or []]
+        self.on_depth_callback = on_depth_callback
+        self.on_frame_callback = on_frame_callback
+        self.ws_url = ws_url
+        self.streams_per_connection = streams_per_connection
+        self.decoder = decoder or decode_json
+        self.is_running = False
+        self.reconnect_delay = 5  # seconds
+        self.max_reconnect_delay = 60  # seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event: Optional[asyncio.Event] = None
+        # Live state once running: streams and open socket per connection
+        self._shards: List[List[str]] = []
+        self._sockets: Dict[int, object] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._message_ids = itertools.count(1)
+
+    def get_shards(self) -> List[List[str]]:
+        """Split the streams into one list per connection, ticker and depth streams apart"""
+        size = self.streams_per_connection
+        shards = []
+        for streams in ([ticker_stream(s) for s in self.symbols], [depth_stream(s) for s in self.depth_symbols]):
+            shards.extend(streams[i:i + size] for i in range(0, len(streams), size))
+        return shards
+
+    def _get_stream_url(self, streams: List[str]) -> str:
+        """Construct the stream URL for one shard"""
+        return build_streams_url(self.ws_url, streams)
+
+    @profiling.timed('AsyncBinanceWebSocketClient._on_message')
+    def _on_message(self, message):
+        """Handle an incoming frame from any connection"""
+        try:
+            tick = parse_stream_message(message, self.decoder)
+            if tick is not None and self.on_frame_callback:
+                self.on_frame_callback(message)
+            if type(tick) is DepthUpdate:
+                if self.on_depth_callback:
+                    self.on_depth_callback(tick)
+            elif tick is not None:
+                self.on_tick_callback(tick)
+
+        except ValueError as e:
+            logger.error(f"Failed to parse message: {e}")
+        except Exception as e:
+            logger.error(f"Error processing message: {e}", exc_info=True)
+
+    async def _run_connection(self, index: int):
+        """Keep one shard connected until the client stops"""
+        reconnect_delay = self.reconnect_delay
+
+        while self.is_running:
+            streams = list(self._shards[index])
+            try:
+                logger.info(f"[conn {index}] Connecting to {len(streams)} streams")
+                async with websockets.connect(
+                        self._get_stream_url(streams), ping_interval=30, ping_timeout=10) as ws:
+                    logger.info(f"[conn {index}] Connected - Subscribed to {len(streams)} streams")
+                    reconnect_delay = self.reconnect_delay
+                    self._sockets[index] = ws
+                    # Catch up with changes made while connecting
+                    current = self._shards[index]
+                    added = [s for s in current if s not in streams]
+                    removed = [s for s in streams if s not in current]
+                    if added:
+                        await self._send_control(index, 'SUBSCRIBE', added)
+                    if removed:
+                        await self._send_control(index, 'UNSUBSCRIBE', removed)
+                    try:
+                        async for message in ws:
+                            self._on_message(message)
+                    finally:
+                        self._sockets.pop(index, None)
+
+                logger.warning(f"[conn {index}] WebSocket closed by server")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[conn {index}] WebSocket error: {e}")
+
+            if self.is_running:
+                logger.info(f"[conn {index}] Reconnecting in {reconnect_delay} seconds...")
+                await asyncio.sleep(reconnect_delay)
+                reconnect_delay = min(reconnect_delay * 2, self.max_reconnect_delay)
+
+    def _start_connection(self, index: int):
+        self._tasks.append(asyncio.create_task(self._run_connection(index), name=f'binance-conn-{index}'))
+
+    async def _send_control(self, index: int, method: str, streams: List[str]):
+        """Send a control request on connection ``index`` if it is open"""
+        ws = self._sockets.get(index)
+        if ws is None:
+            return
+        try:
+            await ws.send(control_message(method, streams, next(self._message_ids)))
+        except Exception as e:
+            logger.warning(f"[conn {index}] Could not send {method}: {e}")
+
+    async def _subscribe(self, symbols: List[str]):
+        added: Dict[int, List[str]] = {}
+        for symbol in symbols:
+            if symbol in self.symbols:
+                continue
+            self.symbols = self.symbols + [symbol]
+            stream = ticker_stream(symbol)
+            # Fill ticker connections (or emptied ones), never the depth ones
+            index = next((
+                i for i, shard in enumerate(self._shards)
+                if len(shard) < self.streams_per_connection and not (shard and shard[0].endswith(DEPTH_STREAM_SUFFIX))
+            ), None)
+            if index is None:
+                index = len(self._shards)
+                self._shards.append([])
+            self._shards[index].append(stream)
+            added.setdefault(index, []).append(stream)
+
+        for index, streams in added.items():
+            if index >= len(self._tasks):
+                self._start_connection(index)
+            else:
+                await self._send_control(index, 'SUBSCRIBE', streams)
+        if added:
+            logger.info(f"Subscribed to {sum(map(len, added.values()))} symbols")
+
+    async def _unsubscribe(self, symbols: List[str]):
+        removed: Dict[int, List[str]] = {}
+        for symbol in symbols:
+            stream = ticker_stream(symbol)
+            for index, shard in enumerate(self._shards):
+                if stream in shard:
+                    shard.remove(stream)
+                    removed.setdefault(index, []).append(stream)
+                    break
+        self.symbols = [s for s in self.symbols if s not in symbols]
+
+        # An emptied connection stays open on the bare endpoint for later symbols
+        for index, streams in removed.items():
+            await self._send_control(index, 'UNSUBSCRIBE', streams)
+        if removed:
+            logger.info(f"Unsubscribed from {sum(map(len, removed.values()))} symbols")
+
+    async def _unsubscribe_depth(self, symbols: List[str]):
+        removed: Dict[int, List[str]] = {}
+        for symbol in symbols:
+            stream = depth_stream(symbol)
+            for index, shard in enumerate(self._shards):
+                if stream in shard:
+                    shard.remove(stream)
+                    removed.setdefault(index, []).append(stream)
+                    break
+        self.depth_symbols = [s for s in self.depth_symbols if s not in symbols]
+
+        for index, streams in removed.items():
+            await self._send_control(index, 'UNSUBSCRIBE', streams)
+        if removed:
+            logger.info(f"Unsubscribed from {sum(map(len, removed.values()))} depth streams")
+
+    def _running_loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self.is_running:
+            return None
+        return loop
+
+    def subscribe(self, symbols: Iterable[str]):
+        """Add symbols without reconnecting. Call from any thread except the event loop's."""
+        symbols = [s.lower() for s in symbols]
+        loop = self._running_loop()
+        if loop is None:
+            # Not connected: the next connect() uses the updated symbols
+            self.symbols = self.symbols + [s for s in symbols if s not in self.symbols]
+            return
+        asyncio.run_coroutine_threadsafe(self._subscribe(symbols), loop).result(timeout=10)
+
+    def unsubscribe(self, symbols: Iterable[str]):
+        """Drop symbols without reconnecting. Call from any thread except the event loop's."""
+        symbols = [s.lower() for s in symbols]
+        loop = self._running_loop()
+        if loop is None:
+            self.symbols = [s for s in self.symbols if s not in symbols]
+            return
+        asyncio.run_coroutine_threadsafe(self._unsubscribe(symbols), loop).result(timeout=10)
+
+    def unsubscribe_depth(self, symbols: Iterable[str]):
+        """Drop the diff depth streams of symbols. Call from any thread except the event loop's."""
+        symbols = [s.lower() for s in symbols]
+        loop = self._running_loop()
+        if loop is None:
+            self.depth_symbols = [s for s in self.depth_symbols if s not in symbols]
+            return
+        asyncio.run_coroutine_threadsafe(self._unsubscribe_depth(symbols), loop).result(timeout=10)
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+
+        self._shards = self.get_shards()
+        self._sockets = {}
+        self._tasks = []
+        logger.info(f"Starting {len(self._shards)} connections for {len(self.symbols)} symbols")
+        for index in range(len(self._shards)):
+            self._start_connection(index)
+
+        try:
+            await self._stop_event.wait()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def connect(self):
+        """Open all shard connections and block until disconnect() is called"""
+        self.is_running = True
+        try:
+            asyncio.run(self._run())
+        except Exception as e:
+            logger.error(f"Connection engine failed: {e}", exc_info=True)
+            raise
+        finally:
+            self.is_running = False
+
+    def disconnect(self):
+        """Close all connections. Safe to call from any thread or a signal handler."""
+        logger.info("Disconnecting WebSocket connections...")
+        self.is_running = False
+        if self._loop and self._stop_event and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop_event.set)
@@ -0,0 +1,326 @@
+import heapq
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger('tick_producer')
+
+# Every segment starts with this, so a stray file is never replayed as frames
+SEGMENT_MAGIC = b'TICKFRM1'
+SEGMENT_SUFFIX = '.frames'
+# Per frame: receive time (epoch ns) and payload length, then the payload
+RECORD_HEADER = struct.Struct('<QI')
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024
+
+Frame = Tuple[int, bytes]
+
+
+def segment_name(prefix: str, first_recv_ns: int) -> str:
+    """``<prefix>-<first receive ns>.frames``; names sort in time order per prefix"""
+    return f"{prefix}-{first_recv_ns:020d}{SEGMENT_SUFFIX}"
+
+
+def parse_segment_name(name: str) -> Optional[Tuple[str, int]]:
+    """(prefix, first receive ns) of a segment file name, None for other files"""
+    if not name.endswith(SEGMENT_SUFFIX):
+        return None
+    prefix, sep, start = name[:-len(SEGMENT_SUFFIX)].rpartition('-')
+    if not sep or not start.isdigit():
+        return None
+    return prefix, int(start)
+
+
+class FrameWriter:
+    """
+    Appends raw WebSocket frames to rotating segment files.
+
+    ``write`` only appends the frame to an in-memory buffer, so capturing
+    costs the socket reader an encode and a list append per frame. A
+    background thread (``start``) writes the buffer out and flushes the
+    file every ``flush_interval`` seconds, or sooner once ``buffer_bytes``
+    have piled up; segment rotation and pruning run there too. If the disk
+    falls ``max_buffer_bytes`` behind, new frames are dropped (counted in
+    ``dropped``). ``flush`` and ``close`` write the buffer out on the
+    calling thread, so a writer that was never started still works.
+
+    A segment is closed once it reaches ``max_segment_bytes`` and the next
+    frame starts a new one; with ``keep_segments`` set, the oldest segments
+    of this prefix are deleted beyond that count. Several producers can
+    share a directory as long as each uses its own ``prefix``.
+
+    A write error (e.g. a full disk) is logged and stops the capture
+    rather than the producer.
+    """
+
+    def __init__(self, directory: str, prefix: str = 'frames',
+                 max_segment_bytes: int = DEFAULT_SEGMENT_BYTES, keep_segments: int = 0,
+                 flush_interval: float = 1.0, buffer_bytes: int = 1024 * 1024,
+                 max_buffer_bytes: int = 64 * 1024 * 1024):
+        """
+        Initialize writer.
+
+        Args:
+            directory: Where segment files are created (made if missing)
+            prefix: Segment file name prefix, unique per writing process
+            max_segment_bytes: Size at which a segment is rotated
+            keep_segments: Segments of this prefix kept on disk (0 keeps all)
+            flush_interval: Max seconds a frame waits before it is written and flushed
+            buffer_bytes: Buffered bytes that wake the writer thread early
+            max_buffer_bytes: Buffered bytes beyond which new frames are dropped
+        """
+        if max_segment_bytes < 1:
+            raise ValueError("max_segment_bytes must be at least 1")
+        if keep_segments < 0:
+            raise ValueError("keep_segments must not be negative")
+
+        self.directory = directory
+        self.prefix = prefix
+        self.max_segment_bytes = max_segment_bytes
+        self.keep_segments = keep_segments
+        self.flush_interval = flush_interval
+        self.buffer_bytes = buffer_bytes
+        self.max_buffer_bytes = max_buffer_bytes
+        self.frames = 0
+        self.dropped = 0
+        self.segments = 0
+        self.closed = False
+        self._pending: List[Frame] = []
+        self._pending_bytes = 0
+        self._condition = threading.Condition()
+        # Held by whichever thread is doing file I/O
+        self._io_lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._stopped = False
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, frame: Union[str, bytes], recv_ns: Optional[int] = None):
+        """Buffer one frame, stamped with ``recv_ns`` (default: now)"""
+        if recv_ns is None:
+            recv_ns = time.time_ns()
+        payload = frame.encode() if isinstance(frame, str) else frame
+        size = RECORD_HEADER.size + len(payload)
+        with self._condition:
+            if self.closed:
+                return
+            if self._pending_bytes + size > self.max_buffer_bytes:
+                self.dropped += 1
+                return
+            self._pending.append((recv_ns, payload))
+            self._pending_bytes += size
+            self.frames += 1
+            if self._pending_bytes >= self.buffer_bytes:
+                self._condition.notify()
+
+    __call__ = write
+
+    def start(self):
+        """Start the thread that writes buffered frames to disk"""
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='frame-capture', daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """Write buffered frames out and flush the file"""
+        self._drain()
+
+    def close(self):
+        """Stop the writer thread, write what is buffered and close the segment"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._drain()
+        with self._condition:
+            self.closed = True
+        with self._io_lock:
+            if self._file is not None:
+                self._close_segment()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopped and self._pending_bytes < self.buffer_bytes:
+                    self._condition.wait(self.flush_interval)
+                stopped = self._stopped
+            self._drain()
+            if stopped:
+                return
+
+    def _drain(self):
+        with self._io_lock:
+            with self._condition:
+                frames, self._pending = self._pending, []
+                self._pending_bytes = 0
+                if self.closed or not frames:
+                    return
+            try:
+                for recv_ns, payload in frames:
+                    if self._file is None:
+                        self._open(recv_ns)
+                    self._file.write(RECORD_HEADER.pack(recv_ns, len(payload)))
+                    self._file.write(payload)
+                    self._size += RECORD_HEADER.size + len(payload)
+                    if self._size >= self.max_segment_bytes:
+                        self._close_segment()
+                if self._file is not None:
+                    self._file.flush()
+            except OSError as e:
+                logger.error(f"Frame capture to {self.directory} failed, capture stopped: {e}")
+                with self._condition:
+                    self.closed = True
+                    self._pending = []
+                    self._pending_bytes = 0
+                self._discard()
+
+    def _open(self, recv_ns: int):
+        path = os.path.join(self.directory, segment_name(self.prefix, recv_ns))
+        self._file = open(path, 'xb', buffering=1024 * 1024)
+        self._file.write(SEGMENT_MAGIC)
+        self._size = len(SEGMENT_MAGIC)
+        self.segments += 1
+        if self.keep_segments:
+            self._prune()
+
+    def _close_segment(self):
+        try:
+            self._file.close()
+        finally:
+            self._file = None
+
+    def _discard(self):
+        try:
+            if self._file is not None:
+                self._file.close()
+        except OSError:
+            pass
+        self._file = None
+
+    def _prune(self):
+        """Delete this prefix's oldest segments beyond ``keep_segments``"""
+        paths = find_segments(self.directory).get(self.prefix, [])
+        for path in paths[:-self.keep_segments]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not delete old capture segment {path}: {e}")
+
+
+class FrameReader:
+    """
+    Iterates the frames of one segment file through ``mmap``.
+
+    Payloads are sliced straight out of the mapping, so reading costs no
+    per-frame system calls. A record cut short at the end of the file (a
+    producer that died mid-write) ends the iteration with a warning.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __iter__(self) -> Iterator[Frame]:
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < len(SEGMENT_MAGIC):
+                logger.warning(f"Skipping empty capture segment {self.path}")
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if mapped[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                    raise ValueError(f"{self.path} is not a frame capture segment")
+                unpack = RECORD_HEADER.unpack_from
+                header_size = RECORD_HEADER.size
+                end = len(mapped)
+                offset = len(SEGMENT_MAGIC)
+                while offset + header_size <= end:
+                    recv_ns, length = unpack(mapped, offset)
+                    start = offset + header_size
+                    offset = start + length
+                    if offset > end:
+                        break
+                    yield recv_ns, mapped[start:offset]
+                if offset != end:
+                    logger.warning(f"Capture segment {self.path} ends with a truncated frame")
+
+
+def find_segments(directory: str) -> Dict[str, List[str]]:
+    """prefix -> segment paths of that prefix in time order"""
+    found = defaultdict(list)
+    for name in os.listdir(directory):
+        parsed = parse_segment_name(name)
+        if parsed:
+            found[parsed[0]].append((parsed[1], os.path.join(directory, name)))
+    return {prefix: [path for _, path in sorted(paths)] for prefix, paths in found.items()}
+
+
+def read_frames(path: str, since_ns: Optional[int] = None, until_ns: Optional[int] = None) -> Iterator[Frame]:
+    """
+    Frames of a segment file, or of every segment in a directory.
+
+    Segments of different prefixes (e.g. the shards of one broker) are
+    merged by receive time. ``since_ns``/``until_ns`` bound the receive
+    time; segments that end before ``since_ns`` are not opened.
+    """
+    if os.path.isdir(path):
+        streams = []
+        for paths in find_segments(path).values():
+            if since_ns is not None:
+                # A segment ends where the next one starts
+                starts = [parse_segment_name(os.path.basename(p))[1] for p in paths]
+                paths = [p for p, next_start in zip(paths, starts[1:] + [None])
+                         if next_start is None or next_start > since_ns]
+            streams.append(_chain(paths))
+        frames = heapq.merge(*streams, key=lambda frame: frame[0])
+    else:
+        frames = iter(FrameReader(path))
+
+    for frame in frames:
+        if since_ns is not None and frame[0] < since_ns:
+            continue
+        if until_ns is not None and frame[0] > until_ns:
+            break
+        yield frame
+
+
+def _chain(paths: Iterable[str]) -> Iterator[Frame]:
+    for path in paths:
+        yield from FrameReader(path)
+
+
+def replay(frames: Iterable[Frame], on_frame: Callable[[bytes], None], speed: float = 1.0,
+           stop_event: Optional[threading.Event] = None) -> int:
+    """
+    Feed frames to ``on_frame`` with their original spacing divided by ``speed``.
+
+    ``speed=0`` replays as fast as ``on_frame`` accepts frames. Pacing is
+    against the start of the replay, so time spent in ``on_frame`` does not
+    add up as drift.
+
+    Returns:
+        int: Number of frames replayed
+    """
+    if speed < 0:
+        raise ValueError("speed must not be negative")
+    count = 0
+    started = time.monotonic()
+    first_ns = None
+    for recv_ns, frame in frames:
+        if stop_event is not None and stop_event.is_set():
+            break
+        if speed:
+            if first_ns is None:
+                first_ns = recv_ns
+            delay = started + (recv_ns - first_ns) / 1e9 / speed - time.monotonic()
+            if delay > 0:
+                if stop_event is None:
+                    time.sleep(delay)
+                elif stop_event.wait(delay):
+                    break
+        on_frame(frame)
+        count += 1
+    return count
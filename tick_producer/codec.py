@@ -0,0 +1,113 @@
+import json
+import logging
+from importlib import import_module
+from typing import Callable, List, NamedTuple, Optional, Union
+
+logger = logging.getLogger('tick_producer')
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+class Tick(NamedTuple):
+    """
+    Compact tick as parsed from a ``24hrTicker`` frame.
+
+    Price and volume stay as the exchange's decimal strings and the event
+    time stays as integer epoch milliseconds; conversion to Decimal and
+    datetime happens only when the row is written to the database.
+    """
+    symbol: str
+    price: str
+    volume: Optional[str]
+    event_time: int  # epoch milliseconds (Binance ``E``)
+
+
+class DepthUpdate(NamedTuple):
+    """
+    A ``depthUpdate`` diff: the price levels that changed between update
+    ids ``first_id`` and ``final_id``. A quantity of zero removes the level.
+    """
+    symbol: str
+    first_id: int  # Binance ``U``
+    final_id: int  # Binance ``u``
+    bids: List[List[str]]  # [[price, quantity], ...]
+    asks: List[List[str]]
+    event_time: int  # epoch milliseconds (Binance ``E``)
+
+
+def get_decoder(name: Optional[str] = None) -> Callable:
+    """
+    Resolve a JSON decoder.
+
+    Args:
+        name: ``'auto'``/None (orjson if installed, else json), ``'orjson'``,
+            ``'json'``, or a dotted path to any ``loads``-style callable
+            (e.g. ``'msgspec.json.decode'``)
+
+    Returns:
+        Callable: A function that takes ``str``/``bytes`` and returns Python objects
+    """
+    if name in (None, '', 'auto'):
+        return orjson.loads if orjson is not None else json.loads
+    if name == 'orjson':
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+        return orjson.loads
+    if name == 'json':
+        return json.loads
+
+    module_path, _, attr = name.rpartition('.')
+    if not module_path:
+        raise ValueError(f"Unknown JSON decoder: {name}")
+    return getattr(import_module(module_path), attr)
+
+
+decode_json = get_decoder()
+
+
+def parse_ticker_message(message, loads: Callable = decode_json) -> Optional[Tick]:
+    """
+    Parse a raw Binance frame into a Tick.
+
+    Handles both raw streams and the combined-stream wrapper. Returns None
+    for frames that are not ``24hrTicker`` events.
+
+    Raises:
+        ValueError: If the frame is not valid JSON (``json.JSONDecodeError``
+            and ``orjson.JSONDecodeError`` both subclass it)
+    """
+    data = loads(message)
+
+    # Combined streams wrap payload: {"stream": "btcusdt@ticker", "data": {...}}
+    if 'stream' in data:
+        data = data.get('data', data)
+
+    if data.get('e') != '24hrTicker':
+        return None
+
+    return Tick(data['s'], data['c'], data.get('v'), data['E'])
+
+
+def parse_stream_message(message, loads: Callable = decode_json) -> Union[Tick, DepthUpdate, None]:
+    """
+    Parse a raw Binance frame into a Tick or a DepthUpdate.
+
+    Like parse_ticker_message, but also recognises ``depthUpdate`` events.
+    Returns None for any other frame (e.g. SUBSCRIBE responses).
+
+    Raises:
+        ValueError: If the frame is not valid JSON
+    """
+    data = loads(message)
+    if 'stream' in data:
+        data = data.get('data', data)
+
+    event = data.get('e')
+    if event == '24hrTicker':
+        return Tick(data['s'], data['c'], data.get('v'), data['E'])
+    if event == 'depthUpdate':
+        return DepthUpdate(data['s'], data['U'], data['u'], data['b'], data['a'], data['E'])
+    return None
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger('tick_producer')
+
+
+class ConflationPolicy(NamedTuple):
+    """How one script's ticks are sampled"""
+    interval: Optional[float]       # seconds between emissions, None for threshold only
+    threshold_bps: Optional[float]  # emit at once on a move this large (basis points) since the last emission
+
+    @classmethod
+    def from_additional_data(cls, additional_data: Optional[Dict]) -> Optional['ConflationPolicy']:
+        """
+        Read ``Script.additional_data['conflation']``, e.g.
+        ``{"interval_ms": 250, "threshold_bps": 5}``. Returns None (forward
+        every tick) when the script has no conflation settings.
+
+        Raises:
+            ValueError: If the settings are invalid
+        """
+        config = (additional_data or {}).get('conflation')
+        if not config:
+            return None
+        interval_ms = config.get('interval_ms')
+        threshold_bps = config.get('threshold_bps')
+        if interval_ms is None and threshold_bps is None:
+            raise ValueError("conflation needs interval_ms and/or threshold_bps")
+        if interval_ms is not None and float(interval_ms) <= 0:
+            raise ValueError("conflation interval_ms must be positive")
+        if threshold_bps is not None and float(threshold_bps) <= 0:
+            raise ValueError("conflation threshold_bps must be positive")
+        return cls(
+            None if interval_ms is None else float(interval_ms) / 1000.0,
+            None if threshold_bps is None else float(threshold_bps),
+        )
+
+
+class Conflator:
+    """
+    Keeps only the latest tick per script and emits it at a fixed cadence.
+
+    Sits between the WebSocket client and the batcher. For a script with a
+    policy, the first tick goes out at once; later ticks replace each other
+    until ``interval`` has passed since the last emission, when the latest
+    is emitted. A tick that moves the price by ``threshold_bps`` or more from
+    the last emitted price is emitted immediately. Scripts without a policy
+    pass straight through.
+    """
+
+    def __init__(self, emit: Callable[[Sequence], None], policies: Dict[int, ConflationPolicy]):
+        """
+        Initialize conflator.
+
+        Args:
+            emit: Called with each row that is let through (e.g. ``TickBatcher.add``)
+            policies: script_id -> ConflationPolicy for the scripts to conflate
+        """
+        self.emit = emit
+        self.policies = policies
+        self.received = 0
+        self.emitted = 0
+        self._pending: Dict[int, Sequence] = {}
+        self._last_price: Dict[int, float] = {}
+        self._last_emit: Dict[int, float] = {}
+        self._due: Dict[int, float] = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def conflated(self) -> int:
+        """Ticks dropped because a newer one replaced them"""
+        return self.received - self.emitted - len(self._pending)
+
+    def start(self):
+        """Start the thread that emits conflated ticks when they are due"""
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='tick-conflator', daemon=True)
+        self._thread.start()
+
+    def add(self, row: Sequence):
+        """
+        Offer a row: (script_id, tick_value, volume, received_at_producer)
+        """
+        script_id = row[0]
+        policy = self.policies.get(script_id)
+        if policy is None:
+            self.emit(row)
+            return
+
+        with self._condition:
+            self.received += 1
+            now = time.monotonic()
+            emit_now = script_id not in self._last_emit
+            if not emit_now and policy.threshold_bps is not None:
+                last_price = self._last_price[script_id]
+                emit_now = last_price > 0 and abs(float(row[1]) - last_price) * 10000 >= policy.threshold_bps * last_price
+            if not emit_now and policy.interval is not None:
+                emit_now = now - self._last_emit[script_id] >= policy.interval
+
+            if not emit_now:
+                self._pending[script_id] = row
+                if policy.interval is not None and script_id not in self._due:
+                    self._due[script_id] = self._last_emit[script_id] + policy.interval
+                    self._condition.notify()
+                return
+
+            self._pending.pop(script_id, None)
+            self._due.pop(script_id, None)
+            self._mark_emitted(script_id, row, now)
+
+        self.emit(row)
+
+    def set_policies(self, policies: Dict[int, ConflationPolicy]):
+        """Swap in new policies; ticks held for scripts that lost theirs are emitted now"""
+        with self._condition:
+            self.policies = policies
+            rows = [row for script_id, row in self._pending.items() if script_id not in policies]
+            now = time.monotonic()
+            for row in rows:
+                del self._pending[row[0]]
+                self._due.pop(row[0], None)
+                self._mark_emitted(row[0], row, now)
+        for row in rows:
+            self.emit(row)
+
+    def flush(self):
+        """Emit every pending tick now"""
+        with self._condition:
+            rows = list(self._pending.values())
+            now = time.monotonic()
+            for row in rows:
+                self._mark_emitted(row[0], row, now)
+            self._pending.clear()
+            self._due.clear()
+        for row in rows:
+            self.emit(row)
+
+    def stop(self):
+        """Stop the emitter thread and emit pending ticks"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _mark_emitted(self, script_id: int, row: Sequence, now: float):
+        """Caller must hold the lock."""
+        self._last_emit[script_id] = now
+        self._last_price[script_id] = float(row[1])
+        self.emitted += 1
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._due and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+                now = time.monotonic()
+                next_due = min(self._due.values())
+                if next_due > now:
+                    # Woken early by a new due time or stop(); re-check
+                    self._condition.wait(next_due - now)
+                    continue
+
+                rows = []
+                for script_id, due in list(self._due.items()):
+                    if due <= now:
+                        del self._due[script_id]
+                        row = self._pending.pop(script_id, None)
+                        if row is not None:
+                            self._mark_emitted(script_id, row, now)
+                            rows.append(row)
+
+            for row in rows:
+                try:
+                    self.emit(row)
+                except Exception as e:
+                    logger.error(f"Failed to emit conflated tick: {e}", exc_info=True)
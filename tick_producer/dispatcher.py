@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List
+
+logger = logging.getLogger('tick_producer')
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_BATCH_INTERVAL_MS = 50
+
+
+class TickBatcher:
+    """
+    Collects tick payloads and hands them to a flush callback as one list.
+
+    A batch is flushed as soon as it holds ``max_batch_size`` payloads, or
+    ``max_latency_ms`` after its first payload was added, whichever comes
+    first. The time limit bounds the extra latency batching can add.
+    """
+
+    def __init__(self, flush_callback: Callable[[List[Dict]], None],
+                 max_batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_latency_ms: int = DEFAULT_BATCH_INTERVAL_MS):
+        """
+        Initialize batcher.
+
+        Args:
+            flush_callback: Called with each batch (e.g. ``consume_tick.delay``)
+            max_batch_size: Flush once this many payloads are buffered
+            max_latency_ms: Flush once the oldest buffered payload is this old
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_latency_ms <= 0:
+            raise ValueError("max_latency_ms must be positive")
+
+        self.flush_callback = flush_callback
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self._buffer: List[Dict] = []
+        self._first_added_at = 0.0
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    @classmethod
+    def from_api_config(cls, api_config: Dict, flush_callback: Callable[[List[Dict]], None]):
+        """Build a batcher from ``batch_size``/``batch_interval_ms`` in ``Broker.api_config``"""
+        api_config = api_config or {}
+        return cls(
+            flush_callback=flush_callback,
+            max_batch_size=int(api_config.get('batch_size', DEFAULT_BATCH_SIZE)),
+            max_latency_ms=float(api_config.get('batch_interval_ms', DEFAULT_BATCH_INTERVAL_MS)),
+        )
+
+    def start(self):
+        """Start the background thread that enforces the time limit"""
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='tick-batcher', daemon=True)
+        self._thread.start()
+
+    def add(self, payload: Dict):
+        """Buffer a payload, flushing in the calling thread if the batch is full"""
+        batch = None
+        with self._condition:
+            if not self._buffer:
+                self._first_added_at = time.monotonic()
+                self._condition.notify()
+            self._buffer.append(payload)
+            if len(self._buffer) >= self.max_batch_size:
+                batch = self._take()
+
+        if batch:
+            self._dispatch(batch)
+
+    def flush(self):
+        """Flush whatever is buffered right now"""
+        with self._condition:
+            batch = self._take()
+        if batch:
+            self._dispatch(batch)
+
+    def stop(self):
+        """Stop the background thread and flush remaining payloads"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def _take(self) -> List[Dict]:
+        """Swap out the current buffer. Caller must hold the lock."""
+        batch = self._buffer
+        self._buffer = []
+        return batch
+
+    def _dispatch(self, batch: List[Dict]):
+        try:
+            self.flush_callback(batch)
+            logger.debug(f"Flushed batch of {len(batch)} ticks")
+        except Exception as e:
+            logger.error(f"Failed to flush batch of {len(batch)} ticks: {e}", exc_info=True)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._buffer and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+                remaining = self._first_added_at + self.max_latency - time.monotonic()
+                if remaining > 0:
+                    # Woken early by stop() or a size-triggered flush; re-check
+                    self._condition.wait(remaining)
+                    continue
+
+                batch = self._take()
+
+            self._dispatch(batch)
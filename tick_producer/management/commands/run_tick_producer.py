@@ -1,8 +1,18 @@
 from django.core.management.base import BaseCommand, CommandError
-from tick_consumer.tasks import get_broker, consume_tick
+from tick_consumer.tasks import get_broker
 from tick_producer.websocket_client import BinanceWebSocketClient
+from tick_producer.async_client import AsyncBinanceWebSocketClient, DEFAULT_STREAMS_PER_CONNECTION
+from tick_producer.codec import get_decoder
+from tick_producer.pipeline import SnapshotDispatcher, TickPipeline, conflation_policies
+from tick_producer.capture import FrameWriter
+from tick_producer.supervisor import parse_shard, shard_scripts
+from tick_producer.script_watch import ScriptWatcher, diff_symbols
+from tick_producer.orderbook import BookConfig, OrderBookEngine, fetch_depth_snapshot
+from market_tick_system import metrics, profiling
 from django.conf import settings
+import functools
 import logging
+import os
 import signal
 import sys
 from datetime import datetime
@@ -11,7 +21,7 @@ logger = logging.getLogger('tick_producer')
 
 
 class Command(BaseCommand):
-    help = 'Run tick producer for specified broker - connects to WebSocket and forwards ticks to Celery'
+    help = 'Run tick producer for specified broker - connects to WebSocket and forwards ticks to Celery or Redis Streams'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -20,9 +30,24 @@ class Command(BaseCommand):
             required=True,
             help='Broker ID to fetch configuration from'
         )
+        parser.add_argument(
+            '--shard',
+            help='Only handle the scripts of shard index/count (script_id %% count == index), e.g. 0/4'
+        )
+        parser.add_argument(
+            '--capture_dir',
+            help='Capture raw frames under this directory for replay_ticks '
+                 '(default: TICK_CAPTURE_DIR; an empty value disables capture)'
+        )
 
     def handle(self, *args, **options):
         broker_id = options['broker_id']
+        shard = None
+        if options['shard']:
+            try:
+                shard = parse_shard(options['shard'])
+            except ValueError as e:
+                raise CommandError(str(e))
 
         self.stdout.write(f"Starting tick producer for broker ID: {broker_id}")
 
@@ -47,6 +72,15 @@ class Command(BaseCommand):
             if not scripts:
                 raise CommandError(f"No scripts configured for broker {broker_id}")
 
+            if shard:
+                scripts = shard_scripts(scripts, *shard)
+                self.stdout.write(f"Running shard {shard[0]}/{shard[1]}")
+                if not scripts:
+                    # Stays connected to the bare endpoint; scripts added later are subscribed live
+                    self.stdout.write(self.style.WARNING(
+                        f"Shard {shard[0]}/{shard[1]} has no scripts yet, waiting for new ones"
+                    ))
+
             # Create symbol -> script_id mapping
             symbol_map = {
                 script['trading_symbol']: script['id']
@@ -56,45 +90,153 @@ class Command(BaseCommand):
             symbols = list(symbol_map.keys())
             self.stdout.write(f"Monitoring {len(symbols)} symbols: {', '.join(symbols)}")
 
-            # Tick callback handler
-            def on_tick(tick_data):
-                """Process incoming tick and send to Celery"""
-                try:
-                    symbol = tick_data['symbol']
-                    script_id = symbol_map.get(symbol)
+            api_config = broker_data.get('api_config') or {}
 
-                    if not script_id:
-                        logger.warning(f"Received tick for unmapped symbol: {symbol}")
-                        return
+            try:
+                pipeline = TickPipeline(broker_id, api_config, scripts)
+            except ValueError as e:
+                raise CommandError(str(e))
+            batcher, tick_queue, workers = pipeline.batcher, pipeline.tick_queue, pipeline.workers
 
-                    tick_payload = {
-                        'script_id': script_id,
-                        'tick_value': str(tick_data['price']),
-                        'volume': str(tick_data['volume']) if tick_data.get('volume') else None,
-                        'received_at_producer': tick_data['timestamp'].isoformat()
-                    }
+            self.stdout.write(
+                f"Batching up to {batcher.max_batch_size} ticks "
+                f"or {batcher.max_latency * 1000:g} ms per flush via {pipeline.transport}"
+            )
+            self.stdout.write(
+                f"Queueing up to {tick_queue.capacity} ticks ({tick_queue.policy} on overflow) "
+                f"for {workers.workers} dispatch threads"
+            )
+            if pipeline.conflator:
+                self.stdout.write(f"Conflating {len(pipeline.policies)} of {len(symbols)} symbols")
+            if pipeline.metrics:
+                self.stdout.write("Recording pipeline metrics")
 
-                    # Send to Celery asynchronously
-                    consume_tick.delay(tick_payload)
+            # Order books from diff depth streams, per Script.additional_data['order_book']
+            book_configs = {}
+            for script in scripts:
+                try:
+                    book_config = BookConfig.from_additional_data(script.get('additional_data'))
+                except (TypeError, ValueError) as e:
+                    raise CommandError(f"Invalid order book config for {script['trading_symbol']}: {e}")
+                if book_config:
+                    book_configs[script['trading_symbol']] = book_config
 
-                    logger.info(f"Forwarded tick: {symbol} @ {tick_data['price']}")
+            book_engine = snapshot_dispatcher = None
+            if book_configs:
+                # Snapshots are small and infrequent: sent about once a second, off the reader thread
+                snapshot_dispatcher = SnapshotDispatcher()
+                book_engine = OrderBookEngine(
+                    book_configs,
+                    symbol_map,
+                    snapshot_dispatcher.put,
+                    fetch_snapshot=functools.partial(
+                        fetch_depth_snapshot,
+                        rest_url=getattr(settings, 'BINANCE_REST_URL', 'https://api.binance.com')
+                    )
+                )
+                self.stdout.write(f"Keeping order books for {len(book_configs)} symbols")
+            depth_symbols = list(book_configs)
+            on_depth = book_engine.on_depth if book_engine else None
 
-                except Exception as e:
-                    logger.error(f"Error handling tick: {e}", exc_info=True)
+            # Raw frames to rotating segment files, for replay_ticks
+            capture = None
+            capture_dir = options['capture_dir'] if options.get('capture_dir') is not None \
+                else getattr(settings, 'TICK_CAPTURE_DIR', '')
+            if capture_dir:
+                capture = FrameWriter(
+                    os.path.join(capture_dir, f'broker_{broker_id}'),
+                    prefix=f'shard{shard[0]}of{shard[1]}' if shard else 'frames',
+                    max_segment_bytes=int(getattr(settings, 'TICK_CAPTURE_SEGMENT_MB', 256)) * 1024 * 1024,
+                    keep_segments=int(getattr(settings, 'TICK_CAPTURE_KEEP_SEGMENTS', 0))
+                )
+                capture.start()
+                self.stdout.write(f"Capturing raw frames to {capture.directory}")
 
             # Get WebSocket URL from settings
             ws_url = getattr(settings, 'BINANCE_WS_URL',
                            'wss://stream.binance.com:9443/ws')
+            decoder = get_decoder(getattr(settings, 'TICK_JSON_DECODER', 'auto'))
 
             # Initialize WebSocket client
-            ws_client = BinanceWebSocketClient(
-                symbols=symbols,
-                on_tick_callback=on_tick,
-                ws_url=ws_url
-            )
+            engine = api_config.get('engine', 'threaded')
+            if engine == 'asyncio':
+                ws_client = AsyncBinanceWebSocketClient(
+                    symbols=symbols,
+                    on_tick_callback=pipeline.on_tick,
+                    ws_url=ws_url,
+                    decoder=decoder,
+                    depth_symbols=depth_symbols,
+                    on_depth_callback=on_depth,
+                    on_frame_callback=capture,
+                    streams_per_connection=int(
+                        api_config.get('streams_per_connection', DEFAULT_STREAMS_PER_CONNECTION)
+                    )
+                )
+                self.stdout.write(
+                    f"Using asyncio engine with {len(ws_client.get_shards())} connections"
+                )
+            elif engine == 'threaded':
+                ws_client = BinanceWebSocketClient(
+                    symbols=symbols,
+                    on_tick_callback=pipeline.on_tick,
+                    ws_url=ws_url,
+                    decoder=decoder,
+                    depth_symbols=depth_symbols,
+                    on_depth_callback=on_depth,
+                    on_frame_callback=capture,
+                    redundancy=int(api_config.get('redundant_connections', 1))
+                )
+                if ws_client.redundancy > 1:
+                    self.stdout.write(
+                        f"Using {ws_client.redundancy} redundant connections with deduplication"
+                    )
+            else:
+                raise CommandError(f"Unsupported WebSocket engine: {engine}")
+
+            # Follow Script changes on the open connections instead of restarting
+            def load_scripts():
+                changed = get_broker(broker_id).get('scripts', [])
+                if shard:
+                    changed = shard_scripts(changed, *shard)
+                return changed
+
+            def apply_script_changes(new_scripts):
+                new_map = {script['trading_symbol']: script['id'] for script in new_scripts}
+                added, removed = diff_symbols(pipeline.symbol_map, new_map)
+                try:
+                    policies = conflation_policies(new_scripts)
+                except ValueError as e:
+                    logger.error(f"{e}; keeping the previous conflation policies")
+                    policies = pipeline.policies
+                # Policies before the map, so a new script's first ticks are already conflated
+                pipeline.set_policies(policies)
+                if added:
+                    # Map first, so the first ticks of new symbols are not dropped as unmapped
+                    pipeline.symbol_map = {**pipeline.symbol_map, **new_map}
+                    ws_client.subscribe(added)
+                if removed:
+                    ws_client.unsubscribe(removed)
+                    # Deleted scripts' books go too; books for new or changed
+                    # order_book settings are only created at startup
+                    removed_books = [symbol for symbol in removed if book_engine and symbol in book_engine.books]
+                    if removed_books:
+                        ws_client.unsubscribe_depth(removed_books)
+                        book_engine.remove(removed_books)
+                pipeline.symbol_map = new_map
+                if book_engine:
+                    book_engine.symbol_map = new_map
+                if added or removed:
+                    logger.info(f"Scripts changed: +{len(added)} -{len(removed)}, now {len(new_map)} symbols")
+
+            watch_interval = getattr(settings, 'TICK_SCRIPT_WATCH_INTERVAL', 5)
+            watcher = ScriptWatcher(load_scripts, apply_script_changes, interval=watch_interval) \
+                if watch_interval > 0 else None
 
             # Graceful shutdown handler
             def signal_handler(sig, frame):
+                # Runs on the main thread, possibly inside on_tick while it holds
+                # the conflator or queue lock: only disconnect here and leave the
+                # stops to the finally block below
                 self.stdout.write("\nShutting down tick producer...")
                 ws_client.disconnect()
                 sys.exit(0)
@@ -104,7 +246,27 @@ class Command(BaseCommand):
 
             # Start WebSocket connection (blocking)
             self.stdout.write(self.style.SUCCESS("WebSocket client starting..."))
-            ws_client.connect()
+            pipeline.start()
+            metrics.start_pusher('producer', broker=broker_id, shard=options['shard'] or 'all')
+            profiling.enable('producer')
+            if book_engine:
+                snapshot_dispatcher.start()
+                book_engine.start()
+            if watcher:
+                watcher.start()
+            try:
+                ws_client.connect()
+            finally:
+                if watcher:
+                    watcher.stop()
+                pipeline.stop()
+                if book_engine:
+                    book_engine.stop()
+                    snapshot_dispatcher.stop()
+                if capture:
+                    capture.close()
+                metrics.stop_pusher()
+                profiling.disable()
 
         except Exception as e:
             raise CommandError(f"Failed to start tick producer: {e}")
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from tick_consumer.models import Broker
+from tick_producer.supervisor import BrokerPool, ProducerSupervisor
+import logging
+import os
+import signal
+
+logger = logging.getLogger('tick_producer')
+
+
+class Command(BaseCommand):
+    help = 'Run tick producers for several brokers, sharding each broker\'s scripts across processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--broker_id',
+            type=int,
+            action='append',
+            help='Broker ID to run producers for (repeatable, default: all Binance brokers)'
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            help='Producer processes per broker (default: api_config "processes", '
+                 'else the CPU count split across brokers)'
+        )
+        parser.add_argument('--max_crashes', type=int, default=5,
+                            help='Crashes within --crash_window that shrink a broker\'s pool by one process')
+        parser.add_argument('--crash_window', type=float, default=60, help='Seconds over which crashes are counted')
+        parser.add_argument('--backoff_max', type=float, default=60, help='Max seconds between restarts')
+
+    def handle(self, *args, **options):
+        brokers = Broker.objects.prefetch_related('scripts')
+        if options['broker_id']:
+            brokers = brokers.filter(id__in=options['broker_id'])
+            missing = set(options['broker_id']) - {broker.id for broker in brokers}
+            if missing:
+                raise CommandError(f"Brokers not found: {', '.join(map(str, sorted(missing)))}")
+            unsupported = [broker.name for broker in brokers if broker.type != 'BINANCE']
+            if unsupported:
+                raise CommandError(f"Unsupported broker type for: {', '.join(unsupported)}")
+        else:
+            brokers = brokers.filter(type='BINANCE')
+
+        brokers = [broker for broker in brokers if broker.scripts.all()]
+        if not brokers:
+            raise CommandError("No brokers with scripts to run")
+
+        default_processes = max(1, (os.cpu_count() or 1) // len(brokers))
+        pools = []
+        for broker in brokers:
+            processes = options['processes'] or int((broker.api_config or {}).get('processes', default_processes))
+            if processes < 1:
+                raise CommandError(f"Invalid process count for broker {broker.id}: {processes}")
+            pools.append(BrokerPool(broker.id, [script.id for script in broker.scripts.all()], processes))
+
+        supervisor = ProducerSupervisor(
+            pools,
+            max_crashes=options['max_crashes'],
+            crash_window=options['crash_window'],
+            backoff_max=options['backoff_max']
+        )
+
+        stopping = []
+
+        def signal_handler(sig, frame):
+            self.stdout.write("\nShutting down tick producers...")
+            stopping.append(sig)
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        for pool in pools:
+            self.stdout.write(
+                f"Broker {pool.broker_id}: {len(pool.script_ids)} scripts, {pool.shard_count} processes"
+            )
+        self.stdout.write(self.style.SUCCESS("Supervising tick producers..."))
+        supervisor.run(should_stop=lambda: bool(stopping))
+        self.stdout.write(self.style.SUCCESS("All tick producers stopped"))
@@ -0,0 +1,333 @@
+import json
+import logging
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from tick_producer.codec import DepthUpdate
+
+logger = logging.getLogger('tick_producer')
+
+DEFAULT_REST_URL = 'https://api.binance.com'
+# Levels requested with the REST snapshot (Binance allows up to 5000)
+SNAPSHOT_LIMIT = 1000
+# Levels kept per side; deeper ones are dropped (they drift out of the snapshot range anyway)
+DEFAULT_MAX_DEPTH = 5000
+# Diffs buffered per symbol while its REST snapshot loads
+MAX_BUFFERED_UPDATES = 10000
+
+# OrderBook.apply results
+APPLIED = 'applied'
+STALE = 'stale'
+GAP = 'gap'
+
+
+class BookConfig(NamedTuple):
+    """How one script's order book is snapshotted"""
+    levels: int       # levels per side stored in each snapshot
+    interval_ms: int  # exchange-time milliseconds between snapshots
+
+    @classmethod
+    def from_additional_data(cls, additional_data: Optional[Dict]) -> Optional['BookConfig']:
+        """
+        Read ``Script.additional_data['order_book']``, e.g.
+        ``{"levels": 20, "interval_ms": 1000}``. Returns None (no depth
+        stream) when the script has no order book settings.
+
+        Raises:
+            ValueError: If the settings are invalid
+        """
+        config = (additional_data or {}).get('order_book')
+        if not config:
+            return None
+        levels = int(config.get('levels', 20))
+        interval_ms = int(config.get('interval_ms', 1000))
+        if levels < 1:
+            raise ValueError("order_book levels must be at least 1")
+        if interval_ms < 1:
+            raise ValueError("order_book interval_ms must be positive")
+        return cls(levels, interval_ms)
+
+
+class BookSide:
+    """
+    One side of a book as parallel lists sorted best first.
+
+    ``keys`` holds the float prices (negated for bids, so both sides sort
+    ascending) and is searched with ``bisect``; ``prices`` and
+    ``quantities`` keep the exchange's strings for storage. Updating an
+    existing level is a binary search and one assignment; adding or
+    removing one shifts three contiguous arrays, which stays cheap at
+    order book depths.
+    """
+    __slots__ = ('descending', 'max_depth', 'keys', 'prices', 'quantities')
+
+    def __init__(self, descending: bool, max_depth: int = DEFAULT_MAX_DEPTH):
+        self.descending = descending
+        self.max_depth = max_depth
+        self.keys: List[float] = []
+        self.prices: List[str] = []
+        self.quantities: List[str] = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def replace(self, levels: Iterable[List[str]]):
+        """Load a full side from ``[[price, quantity], ...]``"""
+        sign = -1.0 if self.descending else 1.0
+        rows = sorted(
+            (sign * float(price), price, quantity) for price, quantity in levels if float(quantity) != 0.0
+        )[:self.max_depth]
+        self.keys = [row[0] for row in rows]
+        self.prices = [row[1] for row in rows]
+        self.quantities = [row[2] for row in rows]
+
+    def apply(self, levels: Iterable[List[str]]):
+        """Apply changed levels; a zero quantity removes the level"""
+        keys, prices, quantities = self.keys, self.prices, self.quantities
+        sign = -1.0 if self.descending else 1.0
+        for price, quantity in levels:
+            key = sign * float(price)
+            remove = float(quantity) == 0.0
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                if remove:
+                    del keys[i], prices[i], quantities[i]
+                else:
+                    quantities[i] = quantity
+            elif not remove:
+                keys.insert(i, key)
+                prices.insert(i, price)
+                quantities.insert(i, quantity)
+
+        if len(keys) > self.max_depth:
+            del keys[self.max_depth:], prices[self.max_depth:], quantities[self.max_depth:]
+
+    def top(self, levels: int) -> List[List[str]]:
+        """The best ``levels`` as ``[[price, quantity], ...]``"""
+        return [[price, quantity] for price, quantity in zip(self.prices[:levels], self.quantities[:levels])]
+
+
+class OrderBook:
+    """L2 book of one symbol, kept current by applying diffs in update-id order"""
+
+    def __init__(self, symbol: str, max_depth: int = DEFAULT_MAX_DEPTH):
+        self.symbol = symbol
+        self.bids = BookSide(descending=True, max_depth=max_depth)
+        self.asks = BookSide(descending=False, max_depth=max_depth)
+        self.last_update_id: Optional[int] = None
+        self.event_time: Optional[int] = None
+
+    def load_snapshot(self, last_update_id: int, bids: Iterable[List[str]], asks: Iterable[List[str]],
+                      event_time: Optional[int] = None):
+        """
+        Replace the book with a REST snapshot. The REST response carries no
+        event time, so ``event_time`` is the newest one seen on the stream.
+        """
+        self.bids.replace(bids)
+        self.asks.replace(asks)
+        self.last_update_id = last_update_id
+        self.event_time = event_time
+
+    def apply(self, update: DepthUpdate) -> str:
+        """
+        Apply a diff if it continues the book.
+
+        Returns:
+            ``APPLIED``; ``STALE`` for a diff entirely at or before
+            ``last_update_id``, which is skipped; or ``GAP`` when the diff
+            starts after ``last_update_id + 1``: updates were missed and
+            the book must be reloaded
+        """
+        if self.last_update_id is None:
+            return GAP
+        if update.final_id <= self.last_update_id:
+            return STALE
+        if update.first_id > self.last_update_id + 1:
+            return GAP
+        self.bids.apply(update.bids)
+        self.asks.apply(update.asks)
+        self.last_update_id = update.final_id
+        self.event_time = update.event_time
+        return APPLIED
+
+    def snapshot(self, levels: int) -> Dict:
+        return {
+            'last_update_id': self.last_update_id,
+            'event_time': self.event_time,
+            'bids': self.bids.top(levels),
+            'asks': self.asks.top(levels),
+        }
+
+
+def fetch_depth_snapshot(symbol: str, limit: int = SNAPSHOT_LIMIT,
+                         rest_url: str = DEFAULT_REST_URL) -> Tuple[int, List, List]:
+    """
+    GET ``/api/v3/depth`` for a symbol.
+
+    Returns:
+        tuple: (lastUpdateId, bids, asks)
+    """
+    query = urlencode({'symbol': symbol.upper(), 'limit': limit})
+    with urlopen(f"{rest_url.rstrip('/')}/api/v3/depth?{query}", timeout=10) as response:
+        data = json.loads(response.read())
+    return data['lastUpdateId'], data['bids'], data['asks']
+
+
+class OrderBookEngine:
+    """
+    Keeps an OrderBook per symbol in sync with Binance diff depth streams.
+
+    Follows Binance's procedure: diffs are buffered while a REST snapshot
+    loads on a background thread, then the buffered diffs newer than the
+    snapshot are applied and the book goes live. A gap in update ids
+    (missed diffs, e.g. after a reconnect) starts a new sync. Every
+    ``interval_ms`` of exchange time, the top ``levels`` of a live book are
+    handed to ``emit_snapshot``.
+
+    ``on_depth`` runs on the socket reader thread and does no I/O, so
+    ``emit_snapshot`` must not block (e.g. ``SnapshotDispatcher.put``).
+    """
+
+    def __init__(self, configs: Dict[str, BookConfig], symbol_map: Dict[str, int],
+                 emit_snapshot: Callable[[Dict], None],
+                 fetch_snapshot: Callable[[str, int], Tuple[int, List, List]] = fetch_depth_snapshot,
+                 max_depth: int = DEFAULT_MAX_DEPTH, retry_delay: float = 1.0):
+        """
+        Initialize engine.
+
+        Args:
+            configs: trading symbol -> BookConfig for every symbol with a book
+            symbol_map: trading symbol -> script_id, put in each snapshot
+            emit_snapshot: Called with each snapshot dict on the reader thread; must only enqueue
+            fetch_snapshot: (symbol, limit) -> (lastUpdateId, bids, asks)
+            max_depth: Levels kept per side
+            retry_delay: Seconds before refetching a snapshot that failed or was too old
+        """
+        self.configs = configs
+        self.symbol_map = symbol_map
+        self.emit_snapshot = emit_snapshot
+        self.fetch_snapshot = fetch_snapshot
+        self.retry_delay = retry_delay
+        self.books = {symbol: OrderBook(symbol, max_depth) for symbol in configs}
+        self.updates = 0
+        self.resyncs = 0
+        # symbol -> diffs buffered while syncing, None once the book is live
+        self._buffers: Dict[str, Optional[List[DepthUpdate]]] = {symbol: None for symbol in configs}
+        self._next_snapshot_at = {symbol: 0 for symbol in configs}
+        self._locks = {symbol: threading.Lock() for symbol in configs}
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """Start syncing every book; call before the depth streams connect"""
+        self._stop_event.clear()
+        for symbol in self.books:
+            with self._locks[symbol]:
+                self._resync(symbol)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def is_live(self, symbol: str) -> bool:
+        return self._buffers.get(symbol, []) is None
+
+    def remove(self, symbols: Iterable[str]):
+        """Drop the books of symbols whose scripts were deleted; a sync in progress is abandoned"""
+        for symbol in symbols:
+            lock = self._locks.get(symbol)
+            if lock is None:
+                continue
+            with lock:
+                self.books.pop(symbol, None)
+                self.configs.pop(symbol, None)
+                self._buffers.pop(symbol, None)
+                self._next_snapshot_at.pop(symbol, None)
+            logger.info(f"Order book {symbol} removed")
+
+    def on_depth(self, update: DepthUpdate):
+        """Handle one diff from the depth stream"""
+        symbol = update.symbol
+        book = self.books.get(symbol)
+        if book is None:
+            return
+
+        snapshot = None
+        with self._locks[symbol]:
+            if symbol not in self.books:
+                # Removed since the lookup above
+                return
+            buffer = self._buffers[symbol]
+            if buffer is not None:
+                buffer.append(update)
+                if len(buffer) > MAX_BUFFERED_UPDATES:
+                    # A newer snapshot will cover the dropped diffs
+                    del buffer[0]
+                return
+
+            status = book.apply(update)
+            if status == STALE:
+                return
+            if status == GAP:
+                logger.warning(
+                    f"Order book {symbol}: gap after update {book.last_update_id} "
+                    f"(next diff starts at {update.first_id}), resyncing"
+                )
+                self._resync(symbol, update)
+                return
+
+            self.updates += 1
+            if update.event_time >= self._next_snapshot_at[symbol]:
+                snapshot = self._take_snapshot(symbol, book)
+
+        if snapshot is not None:
+            self.emit_snapshot(snapshot)
+
+    def _take_snapshot(self, symbol: str, book: OrderBook) -> Dict:
+        """Caller must hold the symbol's lock."""
+        config = self.configs[symbol]
+        self._next_snapshot_at[symbol] = book.event_time + config.interval_ms
+        snapshot = book.snapshot(config.levels)
+        snapshot['script_id'] = self.symbol_map[symbol]
+        return snapshot
+
+    def _resync(self, symbol: str, first: Optional[DepthUpdate] = None):
+        """Caller must hold the symbol's lock."""
+        self.resyncs += 1
+        self._buffers[symbol] = [first] if first is not None else []
+        threading.Thread(target=self._load, args=(symbol,), name=f'orderbook-sync-{symbol}', daemon=True).start()
+
+    def _load(self, symbol: str):
+        """Fetch snapshots until one lines up with the buffered diffs"""
+        book = self.books[symbol]
+        while not self._stop_event.is_set():
+            if self.books.get(symbol) is not book:
+                # Removed while syncing
+                return
+            if not self._buffers.get(symbol):
+                # Buffer the stream first, so the snapshot cannot predate it unseen
+                self._stop_event.wait(0.1)
+                continue
+            try:
+                last_update_id, bids, asks = self.fetch_snapshot(symbol, SNAPSHOT_LIMIT)
+            except Exception as e:
+                logger.error(f"Order book {symbol}: snapshot failed: {e}")
+                self._stop_event.wait(self.retry_delay)
+                continue
+
+            with self._locks[symbol]:
+                if self.books.get(symbol) is not book:
+                    return
+                buffer = self._buffers[symbol]
+                book.load_snapshot(last_update_id, bids, asks, event_time=buffer[-1].event_time if buffer else None)
+                # Stale diffs are skipped; an unbridgeable one means the
+                # snapshot predates the stream, so fetch a newer one
+                if all(book.apply(update) != GAP for update in buffer):
+                    self._buffers[symbol] = None
+                    logger.info(f"Order book {symbol} synced at update {book.last_update_id}")
+                    return
+                # Diffs the failed attempt already covered are dropped
+                self._buffers[symbol] = [update for update in buffer if update.final_id > last_update_id]
+
+            self._stop_event.wait(self.retry_delay)
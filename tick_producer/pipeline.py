@@ -0,0 +1,248 @@
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from django.conf import settings
+
+from market_tick_system import metrics, profiling
+from market_tick_system.redis_client import get_redis
+from tick_consumer.streams import RedisStreamSink
+from tick_consumer.tasks import consume_tick, save_order_book_snapshots
+from tick_consumer.wire import encode_payload, trace_payload
+from tick_producer.conflation import ConflationPolicy, Conflator
+from tick_producer.dispatcher import TickBatcher
+from tick_producer.queueing import DEFAULT_DISPATCH_WORKERS, DEFAULT_QUEUE_SIZE, DispatchWorkers, TickQueue
+
+logger = logging.getLogger('tick_producer')
+
+
+def build_flush_callback(broker_id: int, api_config: Dict, traced: bool = False) -> Callable[[List[Sequence]], None]:
+    """
+    Where batches go: Celery tasks or the broker's Redis Stream, per
+    ``transport`` and ``wire_format`` in ``Broker.api_config``.
+
+    With ``traced``, Celery payloads carry their send time (see
+    ``wire.trace_payload``); stream entry ids already hold the time Redis
+    appended them.
+
+    Raises:
+        ValueError: If the transport or wire format is unsupported
+    """
+    transport = api_config.get('transport', settings.TICK_TRANSPORT)
+    wire_format = api_config.get('wire_format', 'json')
+    if wire_format not in ('json', 'columnar'):
+        raise ValueError(f"Unsupported wire format: {wire_format}")
+
+    if transport == 'celery':
+        encode = encode_payload if wire_format == 'columnar' else None
+        if traced:
+            def flush_callback(batch):
+                consume_tick.delay(trace_payload(encode(batch) if encode else batch, time.time()))
+            return flush_callback
+        if encode:
+            def flush_callback(batch):
+                consume_tick.delay(encode(batch))
+            return flush_callback
+        return consume_tick.delay
+    if transport == 'redis_streams':
+        return RedisStreamSink(get_redis(), broker_id, wire_format=wire_format)
+    raise ValueError(f"Unsupported tick transport: {transport}")
+
+
+def conflation_policies(scripts: List[Dict]) -> Dict[int, ConflationPolicy]:
+    """
+    Per-script sampling from ``Script.additional_data['conflation']``.
+
+    Raises:
+        ValueError: If a script's conflation config is invalid
+    """
+    policies = {}
+    for script in scripts:
+        try:
+            policy = ConflationPolicy.from_additional_data(script.get('additional_data'))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid conflation config for {script['trading_symbol']}: {e}")
+        if policy:
+            policies[script['id']] = policy
+    return policies
+
+
+class TickPipeline:
+    """
+    The producer's path from a parsed ``Tick`` to the transport.
+
+    ``on_tick`` maps the symbol to its script and emits a compact row into
+    the conflator (for scripts with a conflation policy) or straight into
+    the bounded ``TickQueue``; dispatch threads drain the queue into the
+    ``TickBatcher``, which flushes batches to Celery or Redis Streams.
+    Shared by ``run_tick_producer`` and ``replay_ticks``.
+
+    With ``TICK_METRICS_ENABLED`` it records per-tick latency from the
+    exchange event time to receive and to batch flush, batch sizes, send
+    durations and the queue's depth and counters in ``metrics.registry``.
+    """
+
+    def __init__(self, broker_id: int, api_config: Optional[Dict], scripts: List[Dict],
+                 overflow_policy: Optional[str] = None):
+        """
+        Initialize pipeline.
+
+        Args:
+            broker_id: Broker the ticks belong to
+            api_config: ``Broker.api_config`` (transport, batching, queue settings)
+            scripts: Script dicts as returned by ``get_broker``
+            overflow_policy: Overrides the api_config ``overflow_policy``
+
+        Raises:
+            ValueError: If any of the settings are invalid
+        """
+        api_config = api_config or {}
+        self.transport = api_config.get('transport', settings.TICK_TRANSPORT)
+        self.symbol_map = {script['trading_symbol']: script['id'] for script in scripts}
+        self.metrics = metrics.metrics_enabled()
+        self._receive_latency = metrics.tick_latency('receive') if self.metrics else None
+
+        # Ticks are dispatched in batches rather than one message per tick
+        try:
+            traced = self.metrics and getattr(settings, 'TICK_TRACE_PAYLOADS', False)
+            flush_callback = build_flush_callback(broker_id, api_config, traced=traced)
+            if self.metrics:
+                flush_callback = self._timed_flush(flush_callback)
+            self.batcher = TickBatcher.from_api_config(api_config, flush_callback=flush_callback)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid batching config for broker {broker_id}: {e}")
+
+        # The socket reader only enqueues; dispatch threads feed the batcher,
+        # so downstream latency never stalls reading from the socket
+        try:
+            self.tick_queue = TickQueue(
+                capacity=int(api_config.get('queue_size', DEFAULT_QUEUE_SIZE)),
+                policy=overflow_policy or api_config.get('overflow_policy', 'drop_oldest')
+            )
+            self.workers = DispatchWorkers(
+                self.tick_queue,
+                self.batcher.add,
+                workers=int(api_config.get('dispatch_workers', DEFAULT_DISPATCH_WORKERS)),
+                batch_size=self.batcher.max_batch_size
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid queue config for broker {broker_id}: {e}")
+
+        self.policies = conflation_policies(scripts)
+        self.conflator = Conflator(self.tick_queue.put, self.policies) if self.policies else None
+        self._emit = self.conflator.add if self.conflator else self.tick_queue.put
+        self._running = False
+
+        if self.metrics:
+            self._register_queue_metrics()
+
+    def _timed_flush(self, flush_callback):
+        """Wrap a flush callback to record flush latency, batch size and send duration"""
+        flush_latency = metrics.tick_latency('flush')
+        sizes = metrics.batch_size('flush')
+        send_duration = metrics.stage_duration('send')
+
+        def flush(batch):
+            started = time.time()
+            # Rows are (script_id, price, volume, event time in epoch ms)
+            flush_latency.observe_many(started - row[3] / 1000 for row in batch)
+            sizes.observe(len(batch))
+            flush_callback(batch)
+            send_duration.observe(time.time() - started)
+        return flush
+
+    def _register_queue_metrics(self):
+        queue = self.tick_queue
+        metrics.registry.gauge('tick_queue_depth', 'Ticks waiting in the producer queue', function=queue.__len__)
+        metrics.registry.gauge(
+            'tick_queue_high_water', 'Most ticks the producer queue has held', function=lambda: queue.high_water
+        )
+        for name in ('enqueued', 'dequeued', 'dropped', 'conflated'):
+            metrics.registry.counter(
+                f'tick_queue_{name}_total', f'Ticks {name} by the producer queue',
+                function=lambda name=name: getattr(queue, name)
+            )
+
+    @profiling.timed('TickPipeline.on_tick')
+    def on_tick(self, tick):
+        """Process incoming tick and queue it for the next batch"""
+        try:
+            script_id = self.symbol_map.get(tick.symbol)
+
+            if not script_id:
+                logger.warning(f"Received tick for unmapped symbol: {tick.symbol}")
+                return
+
+            if self._receive_latency:
+                self._receive_latency.observe(time.time() - tick.event_time / 1000)
+
+            # Compact row: [script_id, tick_value, volume, received_at_producer (epoch ms)]
+            self._emit((script_id, tick.price, tick.volume or None, tick.event_time))
+
+        except Exception as e:
+            logger.error(f"Error handling tick: {e}", exc_info=True)
+
+    def set_policies(self, policies: Dict[int, ConflationPolicy]):
+        """Swap in new conflation policies, e.g. after Script changes"""
+        if self.conflator:
+            self.conflator.set_policies(policies)
+        elif policies:
+            # The first conflated script: route ticks through a conflator from now on
+            self.conflator = Conflator(self.tick_queue.put, policies)
+            if self._running:
+                self.conflator.start()
+            self._emit = self.conflator.add
+        self.policies = policies
+
+    def start(self):
+        self.batcher.start()
+        self.workers.start()
+        if self.conflator:
+            self.conflator.start()
+        self._running = True
+
+    def stop(self):
+        """Flush conflated, queued and batched ticks, in pipeline order"""
+        self._running = False
+        if self.conflator:
+            self.conflator.stop()
+        self.workers.stop()
+        self.batcher.stop()
+
+
+class SnapshotDispatcher:
+    """
+    Order book snapshots from the socket reader to ``save_order_book_snapshots``.
+
+    ``put`` only enqueues (dropping the oldest snapshot when full); a
+    dispatch thread feeds the batcher, which sends up to ``batch_size``
+    snapshots per task and flushes at least every ``interval_ms``. As with
+    ticks, no Redis round-trip runs on the reader thread.
+    """
+
+    def __init__(self, send: Optional[Callable[[List[Dict]], None]] = None, capacity: int = 10000,
+                 batch_size: int = 100, interval_ms: int = 1000):
+        """
+        Initialize dispatcher.
+
+        Args:
+            send: Called with each batch (default ``save_order_book_snapshots.delay``)
+            capacity: Snapshots queued before the oldest is dropped
+            batch_size: Max snapshots per batch
+            interval_ms: Max milliseconds a snapshot waits for its batch
+        """
+        self.batcher = TickBatcher(
+            send or save_order_book_snapshots.delay, max_batch_size=batch_size, max_latency_ms=interval_ms
+        )
+        self.queue = TickQueue(capacity=capacity, policy='drop_oldest')
+        self.workers = DispatchWorkers(self.queue, self.batcher.add, workers=1, batch_size=batch_size, name='snapshot')
+        self.put = self.queue.put
+
+    def start(self):
+        self.batcher.start()
+        self.workers.start()
+
+    def stop(self):
+        """Send queued and batched snapshots"""
+        self.workers.stop()
+        self.batcher.stop()
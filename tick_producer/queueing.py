@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger('tick_producer')
+
+DEFAULT_QUEUE_SIZE = 100000
+DEFAULT_DISPATCH_WORKERS = 1
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'conflate')
+
+
+class TickQueue:
+    """
+    Bounded buffer between the socket reader and the dispatch workers.
+
+    What ``put`` does when the queue is full depends on ``policy``:
+
+    - ``drop_oldest``: the oldest queued tick is discarded (counted in ``dropped``)
+    - ``conflate``: the newest queued tick of the same script is discarded
+      (counted in ``conflated``) and the new one goes to the back, so each
+      script's ticks stay in order; if the script has none queued, the
+      oldest tick is dropped. Below capacity nothing is conflated.
+    - ``block``: the reader waits for room. Lossless, but a stalled
+      downstream then stalls the socket as well.
+
+    Rows put after ``close()`` are dropped.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_QUEUE_SIZE, policy: str = 'drop_oldest'):
+        if capacity < 1:
+            raise ValueError("queue capacity must be at least 1")
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy} (expected one of {', '.join(OVERFLOW_POLICIES)})")
+
+        self.capacity = capacity
+        self.policy = policy
+        # conflate keys rows by a sequence number, so insertion order is queue
+        # order and any row can be removed; _latest maps script_id to its
+        # newest queued row's key
+        self._items = OrderedDict() if policy == 'conflate' else deque()
+        self._latest: Dict[int, int] = {}
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._closed = False
+
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.blocked_seconds = 0.0
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, row: Sequence):
+        """Queue a row: (script_id, tick_value, volume, received_at_producer)"""
+        with self._lock:
+            if self._closed:
+                self.dropped += 1
+                return
+            if self.policy == 'conflate':
+                script_id = row[0]
+                if len(self._items) >= self.capacity:
+                    key = self._latest.get(script_id)
+                    if key is not None:
+                        del self._items[key]
+                        self.conflated += 1
+                    else:
+                        self._pop_conflated()
+                        self.dropped += 1
+                self._sequence += 1
+                self._items[self._sequence] = row
+                self._latest[script_id] = self._sequence
+            elif self.policy == 'drop_oldest':
+                if len(self._items) >= self.capacity:
+                    self._items.popleft()
+                    self.dropped += 1
+                self._items.append(row)
+            else:
+                if len(self._items) >= self.capacity:
+                    started = time.monotonic()
+                    while len(self._items) >= self.capacity and not self._closed:
+                        self._not_full.wait()
+                    self.blocked_seconds += time.monotonic() - started
+                    if self._closed:
+                        self.dropped += 1
+                        return
+                self._items.append(row)
+
+            self.enqueued += 1
+            if len(self._items) > self.high_water:
+                self.high_water = len(self._items)
+            self._not_empty.notify()
+
+    def get_batch(self, max_items: int, timeout: Optional[float] = None) -> List[Sequence]:
+        """
+        Take up to ``max_items`` rows, waiting up to ``timeout`` seconds for
+        the first one. Returns an empty list on timeout or once the queue is
+        closed and drained.
+        """
+        with self._lock:
+            if not self._items and not self._closed:
+                self._not_empty.wait(timeout)
+            count = min(max_items, len(self._items))
+            if self.policy == 'conflate':
+                batch = [self._pop_conflated() for _ in range(count)]
+            else:
+                batch = [self._items.popleft() for _ in range(count)]
+            if batch:
+                self.dequeued += len(batch)
+                self._not_full.notify_all()
+            return batch
+
+    def _pop_conflated(self) -> Sequence:
+        """Take the oldest row of a conflate queue. Caller must hold the lock."""
+        key, row = self._items.popitem(last=False)
+        if self._latest.get(row[0]) == key:
+            del self._latest[row[0]]
+        return row
+
+    def close(self):
+        """Wake everyone up; workers drain what is left and stop"""
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def stats(self) -> Dict[str, float]:
+        """Counters and current depth"""
+        with self._lock:
+            return {
+                'depth': len(self._items),
+                'capacity': self.capacity,
+                'high_water': self.high_water,
+                'enqueued': self.enqueued,
+                'dequeued': self.dequeued,
+                'dropped': self.dropped,
+                'conflated': self.conflated,
+                'blocked_seconds': round(self.blocked_seconds, 3),
+            }
+
+
+class DispatchWorkers:
+    """
+    Threads that move ticks from a TickQueue to the batcher.
+
+    Batches are flushed (e.g. ``consume_tick.delay``) on these threads, so a
+    slow Redis round-trip never holds up the socket reader. Queue stats are
+    logged every ``stats_interval`` seconds.
+    """
+
+    def __init__(self, queue: TickQueue, handler: Callable[[Sequence], None],
+                 workers: int = DEFAULT_DISPATCH_WORKERS, batch_size: int = 500,
+                 stats_interval: float = 30.0, name: str = 'tick'):
+        """
+        Initialize workers.
+
+        Args:
+            queue: Queue filled by the socket reader
+            handler: Called with each row (e.g. ``TickBatcher.add``)
+            workers: Number of dispatch threads. With more than one, rows
+                of the same script may reach ``handler`` out of order.
+            batch_size: Max rows taken from the queue at a time
+            stats_interval: Seconds between queue stats log lines
+            name: What is queued, for thread names and log lines
+        """
+        if workers < 1:
+            raise ValueError("dispatch workers must be at least 1")
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.batch_size = batch_size
+        self.stats_interval = stats_interval
+        self.name = name
+        self._threads: List[threading.Thread] = []
+        self._next_stats_at = 0.0
+        self._last_dropped = 0
+
+    def start(self):
+        self._next_stats_at = time.monotonic() + self.stats_interval
+        self._threads = [
+            threading.Thread(target=self._run, name=f'{self.name}-dispatch-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Close the queue and wait for the workers to drain it"""
+        if not self._threads:
+            return
+        self.queue.close()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        self.log_stats()
+
+    def log_stats(self):
+        stats = self.queue.stats()
+        new_drops = stats['dropped'] - self._last_dropped
+        self._last_dropped = stats['dropped']
+        message = ', '.join(f"{key}={value}" for key, value in stats.items())
+        label = self.name.capitalize()
+        if new_drops:
+            logger.warning(f"{label} queue dropped {new_drops} {self.name}s since last report ({message})")
+        else:
+            logger.info(f"{label} queue: {message}")
+
+    def _run(self):
+        while True:
+            rows = self.queue.get_batch(self.batch_size, timeout=1.0)
+            if not rows and self.queue.closed:
+                return
+            for row in rows:
+                try:
+                    self.handler(row)
+                except Exception as e:
+                    logger.error(f"Error dispatching {self.name}: {e}", exc_info=True)
+
+            if time.monotonic() >= self._next_stats_at:
+                self._next_stats_at = time.monotonic() + self.stats_interval
+                self.log_stats()
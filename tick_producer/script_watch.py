@@ -0,0 +1,83 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import redis
+from django.db import close_old_connections
+
+from tick_consumer.signals import get_scripts_version
+
+logger = logging.getLogger('tick_producer')
+
+_UNSEEN = object()
+
+
+def diff_symbols(old: Dict[str, int], new: Dict[str, int]) -> Tuple[List[str], List[str]]:
+    """(added, removed) trading symbols between two symbol -> script_id maps"""
+    return [symbol for symbol in new if symbol not in old], [symbol for symbol in old if symbol not in new]
+
+
+class ScriptWatcher:
+    """
+    Polls the Redis script version counter and reloads the scripts when it moves.
+
+    Script saves and deletes bump the counter (``tick_consumer.signals``),
+    so a poll costs one GET while nothing changes. The first poll always
+    reloads, which closes the window between the producer loading its
+    scripts and the watcher starting.
+    """
+
+    def __init__(self, load_symbols: Callable[[], Any],
+                 on_change: Callable[[Any], None],
+                 interval: float = 5.0, client: Optional[redis.Redis] = None):
+        """
+        Initialize watcher.
+
+        Args:
+            load_symbols: Returns the current scripts, e.g. a trading_symbol -> script_id
+                map or the script dicts (reads the DB)
+            on_change: Called with what ``load_symbols`` returned after each version change
+            interval: Seconds between polls
+            client: Redis client (defaults to the shared one)
+        """
+        self.load_symbols = load_symbols
+        self.on_change = on_change
+        self.interval = interval
+        self.client = client
+        self._version = _UNSEEN
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def check(self) -> bool:
+        """Poll once; returns True if the scripts were reloaded"""
+        version = get_scripts_version(self.client)
+        if version == self._version:
+            return False
+        close_old_connections()
+        try:
+            symbols = self.load_symbols()
+        finally:
+            close_old_connections()
+        self._version = version
+        self.on_change(symbols)
+        return True
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='script-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.check()
+            except redis.RedisError as e:
+                logger.warning(f"Could not check script version: {e}")
+            except Exception as e:
+                logger.error(f"Error reloading scripts: {e}", exc_info=True)
+            self._stop_event.wait(self.interval)
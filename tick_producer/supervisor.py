@@ -0,0 +1,218 @@
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger('tick_producer')
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Parse ``"index/count"`` (e.g. ``"0/4"``).
+
+    Raises:
+        ValueError: If the value is malformed or index is not below count
+    """
+    index, sep, count = value.partition('/')
+    if not sep:
+        raise ValueError(f"Invalid shard {value!r}, expected index/count")
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value!r}, expected 0 <= index < count")
+    return index, count
+
+
+def shard_scripts(scripts: Iterable[Dict], index: int, count: int) -> List[Dict]:
+    """
+    The scripts owned by shard ``index`` of ``count``.
+
+    Scripts are assigned by ``id % count``, so adding a script never moves
+    the existing ones to another shard.
+    """
+    return [script for script in scripts if script['id'] % count == index]
+
+
+def producer_command(broker_id: int, index: int, count: int) -> List[str]:
+    """argv of a ``run_tick_producer`` child for one shard"""
+    from django.conf import settings
+    return [
+        sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'run_tick_producer',
+        f'--broker_id={broker_id}', f'--shard={index}/{count}',
+    ]
+
+
+class BrokerPool:
+    """The producer processes of one broker and its recent crashes"""
+
+    def __init__(self, broker_id: int, script_ids: Sequence[int], processes: int):
+        self.broker_id = broker_id
+        self.script_ids = list(script_ids)
+        self.shard_count = max(1, min(processes, len(self.script_ids)))
+        # shard index -> Popen (None while waiting to be restarted)
+        self.children: Dict[int, Optional[subprocess.Popen]] = {}
+        self.started_at: Dict[int, float] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.failures: Dict[int, int] = {}
+        self.crashes = deque()
+        self.restarts = 0
+
+    def shards(self) -> List[int]:
+        """
+        Every shard index, including ones that own no script yet: scripts
+        added later are assigned by id and must land on a running producer.
+        """
+        return list(range(self.shard_count))
+
+
+class ProducerSupervisor:
+    """
+    Runs one ``run_tick_producer`` child per (broker, shard) and keeps them up.
+
+    A child that exits is restarted after an exponential backoff, reset once
+    a child has stayed up for ``stable_after`` seconds. When a broker's
+    children crash ``max_crashes`` times within ``crash_window`` seconds,
+    its scripts are rebalanced over one process fewer (down to one), so a
+    host that cannot sustain the pool degrades instead of crash-looping.
+    """
+
+    def __init__(self, pools: Iterable[BrokerPool],
+                 command: Callable[[int, int, int], List[str]] = producer_command,
+                 max_crashes: int = 5, crash_window: float = 60.0,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 stable_after: float = 30.0):
+        """
+        Initialize supervisor.
+
+        Args:
+            pools: One BrokerPool per broker to run
+            command: (broker_id, shard index, shard count) -> child argv
+            max_crashes: Crashes within crash_window that trigger a rebalance
+            crash_window: Seconds over which crashes are counted
+            backoff_base: Restart delay after the first crash, doubled per crash
+            backoff_max: Upper bound of the restart delay
+            stable_after: Seconds a child must run to reset its backoff
+        """
+        self.pools = {pool.broker_id: pool for pool in pools}
+        self.command = command
+        self.max_crashes = max_crashes
+        self.crash_window = crash_window
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+
+    @property
+    def process_count(self) -> int:
+        return sum(
+            1 for pool in self.pools.values() for child in pool.children.values() if child is not None
+        )
+
+    def start(self):
+        for pool in self.pools.values():
+            self._start_pool(pool)
+
+    def poll(self):
+        """Reap exited children, then restart or rebalance as needed"""
+        now = time.monotonic()
+        for pool in self.pools.values():
+            for index, child in list(pool.children.items()):
+                if child is None or child.poll() is None:
+                    continue
+                self._on_exit(pool, index, child.returncode, now)
+
+            if len(pool.crashes) >= self.max_crashes and pool.shard_count > 1:
+                self._rebalance(pool, pool.shard_count - 1)
+                continue
+
+            for index, restart_at in list(pool.restart_at.items()):
+                if restart_at <= now:
+                    del pool.restart_at[index]
+                    pool.restarts += 1
+                    self._spawn(pool, index)
+
+    def run(self, poll_interval: float = 0.5, should_stop: Callable[[], bool] = lambda: False):
+        """Start the children and supervise them until ``should_stop()``"""
+        self.start()
+        try:
+            while not should_stop():
+                self.poll()
+                time.sleep(poll_interval)
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 10.0):
+        """SIGTERM every child, then SIGKILL those still running after ``timeout``"""
+        children = [
+            child for pool in self.pools.values()
+            for child in pool.children.values() if child is not None
+        ]
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + timeout
+        for child in children:
+            try:
+                child.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Producer pid {child.pid} did not stop, killing it")
+                child.kill()
+                child.wait()
+        for pool in self.pools.values():
+            pool.children.clear()
+            pool.restart_at.clear()
+
+    def _start_pool(self, pool: BrokerPool):
+        shards = pool.shards()
+        logger.info(
+            f"Broker {pool.broker_id}: {len(pool.script_ids)} scripts over {len(shards)} processes"
+        )
+        for index in shards:
+            self._spawn(pool, index)
+
+    def _spawn(self, pool: BrokerPool, index: int):
+        argv = self.command(pool.broker_id, index, pool.shard_count)
+        child = subprocess.Popen(argv)
+        pool.children[index] = child
+        pool.started_at[index] = time.monotonic()
+        logger.info(f"Started producer {index}/{pool.shard_count} of broker {pool.broker_id} (pid {child.pid})")
+
+    def _on_exit(self, pool: BrokerPool, index: int, returncode: int, now: float):
+        pool.children[index] = None
+        if now - pool.started_at.get(index, now) >= self.stable_after:
+            pool.failures[index] = 0
+        failures = pool.failures[index] = pool.failures.get(index, 0) + 1
+        delay = min(self.backoff_base * 2 ** (failures - 1), self.backoff_max)
+
+        pool.crashes.append(now)
+        while pool.crashes and now - pool.crashes[0] > self.crash_window:
+            pool.crashes.popleft()
+
+        pool.restart_at[index] = now + delay
+        logger.warning(
+            f"Producer {index}/{pool.shard_count} of broker {pool.broker_id} exited with {returncode}, "
+            f"restarting in {delay:g}s"
+        )
+
+    def _rebalance(self, pool: BrokerPool, shard_count: int):
+        """Stop the broker's children and restart its scripts over ``shard_count`` processes"""
+        logger.warning(
+            f"Broker {pool.broker_id}: {len(pool.crashes)} crashes in {self.crash_window:g}s, "
+            f"rebalancing from {pool.shard_count} to {shard_count} processes"
+        )
+        for child in pool.children.values():
+            if child is not None and child.poll() is None:
+                child.terminate()
+                try:
+                    child.wait(10)
+                except subprocess.TimeoutExpired:
+                    child.kill()
+                    child.wait()
+        pool.children.clear()
+        pool.restart_at.clear()
+        pool.failures.clear()
+        pool.crashes.clear()
+        pool.shard_count = shard_count
+        self._start_pool(pool)
@@ -1,6 +1,27 @@
 from django.test import TestCase
 from tick_producer.websocket_client import BinanceWebSocketClient
+from tick_producer.async_client import AsyncBinanceWebSocketClient
+from tick_producer.codec import DepthUpdate, Tick, get_decoder, parse_stream_message, parse_ticker_message
+from tick_producer.dispatcher import TickBatcher
+from tick_producer.conflation import ConflationPolicy, Conflator
+from tick_producer.queueing import DispatchWorkers, TickQueue
+from tick_producer.orderbook import APPLIED, GAP, STALE, BookConfig, OrderBook, OrderBookEngine
+from tick_producer.script_watch import ScriptWatcher, diff_symbols
+from tick_producer.supervisor import BrokerPool, ProducerSupervisor, parse_shard, shard_scripts
+from tick_producer.pipeline import SnapshotDispatcher, TickPipeline, conflation_policies
+from market_tick_system import metrics
+from tick_producer.capture import FrameReader, FrameWriter, find_segments, read_frames, replay
+from tick_consumer.models import Broker, Script
+from django.core.management import call_command
+from io import StringIO
 from unittest.mock import Mock, patch
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
 
 
 class BinanceWebSocketClientTest(TestCase):
@@ -23,3 +44,632 @@ class BinanceWebSocketClientTest(TestCase):
         )
         url = client._get_stream_url()
         self.assertEqual(url, 'wss://test.binance.com:9443/ws/btcusdt@ticker')
+
+    def test_redundant_legs_emit_first_copy_only(self):
+        callback = Mock()
+        client = BinanceWebSocketClient(
+            symbols=['BTCUSDT'],
+            on_tick_callback=callback,
+            ws_url='wss://test.binance.com:9443/ws',
+            redundancy=2,
+            dedup_size=2
+        )
+        frame = '{"e": "24hrTicker", "E": %d, "s": "BTCUSDT", "c": "1.0", "v": "2.0"}'
+        client._on_message(None, frame % 1, leg=1)
+        client._on_message(None, frame % 1, leg=0)
+        client._on_message(None, frame % 2, leg=0)
+        client._on_message(None, frame % 2, leg=1)
+
+        self.assertEqual([c.args[0].event_time for c in callback.call_args_list], [1, 2])
+        self.assertEqual(client.duplicates, 2)
+        self.assertEqual([stats.first for stats in client.leg_stats], [1, 1])
+        self.assertEqual([stats.received for stats in client.leg_stats], [2, 2])
+
+        # Oldest keys are evicted once dedup_size is exceeded
+        client._on_message(None, frame % 3, leg=0)
+        client._on_message(None, frame % 1, leg=0)
+        self.assertEqual(callback.call_count, 4)
+
+        # Leg stats are logged once the stats interval has passed
+        client._next_stats_at = 0
+        with self.assertLogs('tick_producer', 'INFO') as logs:
+            client._on_message(None, frame % 4, leg=1)
+        self.assertIn('leg 0: received=4 first=3', logs.output[0])
+        self.assertIn('leg 1: received=3 first=2', logs.output[0])
+        self.assertIn('duplicates=2', logs.output[0])
+
+    def test_redundant_legs_emit_each_depth_diff_once(self):
+        depth, frames = Mock(), Mock()
+        client = BinanceWebSocketClient(
+            ['BTCUSDT'], Mock(), 'wss://test.binance.com:9443/ws', redundancy=2,
+            depth_symbols=['BTCUSDT'], on_depth_callback=depth, on_frame_callback=frames
+        )
+        frame = json.dumps({'stream': 'btcusdt@depth@100ms', 'data': {
+            'e': 'depthUpdate', 'E': 1, 's': 'BTCUSDT', 'U': 5, 'u': 7, 'b': [], 'a': []}})
+        later = frame.replace('"U": 5, "u": 7', '"U": 8, "u": 9')
+        client._on_message(None, frame, leg=0)
+        client._on_message(None, frame, leg=1)
+        client._on_message(None, later, leg=1)
+        client._on_message(None, later, leg=0)
+
+        self.assertEqual([c.args[0].final_id for c in depth.call_args_list], [7, 9])
+        self.assertEqual(frames.call_count, 2)
+        self.assertEqual(client.depth_duplicates, 2)
+
+
+class TickBatcherTest(TestCase):
+    def test_flushes_when_batch_is_full(self):
+        callback = Mock()
+        batcher = TickBatcher(flush_callback=callback, max_batch_size=3, max_latency_ms=10000)
+        for i in range(7):
+            batcher.add({'script_id': i})
+        self.assertEqual(callback.call_count, 2)
+        self.assertEqual(callback.call_args_list[0].args[0], [{'script_id': 0}, {'script_id': 1}, {'script_id': 2}])
+
+        batcher.stop()
+        self.assertEqual(callback.call_args.args[0], [{'script_id': 6}])
+
+    def test_flushes_after_interval(self):
+        flushed = threading.Event()
+        batcher = TickBatcher(flush_callback=lambda batch: flushed.set(), max_batch_size=500, max_latency_ms=20)
+        batcher.start()
+        try:
+            batcher.add({'script_id': 1})
+            self.assertTrue(flushed.wait(timeout=2))
+        finally:
+            batcher.stop()
+
+    def test_from_api_config(self):
+        batcher = TickBatcher.from_api_config({'batch_size': 100, 'batch_interval_ms': 25}, Mock())
+        self.assertEqual(batcher.max_batch_size, 100)
+        self.assertEqual(batcher.max_latency, 0.025)
+
+
+class AsyncBinanceWebSocketClientTest(TestCase):
+    def test_shards_symbols_across_connections(self):
+        client = AsyncBinanceWebSocketClient(
+            symbols=[f'SYM{i}USDT' for i in range(5)],
+            on_tick_callback=Mock(),
+            ws_url='wss://test.binance.com:9443/ws',
+            streams_per_connection=2
+        )
+        shards = client.get_shards()
+        self.assertEqual([len(shard) for shard in shards], [2, 2, 1])
+        self.assertEqual(
+            client._get_stream_url(shards[0]),
+            'wss://test.binance.com:9443/stream?streams=sym0usdt@ticker/sym1usdt@ticker'
+        )
+
+    def test_on_message_unwraps_combined_stream(self):
+        callback = Mock()
+        client = AsyncBinanceWebSocketClient(
+            symbols=['BTCUSDT'],
+            on_tick_callback=callback,
+            ws_url='wss://test.binance.com:9443/ws'
+        )
+        client._on_message(
+            '{"stream": "btcusdt@ticker", "data": {"e": "24hrTicker", "E": 1700000000000, '
+            '"s": "BTCUSDT", "c": "50000.10", "v": "12.5"}}'
+        )
+        tick = callback.call_args.args[0]
+        self.assertEqual(tick.symbol, 'BTCUSDT')
+        self.assertEqual(tick.price, '50000.10')
+
+
+class CodecTest(TestCase):
+    FRAME = (
+        '{"stream": "btcusdt@ticker", "data": {"e": "24hrTicker", "E": 1700000000123, '
+        '"s": "BTCUSDT", "c": "50000.10", "v": "12.5"}}'
+    )
+
+    def test_parse_ticker_message(self):
+        for decoder in ('json', 'auto'):
+            tick = parse_ticker_message(self.FRAME, get_decoder(decoder))
+            self.assertEqual(tick, Tick('BTCUSDT', '50000.10', '12.5', 1700000000123))
+
+    def test_ignores_other_events(self):
+        self.assertIsNone(parse_ticker_message('{"e": "trade", "E": 1, "s": "BTCUSDT"}'))
+
+    def test_get_decoder_dotted_path(self):
+        self.assertIs(get_decoder('json.loads'), json.loads)
+
+
+class ConflatorTest(TestCase):
+    def test_policy_from_additional_data(self):
+        self.assertIsNone(ConflationPolicy.from_additional_data({}))
+        policy = ConflationPolicy.from_additional_data({'conflation': {'interval_ms': 250}})
+        self.assertEqual(policy, ConflationPolicy(0.25, None))
+        with self.assertRaises(ValueError):
+            ConflationPolicy.from_additional_data({'conflation': {'interval_ms': 0}})
+
+    def test_keeps_latest_until_interval(self):
+        emit = Mock()
+        conflator = Conflator(emit, {1: ConflationPolicy(60, None)})
+        for price in ('100', '101', '102'):
+            conflator.add((1, price, None, 0))
+        conflator.add((2, '5', None, 0))
+
+        # First tick of script 1 and the unconflated script 2 go straight out
+        self.assertEqual([c.args[0][1] for c in emit.call_args_list], ['100', '5'])
+        self.assertEqual(conflator.conflated, 1)
+
+        conflator.stop()
+        self.assertEqual(emit.call_args.args[0][1], '102')
+
+    def test_threshold_emits_immediately(self):
+        emit = Mock()
+        conflator = Conflator(emit, {1: ConflationPolicy(60, 10)})
+        conflator.add((1, '100', None, 0))
+        conflator.add((1, '100.05', None, 0))  # 5 bps: held
+        conflator.add((1, '100.2', None, 0))   # 20 bps: emitted
+        self.assertEqual([c.args[0][1] for c in emit.call_args_list], ['100', '100.2'])
+
+    def test_emits_pending_at_cadence(self):
+        emitted = []
+        done = threading.Event()
+
+        def emit(row):
+            emitted.append(row[1])
+            if len(emitted) == 2:
+                done.set()
+
+        conflator = Conflator(emit, {1: ConflationPolicy(0.02, None)})
+        conflator.start()
+        try:
+            for price in ('1', '2', '3'):
+                conflator.add((1, price, None, 0))
+            self.assertTrue(done.wait(timeout=2))
+            self.assertEqual(emitted, ['1', '3'])
+        finally:
+            conflator.stop()
+
+    def test_pipeline_picks_up_policies_of_changed_scripts(self):
+        scripts = [{'id': 1, 'trading_symbol': 'BTCUSDT', 'additional_data': {}}]
+        pipeline = TickPipeline(1, {'transport': 'celery'}, scripts)
+        self.assertIsNone(pipeline.conflator)
+
+        # A script added at runtime with a conflation policy
+        scripts.append({'id': 2, 'trading_symbol': 'ETHUSDT', 'additional_data': {'conflation': {'interval_ms': 60000}}})
+        pipeline.set_policies(conflation_policies(scripts))
+        pipeline.symbol_map = {'BTCUSDT': 1, 'ETHUSDT': 2}
+        for price in ('1', '2', '3'):
+            pipeline.on_tick(Tick('ETHUSDT', price, None, 0))
+        self.assertEqual([row[1] for row in pipeline.tick_queue.get_batch(10)], ['1'])
+
+        # Dropping the policy releases the held tick
+        pipeline.set_policies(conflation_policies(scripts[:1]))
+        self.assertEqual([row[1] for row in pipeline.tick_queue.get_batch(10)], ['3'])
+        self.assertEqual(pipeline.conflator.policies, {})
+
+
+class TickQueueTest(TestCase):
+    def test_drop_oldest(self):
+        queue = TickQueue(capacity=2, policy='drop_oldest')
+        for i in range(3):
+            queue.put((i, '1', None, 0))
+        self.assertEqual([row[0] for row in queue.get_batch(10)], [1, 2])
+        self.assertEqual(queue.stats()['dropped'], 1)
+
+    def test_conflate_only_when_full(self):
+        queue = TickQueue(capacity=3, policy='conflate')
+        queue.put((1, '100', None, 0))
+        queue.put((2, '5', None, 0))
+        queue.put((1, '101', None, 1))
+        # Full: script 1's newest tick makes way and the new one goes last
+        queue.put((1, '102', None, 2))
+        # Full, and script 3 has nothing queued: the oldest tick is dropped
+        queue.put((3, '7', None, 3))
+        self.assertEqual(queue.get_batch(10), [(2, '5', None, 0), (1, '102', None, 2), (3, '7', None, 3)])
+        self.assertEqual((queue.stats()['conflated'], queue.stats()['dropped']), (1, 1))
+
+    def test_block_waits_for_room(self):
+        queue = TickQueue(capacity=1, policy='block')
+        queue.put((1, '1', None, 0))
+        writer = threading.Thread(target=queue.put, args=((2, '1', None, 0),))
+        writer.start()
+        writer.join(timeout=0.05)
+        self.assertTrue(writer.is_alive())
+
+        self.assertEqual(queue.get_batch(1), [(1, '1', None, 0)])
+        writer.join(timeout=2)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(len(queue), 1)
+
+    def test_put_after_close_is_dropped(self):
+        queue = TickQueue(capacity=1, policy='block')
+        queue.put((1, '1', None, 0))
+        queue.close()
+        queue.put((2, '1', None, 0))
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.stats()['dropped'], 1)
+
+    def test_workers_drain_on_stop(self):
+        handler = Mock()
+        queue = TickQueue(capacity=100)
+        workers = DispatchWorkers(queue, handler, workers=2, batch_size=3)
+        workers.start()
+        for i in range(10):
+            queue.put((i, '1', None, 0))
+        workers.stop()
+        self.assertEqual(sorted(c.args[0][0] for c in handler.call_args_list), list(range(10)))
+
+
+class ProducerSupervisorTest(TestCase):
+    def test_shards(self):
+        self.assertEqual(parse_shard('1/4'), (1, 4))
+        with self.assertRaises(ValueError):
+            parse_shard('4/4')
+        scripts = [{'id': i} for i in range(1, 8)]
+        self.assertEqual([s['id'] for s in shard_scripts(scripts, 1, 3)], [1, 4, 7])
+
+        # Never more processes than scripts
+        self.assertEqual(BrokerPool(1, [2], processes=8).shard_count, 1)
+
+    def test_starts_shards_without_scripts(self):
+        # Ids 2, 4 and 6 all fall in shard 0, but a script added later as
+        # id 7 belongs to shard 1, which must already be running
+        started = []
+
+        def command(broker_id, index, count):
+            started.append((index, count))
+            return [sys.executable, '-c', 'import time; time.sleep(60)']
+
+        pool = BrokerPool(1, [2, 4, 6], processes=2)
+        supervisor = ProducerSupervisor([pool], command=command)
+        supervisor.start()
+        supervisor.stop(timeout=5)
+        self.assertEqual(started, [(0, 2), (1, 2)])
+        self.assertEqual([s['id'] for s in shard_scripts([{'id': 7}], 1, 2)], [7])
+
+    def test_rebalances_after_repeated_crashes(self):
+        counts = []
+
+        def command(broker_id, index, count):
+            counts.append(count)
+            return [sys.executable, '-c', 'raise SystemExit(1)']
+
+        pool = BrokerPool(1, [1, 2, 3], processes=3)
+        supervisor = ProducerSupervisor(
+            [pool], command=command, max_crashes=3, backoff_base=0, stable_after=60
+        )
+        supervisor.start()
+        deadline = time.monotonic() + 10
+        while pool.shard_count > 1 and time.monotonic() < deadline:
+            supervisor.poll()
+            time.sleep(0.02)
+        supervisor.stop()
+
+        self.assertEqual(pool.shard_count, 1)
+        self.assertEqual(counts[:3], [3, 3, 3])
+        self.assertIn(2, counts)
+
+    def test_stop_terminates_children(self):
+        pool = BrokerPool(1, [1, 2], processes=2)
+        supervisor = ProducerSupervisor(
+            [pool], command=lambda *args: [sys.executable, '-c', 'import time; time.sleep(60)']
+        )
+        supervisor.start()
+        children = list(pool.children.values())
+        self.assertEqual(supervisor.process_count, 2)
+        supervisor.stop(timeout=5)
+        self.assertTrue(all(child.returncode is not None for child in children))
+
+
+class ScriptChangeTest(TestCase):
+    def test_watcher_reloads_on_version_change(self):
+        client = Mock()
+        client.get.return_value = b'1'
+        load = Mock(return_value={'BTCUSDT': 1})
+        changed = Mock()
+        watcher = ScriptWatcher(load, changed, client=client)
+
+        # The first poll always reloads; later ones only when the version moves
+        self.assertTrue(watcher.check())
+        self.assertFalse(watcher.check())
+        client.get.return_value = b'2'
+        self.assertTrue(watcher.check())
+        self.assertEqual(load.call_count, 2)
+        changed.assert_called_with({'BTCUSDT': 1})
+
+        self.assertEqual(
+            diff_symbols({'BTCUSDT': 1, 'ETHUSDT': 2}, {'BTCUSDT': 1, 'SOLUSDT': 3}),
+            (['SOLUSDT'], ['ETHUSDT'])
+        )
+
+    def test_threaded_client_sends_control_messages(self):
+        client = BinanceWebSocketClient(['BTCUSDT'], Mock(), 'wss://test.binance.com:9443/ws')
+        leg = Mock()
+        leg.sock.connected = True
+        client._legs = [leg]
+
+        client.subscribe(['ETHUSDT', 'BTCUSDT'])
+        client.unsubscribe(['BTCUSDT'])
+
+        self.assertEqual(client.symbols, ['ethusdt'])
+        sent = [json.loads(c.args[0]) for c in leg.send.call_args_list]
+        self.assertEqual([(m['method'], m['params']) for m in sent], [
+            ('SUBSCRIBE', ['ethusdt@ticker']),
+            ('UNSUBSCRIBE', ['btcusdt@ticker']),
+        ])
+        self.assertEqual(client._get_stream_url([]), 'wss://test.binance.com:9443/ws')
+
+    def test_threaded_client_unsubscribes_depth_streams(self):
+        client = BinanceWebSocketClient(
+            ['BTCUSDT', 'ETHUSDT'], Mock(), 'wss://test.binance.com:9443/ws',
+            depth_symbols=['BTCUSDT', 'ETHUSDT']
+        )
+        leg = Mock()
+        leg.sock.connected = True
+        client._legs = [leg]
+
+        client.unsubscribe_depth(['BTCUSDT', 'SOLUSDT'])
+
+        self.assertEqual(client.depth_symbols, ['ethusdt'])
+        sent = [json.loads(c.args[0]) for c in leg.send.call_args_list]
+        self.assertEqual([(m['method'], m['params']) for m in sent], [
+            ('UNSUBSCRIBE', ['btcusdt@depth@100ms']),
+        ])
+
+    def test_async_client_places_new_symbols(self):
+        client = AsyncBinanceWebSocketClient(
+            ['A', 'B', 'C'], Mock(), 'wss://test.binance.com:9443/ws', streams_per_connection=2
+        )
+        client._shards = client.get_shards()
+        client._tasks = [Mock(), Mock()]
+        with patch.object(client, '_start_connection') as start_connection:
+            asyncio.run(client._subscribe(['d', 'e']))
+            asyncio.run(client._unsubscribe(['a']))
+
+        self.assertEqual(client._shards, [['b@ticker'], ['c@ticker', 'd@ticker'], ['e@ticker']])
+        start_connection.assert_called_once_with(2)
+        self.assertEqual(client.symbols, ['b', 'c', 'd', 'e'])
+
+
+class OrderBookTest(TestCase):
+    def diff(self, first_id, final_id, bids=(), asks=(), event_time=1700000000000):
+        return DepthUpdate('BTCUSDT', first_id, final_id, list(bids), list(asks), event_time)
+
+    def test_levels_stay_sorted_best_first(self):
+        book = OrderBook('BTCUSDT')
+        book.load_snapshot(100, [['99.5', '1'], ['100.0', '2']], [['101.0', '1'], ['100.5', '3']])
+
+        self.assertEqual(book.apply(self.diff(
+            101, 102,
+            bids=[['100.25', '5'], ['99.5', '0'], ['100.0', '4']],
+            asks=[['100.75', '1'], ['101.0', '0.00000000']],
+        )), APPLIED)
+        self.assertEqual(book.bids.top(5), [['100.25', '5'], ['100.0', '4']])
+        self.assertEqual(book.asks.top(5), [['100.5', '3'], ['100.75', '1']])
+        self.assertEqual(book.last_update_id, 102)
+
+        # Stale diffs are skipped, a gap is reported
+        self.assertEqual(book.apply(self.diff(90, 102, bids=[['1', '1']])), STALE)
+        self.assertEqual(len(book.bids), 2)
+        self.assertEqual(book.apply(self.diff(105, 106)), GAP)
+
+    def test_engine_syncs_and_snapshots(self):
+        snapshots = []
+        fetch = Mock(return_value=(100, [['100.0', '1']], [['101.0', '1']]))
+        engine = OrderBookEngine(
+            {'BTCUSDT': BookConfig(levels=1, interval_ms=1000)}, {'BTCUSDT': 7},
+            snapshots.append, fetch_snapshot=fetch, retry_delay=0.01
+        )
+        engine.start()
+        engine.on_depth(self.diff(95, 99))  # older than the REST snapshot
+        engine.on_depth(self.diff(100, 102, bids=[['100.5', '2']]))
+        deadline = time.monotonic() + 5
+        while not engine.is_live('BTCUSDT') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(engine.is_live('BTCUSDT'))
+
+        engine.on_depth(self.diff(103, 103, asks=[['100.9', '1']], event_time=1700000000500))
+        engine.on_depth(self.diff(104, 104, event_time=1700000001000))  # within the interval
+        engine.on_depth(self.diff(105, 105, event_time=1700000001500))
+        self.assertEqual(snapshots, [
+            {'script_id': 7, 'last_update_id': 103, 'event_time': 1700000000500,
+             'bids': [['100.5', '2']], 'asks': [['100.9', '1']]},
+            {'script_id': 7, 'last_update_id': 105, 'event_time': 1700000001500,
+             'bids': [['100.5', '2']], 'asks': [['100.9', '1']]},
+        ])
+
+        # A gap starts a new sync
+        engine.on_depth(self.diff(200, 201))
+        self.assertFalse(engine.is_live('BTCUSDT'))
+        self.assertEqual(engine.resyncs, 2)
+        engine.stop()
+
+    def test_stale_diffs_after_sync_are_skipped(self):
+        # The REST snapshot is ahead of every buffered diff, and of the next live one
+        snapshots = []
+        engine = OrderBookEngine(
+            {'BTCUSDT': BookConfig(levels=1, interval_ms=1000)}, {'BTCUSDT': 7}, snapshots.append,
+            fetch_snapshot=Mock(return_value=(200, [['100.0', '1']], [['101.0', '1']])), retry_delay=0.01
+        )
+        engine.start()
+        engine.on_depth(self.diff(150, 160))
+        deadline = time.monotonic() + 5
+        while not engine.is_live('BTCUSDT') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(engine.is_live('BTCUSDT'))
+        self.assertEqual(engine.books['BTCUSDT'].event_time, 1700000000000)
+
+        engine.on_depth(self.diff(161, 190))
+        self.assertEqual((engine.updates, snapshots), (0, []))
+        engine.on_depth(self.diff(191, 201, bids=[['100.5', '2']], event_time=1700000000100))
+        self.assertEqual(engine.updates, 1)
+        self.assertEqual(snapshots[0]['last_update_id'], 201)
+        engine.stop()
+
+    def test_removed_books_ignore_later_diffs(self):
+        snapshots = []
+        engine = OrderBookEngine(
+            {'BTCUSDT': BookConfig(levels=1, interval_ms=0)}, {'BTCUSDT': 7}, snapshots.append,
+            fetch_snapshot=Mock(return_value=(200, [['100.0', '1']], [['101.0', '1']])), retry_delay=0.01
+        )
+        engine.start()
+        engine.on_depth(self.diff(190, 201))
+        deadline = time.monotonic() + 5
+        while not engine.is_live('BTCUSDT') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(engine.is_live('BTCUSDT'))
+
+        engine.remove(['BTCUSDT'])
+        sent = len(snapshots)
+        engine.on_depth(self.diff(202, 210, bids=[['100.5', '2']]))
+        self.assertNotIn('BTCUSDT', engine.books)
+        self.assertEqual(len(snapshots), sent)
+        engine.stop()
+
+    def test_snapshots_are_sent_off_the_reader_thread(self):
+        sent = []
+        send = Mock(side_effect=lambda batch: sent.append((threading.current_thread(), len(batch))))
+        dispatcher = SnapshotDispatcher(send, batch_size=100, interval_ms=20)
+        dispatcher.start()
+        # Enough for size-triggered flushes (in the dispatch thread) and a timed one
+        for i in range(250):
+            dispatcher.put({'script_id': 7, 'last_update_id': i})
+        deadline = time.monotonic() + 5
+        while sum(count for _, count in sent) < 250 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sum(count for _, count in sent), 250)
+        self.assertNotIn(threading.current_thread(), [thread for thread, _ in sent])
+        dispatcher.stop()
+
+    def test_parse_depth_update(self):
+        update = parse_stream_message(json.dumps({
+            'stream': 'btcusdt@depth@100ms',
+            'data': {'e': 'depthUpdate', 'E': 1700000000000, 's': 'BTCUSDT', 'U': 5, 'u': 7,
+                     'b': [['100.0', '1']], 'a': []},
+        }))
+        self.assertEqual(update, DepthUpdate('BTCUSDT', 5, 7, [['100.0', '1']], [], 1700000000000))
+        self.assertIsNone(parse_stream_message('{"result": null, "id": 1}'))
+        self.assertEqual(BookConfig.from_additional_data({'order_book': {'levels': 10}}), BookConfig(10, 1000))
+
+
+class FrameCaptureTest(TestCase):
+    frame = '{"e": "24hrTicker", "E": %d, "s": "%s", "c": "1.5", "v": "2.0"}'
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_rotates_and_reads_back(self):
+        writer = FrameWriter(self.tmp.name, prefix='shard0of2', max_segment_bytes=50, keep_segments=2)
+        for i in range(5):
+            writer.write(self.frame % (i, 'BTCUSDT'), recv_ns=i)
+        writer.close()
+
+        # Every frame fills a segment; only the newest two are kept
+        self.assertEqual(writer.segments, 5)
+        paths = find_segments(self.tmp.name)['shard0of2']
+        self.assertEqual(len(paths), 2)
+        self.assertEqual([recv_ns for recv_ns, _ in read_frames(self.tmp.name)], [3, 4])
+
+        # A frame cut short by a crash ends the segment instead of failing it
+        with open(paths[-1], 'ab') as f:
+            f.write(b'\x09\x00\x00\x00\x00\x00\x00\x00\xff\x00\x00\x00{"e"')
+        with self.assertLogs('tick_producer', 'WARNING'):
+            frames = list(FrameReader(paths[-1]))
+        self.assertEqual(frames, [(4, (self.frame % (4, 'BTCUSDT')).encode())])
+
+    def test_writes_off_the_calling_thread(self):
+        writer = FrameWriter(self.tmp.name, flush_interval=0.01, max_buffer_bytes=100)
+        io_threads = []
+        original_open = writer._open
+
+        def record_open(recv_ns):
+            io_threads.append(threading.current_thread().name)
+            original_open(recv_ns)
+
+        writer._open = record_open
+        writer.start()
+        writer.write(b'{}', recv_ns=1)
+        deadline = time.monotonic() + 2
+        while not writer.segments and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(io_threads, ['frame-capture'])
+
+        # Past max_buffer_bytes frames are dropped rather than piling up
+        writer._condition.acquire()
+        try:
+            for i in range(10):
+                writer.write(b'x' * 20, recv_ns=i)
+        finally:
+            writer._condition.release()
+        self.assertGreater(writer.dropped, 0)
+        writer.close()
+        self.assertEqual(len(list(read_frames(self.tmp.name))), writer.frames)
+
+    def test_merges_producers_by_receive_time(self):
+        for prefix, times in (('shard0of2', [10, 30, 50]), ('shard1of2', [20, 40])):
+            writer = FrameWriter(self.tmp.name, prefix=prefix)
+            for recv_ns in times:
+                writer.write(b'{}', recv_ns=recv_ns)
+            writer.close()
+
+        self.assertEqual([t for t, _ in read_frames(self.tmp.name)], [10, 20, 30, 40, 50])
+        self.assertEqual([t for t, _ in read_frames(self.tmp.name, since_ns=20, until_ns=40)], [20, 30, 40])
+
+        on_frame = Mock()
+        started = time.monotonic()
+        replay([(0, b'a'), (50_000_000, b'b'), (100_000_000, b'c')], on_frame, speed=2)
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertEqual([c.args[0] for c in on_frame.call_args_list], [b'a', b'b', b'c'])
+
+    def test_client_captures_first_copy_only(self):
+        capture = Mock()
+        client = BinanceWebSocketClient(
+            ['BTCUSDT'], Mock(), 'wss://test.binance.com:9443/ws', redundancy=2, on_frame_callback=capture
+        )
+        client._on_message(None, self.frame % (1, 'BTCUSDT'), leg=0)
+        client._on_message(None, self.frame % (1, 'BTCUSDT'), leg=1)
+        client._on_message(None, '{"result": null, "id": 1}', leg=0)
+        capture.assert_called_once_with(self.frame % (1, 'BTCUSDT'))
+
+    def test_replay_ticks_dispatches_through_pipeline(self):
+        broker = Broker.objects.create(type='BINANCE', name='Binance Test', api_config={'batch_size': 10})
+        script = Script.objects.create(broker=broker, name='Bitcoin', trading_symbol='BTCUSDT')
+        writer = FrameWriter(self.tmp.name)
+        for i in range(25):
+            writer.write(self.frame % (1700000000000 + i, 'BTCUSDT'), recv_ns=i)
+        writer.write(self.frame % (1700000000000, 'DOGEUSDT'), recv_ns=25)
+        writer.close()
+
+        out = StringIO()
+        with patch('tick_producer.pipeline.consume_tick') as consume_tick, \
+                patch('signal.signal'), self.settings(TICK_TRANSPORT='celery'):
+            call_command('replay_ticks', broker_id=broker.id, path=self.tmp.name, speed=0, stdout=out)
+
+        rows = [row for c in consume_tick.delay.call_args_list for row in c.args[0]]
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0], (script.id, '1.5', '2.0', 1700000000000))
+        self.assertIn('26 frames: 25 ticks dispatched', out.getvalue())
+        self.assertIn('1 ticks of unmapped symbols', out.getvalue())
+
+
+class PipelineMetricsTest(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+
+    def test_records_stages_and_traces_payloads(self):
+        scripts = [{'id': 1, 'trading_symbol': 'BTCUSDT', 'additional_data': {}}]
+        with self.settings(TICK_METRICS_ENABLED=True, TICK_TRACE_PAYLOADS=True), \
+                patch('tick_producer.pipeline.consume_tick') as consume_tick:
+            pipeline = TickPipeline(1, {'transport': 'celery', 'batch_size': 2}, scripts)
+            pipeline.start()
+            event_time = int(time.time() * 1000) - 1000
+            pipeline.on_tick(Tick('BTCUSDT', '1.5', '2.0', event_time))
+            pipeline.on_tick(Tick('BTCUSDT', '1.6', '2.0', event_time))
+            pipeline.stop()
+
+        payload = consume_tick.delay.call_args.args[0]
+        self.assertEqual(payload['format'], 'traced-v1')
+        self.assertEqual(payload['ticks'], [(1, '1.5', '2.0', event_time), (1, '1.6', '2.0', event_time)])
+        self.assertEqual(metrics.tick_latency('receive').count, 2)
+        self.assertGreaterEqual(metrics.tick_latency('flush').percentile(0.5), 1)
+        self.assertEqual(metrics.batch_size('flush').count, 1)
+
+        snapshot = metrics.registry.snapshot()
+        self.assertEqual(snapshot['tick_queue_enqueued_total']['series'][0]['value'], 2)
+        self.assertEqual(snapshot['tick_queue_depth']['series'][0]['value'], 0)
@@ -1,131 +1,360 @@
 import websocket
+import itertools
 import json
 import logging
-from datetime import datetime, timezone
-from typing import List, Dict, Callable
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Callable, Optional
 import time
 import threading
 
+from market_tick_system import profiling
+from tick_producer.codec import DepthUpdate, decode_json, parse_stream_message
+
 logger = logging.getLogger('tick_producer')
 
 
+# Diff depth stream, pushed every 100ms
+DEPTH_STREAM_SUFFIX = '@depth@100ms'
+
+
+def ticker_stream(symbol: str) -> str:
+    return f"{symbol.lower()}@ticker"
+
+
+def depth_stream(symbol: str) -> str:
+    return f"{symbol.lower()}{DEPTH_STREAM_SUFFIX}"
+
+
+def build_streams_url(ws_url: str, streams: List[str]) -> str:
+    """Construct the URL subscribing to ``streams`` (e.g. ``btcusdt@ticker``)"""
+    # No streams: bare wss://.../ws, streams are added with SUBSCRIBE
+    # Single stream: wss://.../ws/btcusdt@ticker
+    # Multiple streams: wss://.../stream?streams=btcusdt@ticker/ethusdt@ticker/...
+    if not streams:
+        return ws_url
+    if len(streams) == 1:
+        return f"{ws_url}/{streams[0]}"
+    base = ws_url.rsplit('/ws', 1)[0]
+    return f"{base}/stream?streams={'/'.join(streams)}"
+
+
+def build_stream_url(ws_url: str, symbols: List[str], depth_symbols: Iterable[str] = ()) -> str:
+    """Construct the URL for the ticker streams of ``symbols`` and depth streams of ``depth_symbols``"""
+    return build_streams_url(
+        ws_url, [ticker_stream(s) for s in symbols] + [depth_stream(s) for s in depth_symbols]
+    )
+
+
+def control_message(method: str, streams: Iterable[str], message_id: int) -> str:
+    """A SUBSCRIBE / UNSUBSCRIBE request for ``streams``"""
+    return json.dumps({'method': method, 'params': list(streams), 'id': message_id})
+
+
+class LegStats:
+    """Per-connection counters used in redundant mode"""
+    __slots__ = ('received', 'first', 'latency_ms')
+
+    def __init__(self):
+        self.received = 0  # frames parsed on this leg
+        self.first = 0  # frames where this leg won the race
+        self.latency_ms = None  # EWMA of local receive time minus event time
+
+
 class BinanceWebSocketClient:
     """
     Binance WebSocket client with auto-reconnect and error handling.
+
+    With ``redundancy > 1`` the client keeps that many identical connections
+    ("legs") open and emits each tick once, from whichever leg delivers it
+    first. Ticks are deduplicated on (symbol, event time) in a bounded LRU,
+    so a reconnect on one leg does not create a gap in the output. Every
+    ``STATS_INTERVAL`` seconds each leg's tick count, wins and latency are
+    logged along with the number of duplicates dropped.
+
+    ``subscribe``/``unsubscribe`` change the symbol set on the open
+    connections with Binance's live SUBSCRIBE/UNSUBSCRIBE requests, so the
+    other symbols' streams are not interrupted.
+
+    ``depth_symbols`` are additionally subscribed to their diff depth
+    stream; each ``DepthUpdate`` goes to ``on_depth_callback`` in update-id
+    order. In redundant mode a diff is passed on only if its final update
+    id (``u``) is newer than the last one passed on for the symbol, so
+    each diff arrives once whichever leg delivers it.
+
+    ``on_frame_callback`` receives every raw frame that reaches the
+    callbacks (in redundant mode, only the first copy of a tick or diff),
+    e.g. a capture ``FrameWriter``.
     """
 
-    def __init__(self, symbols: List[str], on_tick_callback: Callable, ws_url: str):
+    LATENCY_EWMA_ALPHA = 0.05
+    STATS_INTERVAL = 30.0
+
+    def __init__(self, symbols: List[str], on_tick_callback: Callable, ws_url: str,
+                 decoder: Optional[Callable] = None, redundancy: int = 1,
+                 dedup_size: int = 4096, depth_symbols: Optional[List[str]] = None,
+                 on_depth_callback: Optional[Callable] = None, on_frame_callback: Optional[Callable] = None):
         """
         Initialize WebSocket client.
 
         Args:
             symbols: List of trading symbols (e.g., ['btcusdt', 'ethusdt'])
-            on_tick_callback: Callback function to handle incoming ticks
+            on_tick_callback: Callback function receiving a ``Tick`` per update
             ws_url: Binance WebSocket URL
+            decoder: JSON ``loads`` callable (defaults to orjson when installed)
+            redundancy: Number of identical connections to keep open
+            dedup_size: Number of recent (symbol, event time) keys remembered
+            depth_symbols: Symbols whose diff depth stream is also subscribed
+            on_depth_callback: Callback function receiving a ``DepthUpdate`` per diff
+            on_frame_callback: Callback function receiving each raw frame before it is handled
         """
+        if redundancy < 1:
+            raise ValueError("redundancy must be at least 1")
+
         self.symbols = [s.lower() for s in symbols]
         self.on_tick_callback = on_tick_callback
+        self.depth_symbols = [s.lower() for s in depth_symbols or []]
+        self.on_depth_callback = on_depth_callback
+        self.on_frame_callback = on_frame_callback
         self.ws_url = ws_url
+        self.decoder = decoder or decode_json
+        self.redundancy = redundancy
+        self.dedup_size = dedup_size
         self.ws = None
         self.is_running = False
         self.reconnect_delay = 5  # seconds
         self.max_reconnect_delay = 60  # seconds
+        self.duplicates = 0
+        self.depth_duplicates = 0
+        self.leg_stats = [LegStats() for _ in range(redundancy)]
+        self._next_stats_at = time.monotonic() + self.STATS_INTERVAL
+        self._legs: List[Optional[websocket.WebSocketApp]] = [None] * redundancy
+        self._seen = OrderedDict()
+        self._seen_lock = threading.Lock()
+        self._depth_ids: Dict[str, int] = {}
+        self._depth_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._symbols_lock = threading.Lock()
+        self._message_ids = itertools.count(1)
 
-    def _get_stream_url(self) -> str:
+    def _get_stream_url(self, symbols: Optional[List[str]] = None) -> str:
         """Construct stream URL for multiple symbols using combined streams endpoint"""
-        streams = '/'.join([f"{symbol}@ticker" for symbol in self.symbols])
-        # Single symbol: wss://.../ws/btcusdt@ticker
-        # Multiple symbols: wss://.../stream?streams=btcusdt@ticker/ethusdt@ticker/...
-        if len(self.symbols) == 1:
-            return f"{self.ws_url}/{streams}"
-        base = self.ws_url.rsplit('/ws', 1)[0]
-        return f"{base}/stream?streams={streams}"
-
-    def _on_message(self, ws, message):
-        """Handle incoming WebSocket messages"""
-        try:
-            data = json.loads(message)
+        return build_stream_url(self.ws_url, self.symbols if symbols is None else symbols, self.depth_symbols)
 
-            # Combined streams wrap payload: {"stream": "btcusdt@ticker", "data": {...}}
-            if 'stream' in data and 'data' in data:
-                data = data['data']
+    def subscribe(self, symbols: Iterable[str]):
+        """Add symbols on every open connection without reconnecting"""
+        with self._symbols_lock:
+            added = [s.lower() for s in symbols if s.lower() not in self.symbols]
+            if not added:
+                return
+            self.symbols = self.symbols + added
+            self._send_control('SUBSCRIBE', map(ticker_stream, added))
+        logger.info(f"Subscribed to {len(added)} symbols: {', '.join(added)}")
 
-            # Binance ticker format
-            if 'e' in data and data['e'] == '24hrTicker':
-                tick_data = {
-                    'symbol': data['s'],  # Trading symbol
-                    'price': data['c'],    # Current price
-                    'volume': data['v'],   # Volume
-                    'timestamp': datetime.fromtimestamp(data['E'] / 1000, tz=timezone.utc)  # Event time
-                }
+    def unsubscribe(self, symbols: Iterable[str]):
+        """Drop symbols on every open connection without reconnecting"""
+        with self._symbols_lock:
+            removed = [s.lower() for s in symbols if s.lower() in self.symbols]
+            if not removed:
+                return
+            self.symbols = [s for s in self.symbols if s not in removed]
+            self._send_control('UNSUBSCRIBE', map(ticker_stream, removed))
+        logger.info(f"Unsubscribed from {len(removed)} symbols: {', '.join(removed)}")
 
-                logger.debug(f"Received tick: {tick_data['symbol']} @ {tick_data['price']}")
-                self.on_tick_callback(tick_data)
+    def unsubscribe_depth(self, symbols: Iterable[str]):
+        """Drop the diff depth streams of symbols on every open connection"""
+        with self._symbols_lock:
+            removed = [s.lower() for s in symbols if s.lower() in self.depth_symbols]
+            if not removed:
+                return
+            self.depth_symbols = [s for s in self.depth_symbols if s not in removed]
+            self._send_control('UNSUBSCRIBE', map(depth_stream, removed))
+        logger.info(f"Unsubscribed from depth streams of {len(removed)} symbols: {', '.join(removed)}")
 
-        except json.JSONDecodeError as e:
+    def _send_control(self, method: str, streams: Iterable[str], legs: Optional[Iterable] = None):
+        """
+        Send a control request on open legs. A leg that is reconnecting
+        catches up in its on_open, or uses the new streams in its next URL.
+        """
+        streams = list(streams)
+        for ws in (self._legs if legs is None else legs):
+            if ws is None or not ws.sock or not ws.sock.connected:
+                continue
+            try:
+                ws.send(control_message(method, streams, next(self._message_ids)))
+            except Exception as e:
+                logger.warning(f"Could not send {method}: {e}")
+
+    @profiling.timed('BinanceWebSocketClient._on_message')
+    def _on_message(self, ws, message, leg: int = 0):
+        """Handle incoming WebSocket messages"""
+        try:
+            tick = parse_stream_message(message, self.decoder)
+            if tick is None:
+                return
+            if type(tick) is DepthUpdate:
+                if self.redundancy > 1:
+                    # Held while the callbacks run, so legs cannot reorder diffs
+                    with self._depth_lock:
+                        if tick.final_id <= self._depth_ids.get(tick.symbol, -1):
+                            self.depth_duplicates += 1
+                            return
+                        self._depth_ids[tick.symbol] = tick.final_id
+                        self._emit_depth(tick, message)
+                else:
+                    self._emit_depth(tick, message)
+                return
+            if self.redundancy > 1 and not self._is_first_copy(tick, leg):
+                return
+            if self.on_frame_callback:
+                self.on_frame_callback(message)
+            self.on_tick_callback(tick)
+
+        except ValueError as e:
             logger.error(f"Failed to parse message: {e}")
         except Exception as e:
             logger.error(f"Error processing message: {e}", exc_info=True)
 
+    def _emit_depth(self, update: DepthUpdate, message):
+        if self.on_frame_callback:
+            self.on_frame_callback(message)
+        if self.on_depth_callback:
+            self.on_depth_callback(update)
+
+    def _is_first_copy(self, tick, leg: int) -> bool:
+        """Record a tick seen on ``leg`` and report whether it is the first copy"""
+        stats = self.leg_stats[leg]
+        stats.received += 1
+        latency = time.time() * 1000 - tick.event_time
+        if stats.latency_ms is None:
+            stats.latency_ms = latency
+        else:
+            stats.latency_ms += self.LATENCY_EWMA_ALPHA * (latency - stats.latency_ms)
+
+        key = (tick.symbol, tick.event_time)
+        with self._seen_lock:
+            now = time.monotonic()
+            report = now >= self._next_stats_at
+            if report:
+                self._next_stats_at = now + self.STATS_INTERVAL
+            first = key not in self._seen
+            if first:
+                self._seen[key] = None
+                if len(self._seen) > self.dedup_size:
+                    self._seen.popitem(last=False)
+            else:
+                self.duplicates += 1
+
+        if first:
+            stats.first += 1
+        if report:
+            self.log_leg_stats()
+        return first
+
+    def log_leg_stats(self):
+        """Log each redundant leg's tick count, wins and latency, and the duplicates dropped"""
+        legs = '; '.join(
+            f"leg {leg}: received={stats.received} first={stats.first} latency_ms="
+            f"{'-' if stats.latency_ms is None else f'{stats.latency_ms:.1f}'}"
+            for leg, stats in enumerate(self.leg_stats)
+        )
+        logger.info(
+            f"Redundant connections: {legs}; duplicates={self.duplicates} depth_duplicates={self.depth_duplicates}"
+        )
+
     def _on_error(self, ws, error):
         """Handle WebSocket errors"""
         logger.error(f"WebSocket error: {error}")
 
     def _on_close(self, ws, close_status_code, close_msg):
-        """Handle WebSocket close"""
+        """Handle WebSocket close. Reconnecting is handled by the leg loop."""
         logger.warning(f"WebSocket closed: {close_status_code} - {close_msg}")
 
-        if self.is_running:
-            logger.info(f"Reconnecting in {self.reconnect_delay} seconds...")
-            time.sleep(self.reconnect_delay)
-            self._reconnect()
-
     def _on_open(self, ws):
         """Handle WebSocket open"""
         logger.info(f"WebSocket connected - Subscribed to {len(self.symbols)} symbols: {', '.join(self.symbols)}")
-        self.reconnect_delay = 5  # Reset reconnect delay on successful connection
 
-    def _reconnect(self):
-        """Attempt to reconnect with exponential backoff"""
-        if self.is_running:
+    def _run_leg(self, leg: int):
+        """Keep one connection open, reconnecting with exponential backoff until stopped"""
+        reconnect_delay = self.reconnect_delay
+
+        def on_message(ws, message):
+            self._on_message(ws, message, leg)
+
+        while self.is_running:
+            opened = threading.Event()
+            connect_symbols = self.symbols
+            connect_depth_symbols = self.depth_symbols
+            stream_url = self._get_stream_url(connect_symbols)
+
+            def on_open(ws):
+                opened.set()
+                self._on_open(ws)
+                # Symbols changed between building the URL and the socket opening
+                with self._symbols_lock:
+                    added = [s for s in self.symbols if s not in connect_symbols]
+                    removed = [s for s in connect_symbols if s not in self.symbols]
+                    removed_depth = [s for s in connect_depth_symbols if s not in self.depth_symbols]
+                    if added:
+                        self._send_control('SUBSCRIBE', map(ticker_stream, added), [ws])
+                    if removed:
+                        self._send_control('UNSUBSCRIBE', map(ticker_stream, removed), [ws])
+                    if removed_depth:
+                        self._send_control('UNSUBSCRIBE', map(depth_stream, removed_depth), [ws])
+
+            logger.info(f"[leg {leg}] Connecting to: {stream_url}")
+
             try:
-                self.connect()
+                ws = websocket.WebSocketApp(
+                    stream_url,
+                    on_message=on_message,
+                    on_error=self._on_error,
+                    on_close=self._on_close,
+                    on_open=on_open
+                )
+                self._legs[leg] = ws
+                if leg == 0:
+                    self.ws = ws
+
+                ws.run_forever(
+                    ping_interval=30,
+                    ping_timeout=10
+                )
             except Exception as e:
-                logger.error(f"Reconnection failed: {e}")
-                # Exponential backoff
-                self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
-                time.sleep(self.reconnect_delay)
-                self._reconnect()
+                logger.error(f"[leg {leg}] Connection failed: {e}", exc_info=True)
 
-    def connect(self):
-        """Establish WebSocket connection"""
-        try:
-            stream_url = self._get_stream_url()
-            logger.info(f"Connecting to: {stream_url}")
+            if opened.is_set():
+                # Reset reconnect delay after a successful connection
+                reconnect_delay = self.reconnect_delay
+            elif self.is_running:
+                reconnect_delay = min(reconnect_delay * 2, self.max_reconnect_delay)
 
-            self.ws = websocket.WebSocketApp(
-                stream_url,
-                on_message=self._on_message,
-                on_error=self._on_error,
-                on_close=self._on_close,
-                on_open=self._on_open
-            )
+            if self.is_running:
+                logger.info(f"[leg {leg}] Reconnecting in {reconnect_delay} seconds...")
+                self._stop_event.wait(reconnect_delay)
 
-            self.is_running = True
+    def connect(self):
+        """Establish WebSocket connection(s) and block until disconnect() is called"""
+        self.is_running = True
+        self._stop_event.clear()
 
-            # Run forever with automatic reconnection
-            self.ws.run_forever(
-                ping_interval=30,
-                ping_timeout=10
-            )
+        threads = [
+            threading.Thread(target=self._run_leg, args=(leg,), name=f'binance-leg-{leg}', daemon=True)
+            for leg in range(1, self.redundancy)
+        ]
+        for thread in threads:
+            thread.start()
 
-        except Exception as e:
-            logger.error(f"Connection failed: {e}", exc_info=True)
-            raise
+        try:
+            self._run_leg(0)
+        finally:
+            for thread in threads:
+                thread.join(timeout=5)
 
     def disconnect(self):
         """Close WebSocket connection"""
         logger.info("Disconnecting WebSocket...")
         self.is_running = False
-        if self.ws:
-            self.ws.close()
+        self._stop_event.set()
+        for ws in self._legs:
+            if ws:
+                ws.close()